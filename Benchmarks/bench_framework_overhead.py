@@ -0,0 +1,286 @@
+# bench_framework_overhead.py
+# Runs syllabus generation and teaching turns offline against a simulated model and
+# reports how much of each stage is EduGPT's own time rather than the model's.
+#
+# --prompt-growth instead follows one long lesson and reports prompt size and latency
+# per turn; --budget and --max-growth make it exit 1 when prompts grow past a limit.
+
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import os
+import statistics
+import sys
+import time
+
+# Only the simulated model is called, so neither a real key nor the free-tier pacing applies
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("GEMINI_RPM", "1000000")
+os.environ.setdefault("GEMINI_TPM", "1000000000")
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+from fake_llm import add_model_arguments, model_from_args
+from generating_syllabus import generate_syllabus
+from teaching_agent import TeachingGPT
+from token_ledger import token_ledger
+from tracing import SpanCollector, percentile, tracer
+
+COURSES = [
+    "Intro to Machine Learning",
+    "Deep Learning Fundamentals",
+    "Data Science with Python",
+]
+
+STUDENT_MESSAGES = [
+    "I am ready, let's start.",
+    "Can you give me another example?",
+    "What is the formula for that?",
+    "I think I understand, please continue.",
+    "How does this connect to the previous topic?",
+]
+
+OUTPUT_FILE = "results/framework_overhead.csv"
+SPANS_FILE = "results/framework_overhead_spans.csv"
+GROWTH_FILE = "results/prompt_growth.csv"
+GROWTH_PLOT = "results/prompt_growth.png"
+
+# Ledger stages followed turn by turn in --prompt-growth
+GROWTH_STAGES = {
+    "syllabus.discussion_turn": "syllabus discussion",
+    "teaching.instructor_turn": "teaching",
+}
+
+
+def run_syllabus(llm, course, run, samples):
+    """Generate one syllabus, timing each stage between its progress reports"""
+    marks = []
+    task = f"Generate a syllabus for {course}"
+    syllabus = generate_syllabus(
+        course, task, progress_callback=lambda progress, stage: marks.append((time.perf_counter(), stage)), llm=llm
+    )
+    for (start, stage), (end, _) in zip(marks, marks[1:]):
+        samples.append(sample(llm, run, course, "syllabus", stage, start, end))
+    return syllabus, task
+
+
+async def run_teaching(llm, course, run, syllabus, task, turns, mcp, samples):
+    """Seed a teaching agent with the syllabus and play student/instructor turns"""
+    agent = TeachingGPT.from_llm(
+        llm, verbose=False, mcp_tools_enabled=mcp, conversation_history=[], syllabus="", conversation_topic=""
+    )
+    agent.seed_agent(syllabus, task)
+    for turn in range(1, turns + 1):
+        start = time.perf_counter()
+        agent.human_step(STUDENT_MESSAGES[(turn - 1) % len(STUDENT_MESSAGES)])
+        await agent._callinstructor({})
+        samples.append(sample(llm, run, course, "teaching", f"Instructor turn {turn}", start, time.perf_counter()))
+
+
+def sample(llm, run, course, pipeline, stage, start, end):
+    wall = end - start
+    model = llm.model_seconds_between(start, end)
+    calls = sum(1 for call in llm.calls if start <= call["start"] < end)
+    return {
+        "run": run,
+        "course": course,
+        "pipeline": pipeline,
+        "stage": stage,
+        "calls": calls,
+        "wall_s": wall,
+        "model_s": model,
+        "overhead_s": max(0.0, wall - model),
+    }
+
+
+def report(samples):
+    stages = {}
+    for row in samples:
+        stages.setdefault((row["pipeline"], row["stage"]), []).append(row)
+
+    print("=" * 102)
+    print(f"{'Stage':<58}{'n':>4}{'wall ms':>10}{'model ms':>10}{'ovh p50':>10}{'ovh p95':>10}")
+    for (pipeline, stage), rows in stages.items():
+        overhead = [row["overhead_s"] * 1000 for row in rows]
+        print(
+            f"{pipeline + ': ' + stage:<58}{len(rows):>4}"
+            f"{statistics.mean(row['wall_s'] for row in rows) * 1000:>10.1f}"
+            f"{statistics.mean(row['model_s'] for row in rows) * 1000:>10.1f}"
+            f"{percentile(overhead, 0.5):>10.1f}{percentile(overhead, 0.95):>10.1f}"
+        )
+
+    print("=" * 102)
+    for pipeline in sorted({row["pipeline"] for row in samples}):
+        rows = [row for row in samples if row["pipeline"] == pipeline]
+        wall = sum(row["wall_s"] for row in rows)
+        overhead = sum(row["overhead_s"] for row in rows)
+        share = overhead / wall * 100 if wall else 0.0
+        print(f"⚙️  {pipeline}: {overhead * 1000:.1f} ms of {wall * 1000:.1f} ms spent in EduGPT ({share:.1f}%)")
+
+
+def save(samples, spans):
+    os.makedirs("results", exist_ok=True)
+    with open(OUTPUT_FILE, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(samples[0]))
+        writer.writeheader()
+        writer.writerows(samples)
+    spans.write_csv(SPANS_FILE)
+    print(f"📊 Per-stage samples saved in {OUTPUT_FILE}, span summary in {SPANS_FILE}")
+
+
+def run_prompt_growth(llm, course, turns, mcp):
+    """One syllabus and one long lesson, with every LLM call read back from the token ledger"""
+    session = f"prompt-growth-{time.time_ns()}"
+    with token_ledger.attribute(session=session):
+        task = f"Generate a syllabus for {course}"
+        syllabus = generate_syllabus(course, task, llm=llm)
+        # The turns' own timing samples are not needed here, only their ledger entries
+        asyncio.run(run_teaching(llm, course, 1, syllabus, task, turns, mcp, []))
+
+    rows = []
+    for stage, pipeline in GROWTH_STAGES.items():
+        cumulative = 0
+        for turn, totals in sorted(token_ledger.totals(group_by="turn", session=session, stage=stage).items()):
+            cumulative += totals["input_tokens"]
+            rows.append({
+                "pipeline": pipeline,
+                "turn": turn,
+                "calls": totals["calls"],
+                "input_tokens": totals["input_tokens"],
+                "output_tokens": totals["output_tokens"],
+                "latency_s": round(totals["seconds"], 4),
+                "cumulative_input_tokens": cumulative,
+            })
+    return rows
+
+
+def growth_per_turn(rows):
+    """Least-squares slope of prompt tokens against turn number"""
+    if len(rows) < 2:
+        return 0.0
+    return statistics.linear_regression([row["turn"] for row in rows], [row["input_tokens"] for row in rows]).slope
+
+
+def report_growth(rows):
+    print("=" * 88)
+    print(f"{'Pipeline':<22}{'turn':>6}{'calls':>7}{'in tok':>10}{'out tok':>10}{'latency s':>12}{'cum in tok':>14}")
+    for row in rows:
+        print(
+            f"{row['pipeline']:<22}{row['turn']:>6}{row['calls']:>7}{row['input_tokens']:>10}{row['output_tokens']:>10}"
+            f"{row['latency_s']:>12.3f}{row['cumulative_input_tokens']:>14}"
+        )
+    print("=" * 88)
+    for pipeline in GROWTH_STAGES.values():
+        series = [row for row in rows if row["pipeline"] == pipeline]
+        if series:
+            print(
+                f"📈 {pipeline}: prompt grows by {growth_per_turn(series):.0f} tokens per turn, "
+                f"{series[0]['input_tokens']} -> {series[-1]['input_tokens']} over {len(series)} turns"
+            )
+
+
+def plot_growth(rows):
+    if plt is None:
+        print("ℹ️  matplotlib is not installed; skipping the prompt growth plot")
+        return
+    figure, (tokens_axis, latency_axis) = plt.subplots(2, 1, sharex=True, figsize=(8, 7))
+    for pipeline in GROWTH_STAGES.values():
+        series = [row for row in rows if row["pipeline"] == pipeline]
+        turns = [row["turn"] for row in series]
+        tokens_axis.plot(turns, [row["input_tokens"] for row in series], marker="o", label=pipeline)
+        latency_axis.plot(turns, [row["latency_s"] for row in series], marker="o", label=pipeline)
+    tokens_axis.set_ylabel("Prompt tokens")
+    tokens_axis.set_title("Prompt size and latency by turn")
+    tokens_axis.legend()
+    latency_axis.set_ylabel("Model seconds")
+    latency_axis.set_xlabel("Turn")
+    figure.tight_layout()
+    figure.savefig(GROWTH_PLOT)
+    plt.close(figure)
+    print(f"📊 Plot saved in {GROWTH_PLOT}")
+
+
+def save_growth(rows):
+    os.makedirs("results", exist_ok=True)
+    with open(GROWTH_FILE, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"📊 Per-turn token counts saved in {GROWTH_FILE}")
+
+
+def check_growth(rows, budget, max_growth):
+    """Messages for each limit the teaching turns break; empty when within limits"""
+    teaching = [row for row in rows if row["pipeline"] == "teaching"]
+    failures = []
+    largest = max((row["input_tokens"] for row in teaching), default=0)
+    if budget and largest > budget:
+        failures.append(f"largest teaching prompt is {largest} tokens, over the budget of {budget}")
+    growth = growth_per_turn(teaching)
+    if max_growth and growth > max_growth:
+        failures.append(f"teaching prompts grow by {growth:.0f} tokens per turn, over the limit of {max_growth}")
+    return failures
+
+
+def prompt_growth(args, llm):
+    course = (args.course or COURSES)[0]
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        rows = run_prompt_growth(llm, course, args.turns, args.mcp)
+    if not rows:
+        print("❌ The token ledger recorded no calls", file=sys.stderr)
+        return 1
+    report_growth(rows)
+    save_growth(rows)
+    plot_growth(rows)
+    failures = check_growth(rows, args.budget, args.max_growth)
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline EduGPT framework overhead benchmark")
+    parser.add_argument("--course", action="append", help="Course to run (repeatable); defaults to a built-in list")
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions per course")
+    parser.add_argument("--turns", type=int, help="Teaching turns after each syllabus (default 5, 30 with --prompt-growth)")
+    parser.add_argument("--mcp", action="store_true", help="Keep MCP tools enabled in the teaching agent")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' own output")
+    parser.add_argument("--prompt-growth", action="store_true", help="Report prompt size and latency per turn instead")
+    parser.add_argument("--budget", type=int, help="With --prompt-growth, fail if a teaching prompt exceeds this many tokens")
+    parser.add_argument("--max-growth", type=float, help="With --prompt-growth, fail if teaching prompts grow faster per turn")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    llm = model_from_args(args)
+    if args.prompt_growth:
+        args.turns = args.turns or 30
+        sys.exit(prompt_growth(args, llm))
+    args.turns = args.turns or 5
+    spans = SpanCollector()
+    tracer.add_exporter(spans)
+    samples = []
+    for run in range(1, args.runs + 1):
+        for course in args.course or COURSES:
+            # The agents print every message; keep that off the terminal but still pay for it
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with output:
+                syllabus, task = run_syllabus(llm, course, run, samples)
+                asyncio.run(run_teaching(llm, course, run, syllabus, task, args.turns, args.mcp, samples))
+            print(f"✅ Run {run}: {course}", file=sys.stderr)
+
+    report(samples)
+    print("=" * 102)
+    print(spans.render())
+    save(samples, spans)
+
+
+if __name__ == "__main__":
+    main()
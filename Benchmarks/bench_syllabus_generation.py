@@ -1,6 +1,8 @@
 # bench_syllabus.py
 
 from generating_syllabus import generate_syllabus
+from llm_quota import rate_limit_delay
+from tracing import SpanCollector, tracer
 import time, random, os, argparse, csv
 
 # Default list of courses
@@ -12,16 +14,18 @@ COURSES = [
     "Natural Language Processing"
 ]
 
-# Retry wrapper with exponential backoff
-def safe_generate(course, task, retries=5):
-    for attempt in range(retries):
+# Retry transient failures (5xx, dropped connections) with exponential backoff;
+# 429s were already waited out and retried by llm_scheduler, so they are not retried again
+def safe_generate(course, task, retries=3):
+    for attempt in range(retries + 1):
         try:
             return generate_syllabus(course, task)
         except Exception as e:
-            wait = (2 ** attempt) + random.uniform(0, 3)
+            if rate_limit_delay(e) is not None or attempt == retries:
+                raise
+            wait = (2 ** attempt) + random.uniform(0, 1)
             print(f"⚠️ Error generating '{course}': {e} → retrying in {wait:.1f}s...")
             time.sleep(wait)
-    raise RuntimeError(f"❌ All retries failed for {course}")
 
 # Save syllabus to file
 def save_syllabus(course, syllabus):
@@ -34,6 +38,11 @@ def save_syllabus(course, syllabus):
 def run_benchmark(courses):
     os.makedirs("results", exist_ok=True)
     summary_file = "results/benchmark_summary.csv"
+    stage_file = "results/benchmark_stage_latency.csv"
+
+    # Collect the per-stage spans of every run, for p50/p95 per stage
+    spans = SpanCollector()
+    tracer.add_exporter(spans)
 
     # Create CSV header if file doesn’t exist
     if not os.path.exists(summary_file):
@@ -44,6 +53,7 @@ def run_benchmark(courses):
     for course in courses:
         task = f"Generate a detailed syllabus for the course: {course}"
         
+        # Pacing and 429 retries are left to llm_scheduler (GEMINI_RPM / GEMINI_TPM)
         start = time.time()
         syllabus = safe_generate(course, task)
         end = time.time()
@@ -61,11 +71,13 @@ def run_benchmark(courses):
         print(f"⏱️ Generation time: {duration:.2f} seconds")
         print(f"💾 Saved syllabus → {file_path}")
         print(f"📄 Preview:\n{syllabus[:500]}...\n")  # print only first 500 chars
-
-        time.sleep(65)  # cooldown between requests
     
     print("="*60)
-    print(f"✅ Benchmark completed successfully!\n📊 Summary saved in {summary_file}")
+    print(spans.render())
+    spans.write_csv(stage_file)
+    tracer.remove_exporter(spans)
+    print("="*60)
+    print(f"✅ Benchmark completed successfully!\n📊 Summary saved in {summary_file}, stage latencies in {stage_file}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
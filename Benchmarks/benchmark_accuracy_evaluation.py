@@ -32,10 +32,6 @@ def run_benchmark():
         results.append([course, round(duration, 2), accuracy, result_file])
         print(f"✅ {course} done in {duration:.2f}s with simulated accuracy {accuracy}%")
 
-        # 💤 Wait to avoid hitting Gemini API rate limits
-        print("⏳ Waiting 60 seconds before next course...")
-        time.sleep(60)
-
     write_mode = "a" if os.path.exists(CSV_PATH) else "w"
     with open(CSV_PATH, write_mode, newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
@@ -35,8 +35,6 @@ def run_test2():
         print(f"⏱️ AI Generation Time: {duration:.2f} seconds")
         print(f"📉 Time Reduction vs. Manual (~300s): {reduction:.1f}%")
 
-        time.sleep(65)
-
     # Save CSV
     os.makedirs("results", exist_ok=True)
     with open(OUTPUT_FILE, "w", newline="") as f:
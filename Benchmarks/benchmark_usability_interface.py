@@ -53,7 +53,6 @@ def run_test4():
 
         results.append([course, duration, usability, interface_speed, result_file])
         print(f"✅ {course} | Time: {duration}s | Usability: {usability}% | Interface Speed: {interface_speed}s/100chars")
-        time.sleep(65)  
     # Save all results
     write_mode = "a" if os.path.exists(CSV_PATH) else "w"
     with open(CSV_PATH, write_mode, newline="", encoding="utf-8") as f:
@@ -0,0 +1,185 @@
+# fake_llm.py
+# A stand-in for Gemini that answers offline after a simulated delay, so benchmarks
+# can separate EduGPT's own time from the model's.
+
+import asyncio
+import itertools
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+WORDS = (
+    "learners explore the core concepts through worked examples and short exercises "
+    "each module builds on the previous one with definitions formulas and practice "
+    "students review key terms apply them to a small project and discuss the results"
+).split()
+
+# Tokens per streamed chunk, about what Gemini sends
+STREAM_CHUNK_TOKENS = 8
+
+
+class LatencyModelLLM(BaseChatModel):
+    """Chat model that sleeps like a remote LLM would, then answers with filler text.
+
+    Time to first token and reply length are drawn from a distribution around
+    their means, and reading the prompt adds its length over prefill_tokens_per_second,
+    so longer prompts answer later; the rest of the reply arrives at tokens_per_second. Every call
+    is recorded in ``calls`` so a benchmark can subtract the simulated model time.
+    """
+
+    first_token_seconds: float = 0.4
+    tokens_per_second: float = 200.0
+    prefill_tokens_per_second: float = 5000.0
+    output_tokens: int = 200
+    # Spread of the samples: +/- fraction for uniform, sigma for lognormal
+    jitter: float = 0.3
+    distribution: str = "lognormal"
+    seed: Optional[int] = None
+
+    _random: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _words: Any = PrivateAttr(default_factory=lambda: itertools.cycle(WORDS))
+    _calls: List[Dict[str, float]] = PrivateAttr(default_factory=list)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.distribution not in DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {DISTRIBUTIONS}")
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "latency-model-fake"
+
+    @property
+    def calls(self) -> List[Dict[str, float]]:
+        """One entry per call: start (perf_counter), model_seconds, input_tokens, output_tokens"""
+        return self._calls
+
+    def reset(self):
+        self._calls.clear()
+
+    def model_seconds_between(self, start: float, end: float) -> float:
+        """Simulated model time of the calls that started in [start, end)"""
+        return sum(call["model_seconds"] for call in list(self._calls) if start <= call["start"] < end)
+
+    def _sample(self, mean: float) -> float:
+        with self._lock:
+            if self.distribution == "uniform":
+                return mean * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+            if self.distribution == "lognormal":
+                return mean * math.exp(self._random.gauss(0.0, self.jitter))
+            return mean
+
+    def _plan(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        """Decide the reply and how long each part of it takes"""
+        prompt = "".join(str(message.content) for message in messages)
+        output_tokens = max(1, round(self._sample(self.output_tokens)))
+        with self._lock:
+            text = " ".join(next(self._words) for _ in range(output_tokens))
+        # Keep the markers the EduGPT prompts ask for, so the agents behave as with a real model
+        if "<END_OF_TURN>" in prompt:
+            text += "<END_OF_TURN>"
+        elif "Solution: <YOUR_SOLUTION>" in prompt:
+            text = f"Solution: {text} Next request."
+        elif "Instruction: <YOUR_INSTRUCTION>" in prompt:
+            text = f"Instruction: {text}\nInput: None"
+        input_tokens = len(prompt) // 4 + 1
+        first_token = self._sample(self.first_token_seconds) if self.first_token_seconds else 0.0
+        if self.prefill_tokens_per_second:
+            first_token += input_tokens / self.prefill_tokens_per_second
+        return {
+            "text": text,
+            "first_token": first_token,
+            "per_token": 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+        }
+
+    def _record(self, plan: Dict[str, Any], start: float) -> Dict[str, int]:
+        self._calls.append({
+            "start": start,
+            "model_seconds": plan["first_token"] + plan["per_token"] * plan["output_tokens"],
+            "input_tokens": plan["input_tokens"],
+            "output_tokens": plan["output_tokens"],
+        })
+        return {
+            "input_tokens": plan["input_tokens"],
+            "output_tokens": plan["output_tokens"],
+            "total_tokens": plan["input_tokens"] + plan["output_tokens"],
+        }
+
+    def _result(self, plan: Dict[str, Any], start: float) -> ChatResult:
+        message = AIMessage(content=plan["text"], usage_metadata=self._record(plan, start))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, plan: Dict[str, Any]):
+        words = plan["text"].split(" ")
+        for index in range(0, len(words), STREAM_CHUNK_TOKENS):
+            piece = " ".join(words[index:index + STREAM_CHUNK_TOKENS])
+            yield (" " if index else "") + piece, len(words[index:index + STREAM_CHUNK_TOKENS])
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        start = time.perf_counter()
+        plan = self._plan(messages)
+        time.sleep(plan["first_token"] + plan["per_token"] * plan["output_tokens"])
+        return self._result(plan, start)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        start = time.perf_counter()
+        plan = self._plan(messages)
+        await asyncio.sleep(plan["first_token"] + plan["per_token"] * plan["output_tokens"])
+        return self._result(plan, start)
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        plan = self._plan(messages)
+        time.sleep(plan["first_token"])
+        for piece, tokens in self._chunks(plan):
+            time.sleep(plan["per_token"] * tokens)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._record(plan, start)))
+
+    async def _astream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        plan = self._plan(messages)
+        await asyncio.sleep(plan["first_token"])
+        for piece, tokens in self._chunks(plan):
+            await asyncio.sleep(plan["per_token"] * tokens)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._record(plan, start)))
+
+
+def add_model_arguments(parser):
+    """Command line options describing the simulated model, shared by the offline benchmarks"""
+    group = parser.add_argument_group("simulated model")
+    group.add_argument("--first-token", type=float, default=0.4, help="Mean seconds to the first token")
+    group.add_argument("--tokens-per-second", type=float, default=200.0, help="Output speed after the first token")
+    group.add_argument("--prefill-tokens-per-second", type=float, default=5000.0, help="Prompt reading speed")
+    group.add_argument("--output-tokens", type=int, default=200, help="Mean reply length in tokens")
+    group.add_argument("--jitter", type=float, default=0.3, help="Spread of latency and length samples")
+    group.add_argument("--distribution", choices=DISTRIBUTIONS, default="lognormal")
+    group.add_argument("--instant", action="store_true", help="No simulated latency; measures pure overhead")
+    group.add_argument("--seed", type=int, default=0)
+    return group
+
+
+def model_from_args(args) -> LatencyModelLLM:
+    return LatencyModelLLM(
+        first_token_seconds=0.0 if args.instant else args.first_token,
+        tokens_per_second=0.0 if args.instant else args.tokens_per_second,
+        prefill_tokens_per_second=0.0 if args.instant else args.prefill_tokens_per_second,
+        output_tokens=args.output_tokens,
+        jitter=args.jitter,
+        distribution=args.distribution,
+        seed=args.seed,
+    )
@@ -0,0 +1,328 @@
+# load_test_sessions.py
+# Simulates many students chatting at once and reports how throughput, queueing delay
+# and tail latency change as concurrency rises, to size the number of workers.
+#
+#   python load_test_sessions.py --target inprocess --concurrency 1,8,32,128
+#   python load_test_sessions.py --serve 8000            # API with the simulated model
+#   python load_test_sessions.py --target http --url http://localhost:8000 --concurrency 8,32
+#   python load_test_sessions.py --target gradio --url http://localhost:7860 --concurrency 4
+
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+# Only the simulated model is called; set GEMINI_RPM yourself to replay a real quota
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("GEMINI_RPM", "1000000")
+os.environ.setdefault("GEMINI_TPM", "1000000000")
+
+import httpx
+
+from fake_llm import add_model_arguments, model_from_args
+from tracing import SpanCollector, percentile, tracer
+
+TOPIC = "Intro to Machine Learning"
+
+SYLLABUS = """Course: Intro to Machine Learning
+Week 1: What learning from data means; supervised and unsupervised learning
+Week 2: Linear regression, loss functions and gradient descent
+Week 3: Classification with logistic regression; evaluation metrics
+Week 4: Decision trees, overfitting and regularisation
+Week 5: Model selection with cross-validation; a small end-to-end project"""
+
+STUDENT_MESSAGES = [
+    "I am ready, let's start.",
+    "Can you give me another example?",
+    "What is the formula for that?",
+    "I think I understand, please continue.",
+    "How does this connect to the previous topic?",
+]
+
+OUTPUT_FILE = "results/load_test_sessions.csv"
+
+
+class InProcessTarget:
+    """Drives TeachingGPT objects directly, one per session, on this process's event loop"""
+
+    name = "inprocess"
+
+    def __init__(self, llm, mcp: bool = False):
+        from teaching_agent import TeachingGPT
+        self.agent_class = TeachingGPT
+        self.llm = llm
+        self.mcp = mcp
+        self.spans = SpanCollector()
+
+    async def setup(self):
+        # Queueing is read from the scheduler's waits on each turn's llm.call span
+        tracer.add_exporter(self.spans)
+
+    async def open(self):
+        agent = self.agent_class.from_llm(
+            self.llm, verbose=False, mcp_tools_enabled=self.mcp, conversation_history=[], syllabus="", conversation_topic=""
+        )
+        agent.seed_agent(SYLLABUS, TOPIC)
+        return agent
+
+    async def turn(self, agent, message):
+        with tracer.span("loadtest.turn") as span:
+            agent.human_step(message)
+            await agent._callinstructor({})
+        waited = sum(
+            s["attributes"].get("wait_seconds", 0.0)
+            for s in list(self.spans.spans) if s["trace_id"] == span.trace_id and s["name"] == "llm.call"
+        )
+        return waited, "ok"
+
+    async def close(self):
+        tracer.remove_exporter(self.spans)
+
+
+class HTTPTarget:
+    """Talks to the edu_api service, streaming each reply so admission delay can be told apart"""
+
+    name = "http"
+
+    def __init__(self, url: str, transport=None, timeout: float = 300.0):
+        self.client = httpx.AsyncClient(base_url=url, transport=transport, timeout=timeout)
+        self.subject_id = None
+
+    async def setup(self):
+        # One syllabus, generated (or found in the cache) up front and shared by every session
+        response = await self.client.post("/api/syllabus", json={"topic": TOPIC})
+        response.raise_for_status()
+        job = response.json()
+        while job["status"] not in ("done", "failed", "cancelled"):
+            await asyncio.sleep(0.5)
+            job = (await self.client.get(f"/api/syllabus/{job['id']}")).json()
+        if job["status"] != "done":
+            raise RuntimeError(f"Seeding the syllabus failed: {job.get('error') or job['status']}")
+        self.subject_id = job["id"]
+
+    async def open(self):
+        return {"session_id": None}
+
+    async def turn(self, session, message):
+        body = {"message": message, "stream": True}
+        if session["session_id"]:
+            body["session_id"] = session["session_id"]
+        else:
+            body["subject_id"] = self.subject_id
+
+        sent = time.perf_counter()
+        queued = None
+        async with self.client.stream("POST", "/api/chat", json=body) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return None, str(response.status_code)
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: ") and event == "start":
+                    # The server only starts the stream once the request holds a slot, and says how long that took
+                    start = json.loads(line[len("data: "):])
+                    session["session_id"] = start["session_id"]
+                    queued = start.get("queued_seconds", time.perf_counter() - sent)
+        return queued, "ok"
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class ASGITarget(HTTPTarget):
+    """The edu_api app in this process with the simulated model, minus the network"""
+
+    name = "asgi"
+
+    def __init__(self, llm):
+        import edu_api
+        self.app = edu_api.create_app(llm=llm)
+        self._lifespan = None
+        super().__init__("http://edugpt", transport=httpx.ASGITransport(app=self.app))
+
+    async def setup(self):
+        self._lifespan = self.app.router.lifespan_context(self.app)
+        await self._lifespan.__aenter__()
+        await super().setup()
+
+    async def close(self):
+        await super().close()
+        await self._lifespan.__aexit__(None, None, None)
+
+
+class GradioTarget:
+    """Sends messages through a running Gradio app (scripts/run.py) with gradio_client.
+
+    run.py keeps one teaching agent for every browser, so this measures how the
+    Gradio queue and event loop cope with load rather than separate lessons.
+    """
+
+    name = "gradio"
+
+    def __init__(self, url: str):
+        from gradio_client import Client
+        self.client_class = Client
+        self.url = url
+
+    async def setup(self):
+        pass
+
+    async def open(self):
+        # A client per session, so each one gets its own Gradio session hash
+        client = await asyncio.to_thread(self.client_class, self.url, verbose=False)
+        return {"client": client, "history": []}
+
+    async def turn(self, session, message):
+        def chat():
+            _, history = session["client"].predict(message, session["history"], api_name="/user")
+            return session["client"].predict(history, api_name="/bot")
+        session["history"] = await asyncio.to_thread(chat)
+        return None, "ok"
+
+    async def close(self):
+        pass
+
+
+async def run_session(target, turns, think_seconds, rng, results):
+    # Stagger the first message so sessions do not all arrive in the same instant
+    await asyncio.sleep(rng.uniform(0, think_seconds))
+    try:
+        session = await target.open()
+    except Exception as e:
+        results.append({"latency": None, "queued": None, "status": f"open failed: {type(e).__name__}"})
+        return
+    for turn in range(turns):
+        if turn:
+            await asyncio.sleep(rng.expovariate(1 / think_seconds) if think_seconds else 0)
+        started = time.perf_counter()
+        try:
+            queued, status = await target.turn(session, STUDENT_MESSAGES[turn % len(STUDENT_MESSAGES)])
+        except Exception as e:
+            queued, status = None, type(e).__name__
+        results.append({"latency": time.perf_counter() - started, "queued": queued, "status": status})
+
+
+async def run_level(target, sessions, turns, think_seconds, seed):
+    rng = random.Random(seed)
+    results = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_session(target, turns, think_seconds, random.Random(rng.random()), results) for _ in range(sessions)
+    ))
+    elapsed = time.perf_counter() - started
+
+    ok = [row for row in results if row["status"] == "ok"]
+    latencies = [row["latency"] for row in ok]
+    queued = [row["queued"] for row in ok if row["queued"] is not None]
+    errors = {}
+    for row in results:
+        if row["status"] != "ok":
+            errors[row["status"]] = errors.get(row["status"], 0) + 1
+    return {
+        "target": target.name,
+        "sessions": sessions,
+        "turns_ok": len(ok),
+        "errors": ";".join(f"{status}={count}" for status, count in sorted(errors.items())),
+        "elapsed_s": round(elapsed, 2),
+        "turns_per_s": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_s": round(percentile(latencies, 0.50), 3),
+        "latency_p95_s": round(percentile(latencies, 0.95), 3),
+        "latency_p99_s": round(percentile(latencies, 0.99), 3),
+        "latency_mean_s": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        "queued_p50_s": round(percentile(queued, 0.50), 3) if queued else None,
+        "queued_p95_s": round(percentile(queued, 0.95), 3) if queued else None,
+    }
+
+
+def print_row(row):
+    queued = "n/a" if row["queued_p50_s"] is None else f"{row['queued_p50_s']:.3f}/{row['queued_p95_s']:.3f}"
+    print(
+        f"{row['sessions']:>8}{row['turns_ok']:>8}{row['turns_per_s']:>10.2f}"
+        f"{row['latency_p50_s']:>9.3f}{row['latency_p95_s']:>9.3f}{row['latency_p99_s']:>9.3f}"
+        f"{queued:>16}  {row['errors'] or '-'}"
+    )
+
+
+async def run_load(args, llm):
+    if args.target == "inprocess":
+        target = InProcessTarget(llm, mcp=args.mcp)
+    elif args.target == "asgi":
+        target = ASGITarget(llm)
+    elif args.target == "http":
+        target = HTTPTarget(args.url)
+    else:
+        target = GradioTarget(args.url)
+
+    rows = []
+    # The agents print every message; keep that off the terminal but still pay for it
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        await target.setup()
+    print(f"{'sessions':>8}{'turns':>8}{'turns/s':>10}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'queued p50/p95':>16}  errors")
+    try:
+        for level in args.concurrency:
+            with output:
+                row = await run_level(target, level, args.turns, args.think, args.seed)
+            print_row(row)
+            rows.append(row)
+    finally:
+        with output:
+            await target.close()
+    return rows
+
+
+def save(rows):
+    os.makedirs("results", exist_ok=True)
+    with open(OUTPUT_FILE, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"📊 Results saved in {OUTPUT_FILE}")
+
+
+def serve(args, llm):
+    """Run edu_api with the simulated model, for --target http from other machines or processes"""
+    import uvicorn
+    import edu_api
+    uvicorn.run(edu_api.create_app(llm=llm), host=args.host, port=args.serve, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the EduGPT chat path")
+    parser.add_argument("--target", choices=("inprocess", "asgi", "http", "gradio"), default="inprocess")
+    parser.add_argument("--url", help="Base URL for --target http or gradio")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated session counts to run in turn")
+    parser.add_argument("--turns", type=int, default=5, help="Messages each session sends")
+    parser.add_argument("--think", type=float, default=2.0, help="Mean seconds a student takes between messages")
+    parser.add_argument("--mcp", action="store_true", help="Keep MCP tools enabled for --target inprocess")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Serve the API with the simulated model instead")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface for --serve")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' own output")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+
+    llm = model_from_args(args)
+    if args.serve:
+        serve(args, llm)
+        return
+    if args.target in ("http", "gradio") and not args.url:
+        parser.error(f"--target {args.target} needs --url")
+
+    rows = asyncio.run(run_load(args, llm))
+    if rows:
+        save(rows)
+    print(f"✅ Load test against {args.target} finished", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
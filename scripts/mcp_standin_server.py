@@ -0,0 +1,170 @@
+"""Small MCP server reachable over HTTP and WebSocket, for trying the network transports locally.
+
+    python scripts/mcp_standin_server.py --http-port 8765 --ws-port 8766
+
+and point a server entry in mcp_config.yaml at it:
+
+    - id: standin
+      name: Stand-in Server
+      transport: http            # or websocket with url ws://127.0.0.1:8766
+      url: http://127.0.0.1:8765/mcp
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import websockets
+
+TOOLS = [
+    {
+        "name": "echo",
+        "description": "Return the given text",
+        "inputSchema": {"type": "object", "properties": {"text": {"type": "string"}}, "required": ["text"]},
+    },
+    {
+        "name": "add",
+        "description": "Add two numbers",
+        "inputSchema": {
+            "type": "object",
+            "properties": {"a": {"type": "number"}, "b": {"type": "number"}},
+            "required": ["a", "b"],
+        },
+    },
+    {
+        "name": "sleep",
+        "description": "Wait the given number of seconds, for trying timeouts",
+        "inputSchema": {"type": "object", "properties": {"seconds": {"type": "number"}}},
+    },
+]
+
+
+def text_result(text: str) -> dict:
+    return {"content": [{"type": "text", "text": text}], "isError": False}
+
+
+def call_tool(name: str, arguments: dict) -> dict:
+    if name == "echo":
+        return text_result(str(arguments.get("text", "")))
+    if name == "add":
+        return text_result(str(arguments.get("a", 0) + arguments.get("b", 0)))
+    if name == "sleep":
+        time.sleep(float(arguments.get("seconds", 1)))
+        return text_result("done")
+    raise KeyError(name)
+
+
+def handle(message: dict):
+    """Answer one JSON-RPC message, or return None for notifications"""
+    if not isinstance(message, dict) or "id" not in message:
+        return None
+    method = message.get("method")
+    params = message.get("params") or {}
+    try:
+        if method == "initialize":
+            result = {
+                "protocolVersion": params.get("protocolVersion", "2024-11-05"),
+                "capabilities": {"tools": {"listChanged": False}},
+                "serverInfo": {"name": "edugpt-standin", "version": "0.1"},
+            }
+        elif method == "ping":
+            result = {}
+        elif method == "tools/list":
+            result = {"tools": TOOLS}
+        elif method == "tools/call":
+            result = call_tool(params.get("name"), params.get("arguments") or {})
+        else:
+            return {"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32601, "message": f"Method not found: {method}"}}
+    except KeyError as e:
+        return {"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32602, "message": f"Unknown tool: {e}"}}
+    return {"jsonrpc": "2.0", "id": message["id"], "result": result}
+
+
+def handle_body(body):
+    if isinstance(body, list):
+        replies = [reply for reply in (handle(item) for item in body) if reply]
+        return replies or None
+    return handle(body)
+
+
+class StreamableHTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    sse = False
+    sessions = set()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+        is_initialize = isinstance(body, dict) and body.get("method") == "initialize"
+        session_id = self.headers.get("Mcp-Session-Id")
+        if not is_initialize and session_id not in self.sessions:
+            self._reply(404, b"")
+            return
+
+        reply = handle_body(body)
+        headers = {}
+        if is_initialize:
+            session_id = uuid.uuid4().hex
+            self.sessions.add(session_id)
+            headers["Mcp-Session-Id"] = session_id
+        if reply is None:
+            self._reply(202, b"", headers=headers)
+        elif self.sse:
+            self._reply(200, f"event: message\ndata: {json.dumps(reply)}\n\n".encode(), "text/event-stream", headers)
+        else:
+            self._reply(200, json.dumps(reply).encode(), "application/json", headers)
+
+    def do_GET(self):
+        # No notifications are ever sent, so there is no stream to offer
+        self._reply(405, b"")
+
+    def do_DELETE(self):
+        self.sessions.discard(self.headers.get("Mcp-Session-Id"))
+        self._reply(200, b"")
+
+    def _reply(self, status: int, data: bytes, content_type: str = "text/plain", headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def websocket_session(websocket):
+    async for frame in websocket:
+        reply = await asyncio.to_thread(handle_body, json.loads(frame))
+        if reply is not None:
+            await websocket.send(json.dumps(reply))
+
+
+async def serve_websocket(port: int):
+    async with websockets.serve(websocket_session, "127.0.0.1", port, subprotocols=["mcp"]):
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--http-port", type=int, default=8765)
+    parser.add_argument("--ws-port", type=int, default=8766)
+    parser.add_argument("--sse", action="store_true", help="answer POSTs with SSE streams instead of JSON")
+    args = parser.parse_args()
+
+    StreamableHTTPHandler.sse = args.sse
+    http_server = ThreadingHTTPServer(("127.0.0.1", args.http_port), StreamableHTTPHandler)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    print(f"🌐 MCP stand-in server: http://127.0.0.1:{args.http_port}/mcp and ws://127.0.0.1:{args.ws_port}")
+    try:
+        asyncio.run(serve_websocket(args.ws_port))
+    except KeyboardInterrupt:
+        http_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,16 @@
 import os
-import time
 import asyncio
+import time
 import yaml
 import gradio as gr
-from generating_syllabus import generate_syllabus
+from generating_syllabus import SyllabusCancelled, generate_syllabus
+from job_queue import JobQueue, QueueFullError
 from teaching_agent import teaching_agent
 
 # Import MCP tools
 try:
     from mcp_tools import mcp_tool_manager
+    from process_lifecycle import process_registry
     MCP_AVAILABLE = True
 except ImportError:
     MCP_AVAILABLE = False
@@ -32,9 +34,9 @@ except FileNotFoundError:
     print("❌ .env file not found")
     print("Please create a .env file with GOOGLE_API_KEY=your_actual_key")
 
-# Initialize MCP servers if available
-async def initialize_mcp_servers():
-    """Initialize MCP servers on startup"""
+# Register MCP servers if available; they are started lazily on first tool call
+def initialize_mcp_servers():
+    """Register MCP servers from the config file on startup"""
     if not MCP_AVAILABLE:
         return "MCP tools not available"
     
@@ -60,18 +62,75 @@ async def initialize_mcp_servers():
         with open("mcp_config.yaml", "r") as f:
             config = yaml.safe_load(f)
         
-        await mcp_tool_manager.initialize_servers(config.get("servers", []))
+        mcp_tool_manager.register_servers(config.get("servers", []))
         
         server_count = len(config.get("servers", []))
-        return f"✅ {server_count} MCP server(s) initialized successfully"
+        return f"✅ {server_count} MCP server(s) registered (started on first use)"
         
     except Exception as e:
         return f"❌ Failed to initialize MCP servers: {str(e)}"
 
+_warm_up_started = False
+
+async def warm_up_mcp_servers():
+    """Start the servers marked `warm: true` inside the app's event loop, once per app"""
+    global _warm_up_started
+    if not MCP_AVAILABLE or _warm_up_started:
+        return
+    _warm_up_started = True
+    
+    results = await mcp_tool_manager.warm_up()
+    for server_id, started in results.items():
+        print(f"{'✅' if started else '❌'} Warm-up of MCP server {server_id}")
+    
+    # Apply edits to the config file without restarting the app
+    mcp_tool_manager.watch_config("mcp_config.yaml")
+
+# Stop spawned MCP servers on exit, SIGTERM or SIGHUP, and clean up after earlier runs
+if MCP_AVAILABLE:
+    process_registry.install()
+    if process_registry.stale_killed:
+        print(f"🧹 Stopped {process_registry.stale_killed} MCP server process(es) left by a previous run")
+
 # Run MCP initialization
-mcp_status = asyncio.run(initialize_mcp_servers())
+mcp_status = initialize_mcp_servers()
 print(mcp_status)
 
+# Prometheus endpoint for tool metrics; set METRICS_PORT=0 to turn it off
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+if MCP_AVAILABLE and METRICS_PORT:
+    try:
+        from mcp_metrics import start_metrics_server
+        start_metrics_server(METRICS_PORT)
+        print(f"📈 Metrics at http://127.0.0.1:{METRICS_PORT}/metrics")
+    except OSError as e:
+        print(f"⚠️  Metrics endpoint not started: {e}")
+        METRICS_PORT = 0
+
+# Syllabus generation takes minutes, so it runs on its own worker threads instead of the
+# ones serving chat; SYLLABUS_WORKERS bounds how many run at once
+syllabus_jobs = JobQueue(
+    "syllabus",
+    workers=int(os.environ.get("SYLLABUS_WORKERS", "2")),
+    max_pending=int(os.environ.get("SYLLABUS_MAX_PENDING", "10")),
+    cancelled_exceptions=(SyllabusCancelled,),
+)
+SYLLABUS_POLL_SECONDS = 1.0
+
+def format_syllabus_job(job):
+    """Describe a syllabus job's state for the output box"""
+    if job is None:
+        return "❌ Unknown job id"
+    if job["status"] == "done":
+        return f"✅ Syllabus generated successfully!\n\n{job['result']}"
+    if job["status"] == "failed":
+        return f"❌ Error generating syllabus: {job['error']}"
+    if job["status"] == "cancelled":
+        return f"🛑 Syllabus generation cancelled (job {job['id']})"
+    if job["status"] == "queued":
+        return f"⏳ Job {job['id']} is waiting for a worker ({job['position']} ahead of it)"
+    return f"⏳ Job {job['id']}: {job['stage']} ({job['progress']:.0%})"
+
 # MCP Management Functions
 def get_mcp_status():
     """Get current MCP server status"""
@@ -80,21 +139,82 @@ def get_mcp_status():
     
     try:
         servers = mcp_tool_manager.mcp_service.get_available_servers()
-        if not servers:
+        providers = mcp_tool_manager.providers
+        if not servers and not providers:
             return "No MCP servers running"
         
         status_lines = []
+        for server_id, provider in providers.items():
+            name = provider.config.get('name', server_id)
+            status_lines.append(f"⚡ {name} ({server_id}): in-process")
+        
         for server_id in servers:
-            server_info = mcp_tool_manager.mcp_service.servers.get(server_id, {})
-            status = server_info.get('status', 'unknown')
-            config = server_info.get('config', {})
+            status = mcp_tool_manager.mcp_service.get_server_status(server_id)
+            config = mcp_tool_manager.mcp_service.configs.get(server_id, {})
             name = config.get('name', server_id)
-            status_lines.append(f"✅ {name} ({server_id}): {status}")
+            icon = "✅" if status == "running" else "💤"
+            if config.get('transport', 'stdio') != 'stdio':
+                status += f" via {config['transport']} {config.get('url', '')}"
+            startup = mcp_tool_manager.mcp_service.get_startup_report(server_id)
+            if startup.get("ready"):
+                status += f" (ready in {startup['latency']:.2f}s)"
+            elif startup.get("error"):
+                icon = "❌"
+                status += f" (last start failed: {startup['error']})"
+            breaker = mcp_tool_manager.mcp_service.get_breaker_state(server_id)
+            if breaker != "closed":
+                icon = "⛔" if breaker == "open" else "⚠️"
+            status_lines.append(f"{icon} {name} ({server_id}): {status} | breaker: {breaker}")
+        
+        processes = process_registry.report()
+        for leak in processes["leaked"]:
+            status_lines.append(
+                f"⚠️ {leak['name']}: server exited but left processes {leak['members']} running"
+            )
+        if processes["tracked"]:
+            status_lines.append(f"🔧 {processes['tracked']} server process(es) tracked")
         
         return "\n".join(status_lines)
     except Exception as e:
         return f"Error getting MCP status: {str(e)}"
 
+def get_mcp_logs(server_id):
+    """Show the recent stderr output of one MCP server"""
+    if not MCP_AVAILABLE:
+        return "MCP tools not installed"
+    if not server_id:
+        return "Choose a server"
+    
+    lines = mcp_tool_manager.get_server_logs(server_id)
+    if server_id in mcp_tool_manager.providers:
+        return f"{server_id} runs in-process and has no server log"
+    return "\n".join(lines) if lines else f"No log output from {server_id} yet"
+
+def get_mcp_metrics():
+    """Summarize tool call latency and errors, slowest p99 first"""
+    if not MCP_AVAILABLE:
+        return "MCP tools not installed"
+    
+    rows = mcp_tool_manager.get_metrics_summary()
+    if not rows:
+        return "No tool calls yet"
+    
+    def ms(seconds):
+        return "-" if seconds is None else f"{seconds * 1000:.0f} ms"
+    
+    lines = [
+        "| Tool | Calls | Errors | p50 | p95 | p99 | Avg result |",
+        "|---|---|---|---|---|---|---|",
+    ]
+    for row in rows:
+        lines.append(
+            f"| {row['server']}.{row['tool']} | {row['calls']} | {row['errors']} | {ms(row['p50'])} "
+            f"| {ms(row['p95'])} | {ms(row['p99'])} | {row['mean_result_bytes'] / 1024:.1f} KB |"
+        )
+    if METRICS_PORT:
+        lines.append(f"\nPrometheus metrics: http://127.0.0.1:{METRICS_PORT}/metrics")
+    return "\n".join(lines)
+
 async def add_mcp_server(server_data):
     """Add a new MCP server"""
     if not MCP_AVAILABLE:
@@ -115,20 +235,28 @@ async def add_mcp_server(server_data):
             'env': server_data.get('env', {})
         }
         
+        # Replace an existing server with the same id instead of duplicating it
+        config['servers'] = [
+            server for server in config.get('servers') or [] if server.get('id') != new_server['id']
+        ]
         config['servers'].append(new_server)
         
         # Save config
         with open("mcp_config.yaml", "w") as f:
             yaml.dump(config, f)
         
-        # Initialize the new server
-        await mcp_tool_manager.initialize_servers([new_server])
+        # Start only what changed; servers that are already running keep running
+        await mcp_tool_manager.reconcile(config['servers'])
         
         return f"✅ Server '{server_data['name']}' added successfully"
         
     except Exception as e:
         return f"❌ Failed to add server: {str(e)}"
 
+# Chat streaming: the whole chat is sent to the browser on every yield, so model chunks
+# arriving closer together than this are merged into one update
+STREAM_FRAME_SECONDS = 0.05
+
 # Gradio Interface
 with gr.Blocks(theme=gr.themes.Soft()) as demo:
     gr.Markdown("""
@@ -140,22 +268,46 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
     with gr.Tab("📚 Input Your Learning Topic"):
         gr.Markdown("### What would you like to learn today?")
         
-        def perform_task(input_text):
-            """Generate syllabus based on user input"""
+        async def perform_task(input_text):
+            """Queue syllabus generation and report its progress until it finishes"""
             if not input_text.strip():
-                return "Please enter a topic to learn"
+                yield "Please enter a topic to learn", ""
+                return
                 
+            task = f"Generate a course syllabus to teach the topic: {input_text}"
             try:
-                task = f"Generate a course syllabus to teach the topic: {input_text}"
-                syllabus = generate_syllabus(input_text, task)
-                
+                job_id = syllabus_jobs.submit(generate_syllabus, input_text, task, description=task)
+            except QueueFullError:
+                yield "⏳ Too many syllabi are being generated right now, please try again in a minute", ""
+                return
+            
+            # Only this cheap poll occupies the event; the generation runs on the job workers
+            while True:
+                job = syllabus_jobs.get(job_id)
+                if job is None or job["status"] in ("done", "failed", "cancelled"):
+                    break
+                yield format_syllabus_job(job), job_id
+                await asyncio.sleep(SYLLABUS_POLL_SECONDS)
+            
+            if job is not None and job["status"] == "done":
                 # Seed the teaching agent with the generated syllabus
-                teaching_agent.seed_agent(syllabus, task)
-                
-                return f"✅ Syllabus generated successfully!\n\n{syllabus}"
-                
-            except Exception as e:
-                return f"❌ Error generating syllabus: {str(e)}"
+                teaching_agent.seed_agent(job["result"], task)
+            yield format_syllabus_job(job), job_id
+        
+        def cancel_task(job_id):
+            """Cancel the syllabus job shown in the job id box"""
+            if not job_id:
+                return "No syllabus job to cancel"
+            if syllabus_jobs.cancel(job_id.strip()):
+                return f"🛑 Cancelling job {job_id}..."
+            return format_syllabus_job(syllabus_jobs.get(job_id.strip()))
+        
+        def load_task(job_id):
+            """Show a syllabus job by id and start teaching from it once it is done"""
+            job = syllabus_jobs.get((job_id or "").strip())
+            if job is not None and job["status"] == "done":
+                teaching_agent.seed_agent(job["result"], job["description"])
+            return format_syllabus_job(job)
         
         with gr.Row():
             text_input = gr.Textbox(
@@ -166,6 +318,14 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
         
         with gr.Row():
             text_button = gr.Button("🚀 Generate Syllabus", variant="primary")
+            cancel_button = gr.Button("🛑 Cancel", variant="secondary")
+        
+        with gr.Row():
+            job_id_box = gr.Textbox(
+                label="Job ID (keep it to fetch the syllabus later):",
+                scale=4
+            )
+            load_button = gr.Button("📥 Load Job", variant="secondary", scale=1)
         
         with gr.Row():
             text_output = gr.Textbox(
@@ -175,11 +335,15 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
                 show_copy_button=True
             )
         
+        # The poll is async and mostly sleeping, so it need not hold back other events
         text_button.click(
             perform_task,
             inputs=text_input,
-            outputs=text_output
+            outputs=[text_output, job_id_box],
+            concurrency_limit=None
         )
+        cancel_button.click(cancel_task, inputs=job_id_box, outputs=text_output, queue=False)
+        load_button.click(load_task, inputs=job_id_box, outputs=text_output, queue=False)
     
     with gr.Tab("👨‍🏫 AI Instructor"):
         gr.Markdown("### Chat with your AI Instructor")
@@ -211,24 +375,21 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
             return "", history + [[user_message, None]]
         
         async def bot(history):
-            """Generate AI instructor response"""
+            """Stream the AI instructor's response as the model writes it"""
             try:
-                # Use async instructor step if MCP tools are available
-                if MCP_AVAILABLE and teaching_agent.mcp_tools_enabled:
-                    bot_message = await teaching_agent._callinstructor({})
-                else:
-                    bot_message = teaching_agent.instructor_step()
-                
-                # Clean the message - remove <END_OF_TURN> and any extra whitespace
-                
-                clean_message = bot_message.replace('<END_OF_TURN>', '').strip()
-                
-                # Stream the response
+                reply = ""
+                shown_at = time.monotonic()
                 history[-1][1] = ""
-                for character in clean_message:
-                    history[-1][1] += character
-                    time.sleep(0.01)  # Smooth streaming
-                    yield history
+                # Tool results, if the reply asked for any, arrive as the last chunk
+                async for chunk in teaching_agent.astream_instructor():
+                    reply += chunk
+                    if time.monotonic() - shown_at >= STREAM_FRAME_SECONDS:
+                        history[-1][1] = reply.lstrip()
+                        shown_at = time.monotonic()
+                        yield history
+                
+                history[-1][1] = reply.replace('<END_OF_TURN>', '').strip()
+                yield history
                     
             except Exception as e:
                 error_msg = f"❌ Error generating response: {str(e)}"
@@ -301,6 +462,24 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
                         interactive=False
                     )
                     refresh_btn = gr.Button("🔄 Refresh Status", variant="secondary")
+                    
+                    gr.Markdown("#### Tool Metrics")
+                    metrics_display = gr.Markdown("No tool calls yet")
+                    refresh_metrics_btn = gr.Button("📈 Refresh Metrics", variant="secondary")
+                    
+                    gr.Markdown("#### Server Logs")
+                    log_server = gr.Dropdown(
+                        label="Server",
+                        choices=mcp_tool_manager.get_available_servers(),
+                        allow_custom_value=True
+                    )
+                    log_display = gr.Textbox(
+                        label="Recent stderr output",
+                        lines=10,
+                        max_lines=20,
+                        interactive=False
+                    )
+                    show_logs_btn = gr.Button("📜 Show Logs", variant="secondary")
                 
                 with gr.Column(scale=3):
                     gr.Markdown("#### Add New MCP Server")
@@ -392,6 +571,8 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
                     return "MCP tools disabled"
             
             refresh_btn.click(refresh_status, outputs=status_display)
+            refresh_metrics_btn.click(get_mcp_metrics, outputs=metrics_display)
+            show_logs_btn.click(get_mcp_logs, inputs=log_server, outputs=log_display)
             add_server_btn.click(
                 add_server,
                 inputs=[server_id, server_name, server_command, server_args, server_desc],
@@ -432,6 +613,9 @@ with gr.Blocks(theme=gr.themes.Soft()) as demo:
         - Database querying for data examples
         """)
 
+    # Start hot servers once the app's event loop is running; later page loads skip it
+    demo.load(warm_up_mcp_servers)
+
 # Launch the application
 demo.queue(max_size=20).launch(
     debug=True, 
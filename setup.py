@@ -19,7 +19,7 @@ setup(
     packages=find_namespace_packages(where='src'),
     install_requires=required_packages,
     extras_require={
-        "dev": ["pre-commit==2.19.0"],
+        "dev": ["pre-commit==2.19.0", "pytest"],
     },
    classifiers=[
         "Development Status :: 4 - Beta",
@@ -0,0 +1,72 @@
+import asyncio
+import contextlib
+import math
+from typing import Optional
+
+DEFAULT_MAX_CONCURRENT = 16
+DEFAULT_MAX_QUEUED = 64
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; carries a suggested retry delay"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """Bounds concurrent LLM work and the number of requests allowed to wait for it.
+
+    Requests beyond the waiting room are rejected immediately instead of piling
+    up, with a Retry-After estimated from recent request durations.
+    """
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT, max_queued: int = DEFAULT_MAX_QUEUED):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        # Exponential moving average of how long admitted work holds its slot
+        self.average_seconds = 5.0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a new request"""
+        rounds = (self.waiting + 1) / self.max_concurrent
+        return max(1, math.ceil(rounds * self.average_seconds))
+
+    @contextlib.asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        if self.active + self.waiting >= self.max_concurrent + self.max_queued:
+            self.rejected += 1
+            raise Overloaded(f"{self.active} requests running and {self.waiting} waiting", self.retry_after())
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(f"No capacity within {timeout}s", self.retry_after())
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        started = asyncio.get_running_loop().time()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            elapsed = asyncio.get_running_loop().time() - started
+            self.average_seconds = 0.8 * self.average_seconds + 0.2 * elapsed
+
+    def status(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,78 @@
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+MAX_MESSAGE_CHARS = 8000
+MAX_TOPIC_CHARS = 200
+
+
+class ChatRequest(BaseModel):
+    message: str = Field(..., min_length=1, max_length=MAX_MESSAGE_CHARS)
+    # Omit to start a new session; the response carries the id to continue it
+    session_id: Optional[str] = Field(None, max_length=64)
+    # Start the session from a generated syllabus (see /api/subjects)
+    subject_id: Optional[str] = Field(None, max_length=64)
+    stream: bool = False
+
+
+class ChatResponse(BaseModel):
+    session_id: str
+    reply: str
+
+
+class TurnUsage(BaseModel):
+    turn: Optional[int] = None
+    calls: int
+    input_tokens: int
+    output_tokens: int
+    seconds: float
+    # Calls whose counts are estimates because the provider reported no usage
+    estimated: int = 0
+
+
+class SessionUsage(BaseModel):
+    session_id: str
+    input_tokens: int
+    output_tokens: int
+    turns: List[TurnUsage]
+
+
+class SyllabusRequest(BaseModel):
+    topic: str = Field(..., min_length=1, max_length=MAX_TOPIC_CHARS)
+    # A topic that already has a syllabus is answered from it unless this is set
+    refresh: bool = False
+
+
+class JobStatus(BaseModel):
+    id: str
+    status: str
+    progress: float
+    stage: str
+    position: Optional[int] = None
+    result: Optional[str] = None
+    error: Optional[str] = None
+
+
+class Subject(BaseModel):
+    id: str
+    topic: str
+    created: float
+
+
+class SubjectList(BaseModel):
+    subjects: List[Subject]
+
+
+class AssessmentRequest(BaseModel):
+    # Assess what was taught in a session, or a subject's whole syllabus
+    session_id: Optional[str] = Field(None, max_length=64)
+    subject_id: Optional[str] = Field(None, max_length=64)
+    num_questions: int = Field(5, ge=1, le=20)
+    difficulty: Literal["beginner", "intermediate", "advanced"] = "intermediate"
+    question_types: List[Literal["multiple_choice", "short_answer", "true_false"]] = ["multiple_choice", "short_answer"]
+
+
+class AssessmentResponse(BaseModel):
+    topic: str
+    difficulty: str
+    assessment: str
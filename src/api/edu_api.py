@@ -0,0 +1,377 @@
+"""Headless HTTP API for EduGPT, for LMS integrations and other programmatic clients.
+
+    uvicorn edu_api:app --host 0.0.0.0 --port 8000
+
+Endpoints:
+    POST   /api/chat                    one instructor turn; ``"stream": true`` answers with SSE
+    GET    /api/chat/{session_id}/usage tokens used by each turn of a session
+    GET    /api/subjects                generated syllabi that chats and assessments can use
+    POST   /api/syllabus                queue syllabus generation (202 with a job id)
+    GET    /api/syllabus/{job_id}       job status and, once done, the syllabus
+    GET    /api/syllabus/{job_id}/events  SSE progress updates until the job finishes
+    DELETE /api/syllabus/{job_id}       cancel a job
+    POST   /api/assessment              personalised assessment for a session or subject
+    GET    /api/health                  load and capacity
+
+LLM-backed requests share a bounded number of slots. When every slot is busy
+and the waiting room is full, requests are rejected with 503 and Retry-After
+instead of queueing without limit; a second request for a session that is
+still answering gets 429.
+
+Sessions, generated syllabi, job status and MCP tool lists live in the state
+store named by EDUGPT_STATE_URL, so with a shared store (sqlite:///... on one
+machine, redis://... across machines) the app can run as several workers
+behind any load balancer:
+
+    EDUGPT_STATE_URL=sqlite:///var/lib/edugpt/state.db uvicorn edu_api:app --workers 4
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from admission import DEFAULT_MAX_CONCURRENT, DEFAULT_MAX_QUEUED, AdmissionLimiter, Overloaded
+from api_models import (
+    AssessmentRequest,
+    AssessmentResponse,
+    ChatRequest,
+    ChatResponse,
+    JobStatus,
+    SessionUsage,
+    Subject,
+    SubjectList,
+    SyllabusRequest,
+    TurnUsage,
+)
+from generating_syllabus import SyllabusCancelled, generate_syllabus
+from job_queue import DONE, FINISHED_STATES, RUNNING, JobQueue, QueueFullError
+from llm_quota import INTERACTIVE, estimate_tokens, llm_scheduler
+from session_manager import DEFAULT_SESSION_TTL, SessionBusy, SessionManager
+from state_store import StateStore, state_store
+from teaching_agent import MCP_AVAILABLE, TeachingGPT
+from token_ledger import token_ledger
+from teaching_agent import llm as default_llm
+
+if MCP_AVAILABLE:
+    from mcp_tools import load_server_configs, mcp_tool_manager
+    from process_lifecycle import process_registry
+
+# Seconds an admitted request may wait for a free slot before it is turned away
+DEFAULT_ADMISSION_TIMEOUT = 30.0
+SYLLABUS_EVENT_SECONDS = 1.0
+# Conversation turns included when assessing a session
+ASSESSMENT_HISTORY_TURNS = 20
+
+ASSESSMENT_PROMPT = """You are an experienced instructor writing an assessment about {topic}.
+Write {num_questions} questions at {difficulty} level, using these question types: {question_types}.
+Base the questions only on the material between the first and second '==='.
+Number the questions and put an answer key with a one-line explanation per answer at the end.
+===
+{material}
+===
+"""
+
+
+def _env_number(name: str, default, cast=int):
+    return cast(os.environ.get(name, default))
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _topic_key(topic: str) -> str:
+    return " ".join(topic.lower().split())
+
+
+def _text(message: Any) -> str:
+    # Chat models answer with a message, plain LLMs with a string
+    return message if isinstance(message, str) else message.content
+
+
+def create_app(
+    llm: Any = None,
+    max_concurrent: int = None,
+    max_queued: int = None,
+    admission_timeout: float = None,
+    session_ttl: float = None,
+    syllabus_jobs: Optional[JobQueue] = None,
+    mcp_config_path: Optional[str] = None,
+    store: Optional[StateStore] = None,
+) -> FastAPI:
+    """Build the API; unset limits come from API_* environment variables or the defaults.
+
+    An llm given here answers every request, syllabus generation included;
+    otherwise chats use the teaching agent's Gemini model and syllabi their own.
+    """
+    # None keeps generate_syllabus on its per-stage Gemini models
+    generate = functools.partial(generate_syllabus, llm=llm)
+    llm = llm or default_llm
+    store = store or state_store
+    limiter = AdmissionLimiter(
+        max_concurrent or _env_number("API_MAX_CONCURRENT", DEFAULT_MAX_CONCURRENT),
+        max_queued if max_queued is not None else _env_number("API_MAX_QUEUED", DEFAULT_MAX_QUEUED),
+    )
+    admission_timeout = admission_timeout or _env_number("API_ADMISSION_TIMEOUT", DEFAULT_ADMISSION_TIMEOUT, float)
+    sessions = SessionManager(
+        lambda: TeachingGPT.from_llm(
+            llm, verbose=False, mcp_tools_enabled=MCP_AVAILABLE,
+            conversation_history=[], syllabus="", conversation_topic="",
+        ),
+        store,
+        session_ttl or _env_number("API_SESSION_TTL", DEFAULT_SESSION_TTL, float),
+    )
+    if syllabus_jobs is None:
+        syllabus_jobs = JobQueue(
+            "syllabus",
+            workers=_env_number("SYLLABUS_WORKERS", 2),
+            max_pending=_env_number("SYLLABUS_MAX_PENDING", 10),
+            cancelled_exceptions=(SyllabusCancelled,),
+        )
+
+    def publish_job(job: Dict[str, Any]):
+        # Lets any worker answer for this job, and keeps its syllabus after the job is pruned
+        store.set(f"syllabus_job:{job['id']}", job, ttl=syllabus_jobs.result_ttl)
+        if job["status"] == DONE:
+            topic = job["metadata"]["topic"]
+            store.set(f"subject:{job['id']}", {
+                "id": job["id"], "topic": topic, "task": job["description"],
+                "syllabus": job["result"], "created": job["finished"],
+            })
+            store.set(f"syllabus_topic:{_topic_key(topic)}", {"subject_id": job["id"]})
+        elif job["status"] == RUNNING and store.delete(f"syllabus_cancel:{job['id']}"):
+            # Cancelled through another worker
+            syllabus_jobs.cancel(job["id"])
+
+    syllabus_jobs.listener = publish_job
+    mcp_config_path = mcp_config_path or os.environ.get("MCP_CONFIG", "mcp_config.yaml")
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if MCP_AVAILABLE:
+            process_registry.install()
+            if os.path.exists(mcp_config_path):
+                mcp_tool_manager.register_servers(load_server_configs(mcp_config_path))
+                await mcp_tool_manager.warm_up()
+                mcp_tool_manager.watch_config(mcp_config_path)
+        yield
+        syllabus_jobs.shutdown()
+        if MCP_AVAILABLE:
+            await mcp_tool_manager.shutdown()
+
+    app = FastAPI(title="EduGPT API", version="0.1", lifespan=lifespan)
+    app.state.limiter = limiter
+    app.state.sessions = sessions
+    app.state.syllabus_jobs = syllabus_jobs
+
+    @app.exception_handler(Overloaded)
+    async def overloaded(request: Request, exc: Overloaded):
+        return JSONResponse(
+            {"detail": f"Server busy: {exc}"}, status_code=503, headers={"Retry-After": str(exc.retry_after)}
+        )
+
+    @app.exception_handler(QueueFullError)
+    async def queue_full(request: Request, exc: QueueFullError):
+        return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "60"})
+
+    def done_subject(subject_id: str) -> Dict[str, Any]:
+        subject = store.get(f"subject:{subject_id}")
+        if subject is None:
+            raise HTTPException(404, f"No generated syllabus with id {subject_id}")
+        return subject
+
+    def open_session(request: ChatRequest) -> Tuple[str, Any]:
+        """Find or start the session and claim it for this turn"""
+        session_id = request.session_id
+        if not session_id:
+            subject = done_subject(request.subject_id) if request.subject_id else None
+            session_id = sessions.create(subject["syllabus"], subject["task"]) if subject else sessions.create()
+        try:
+            return session_id, sessions.claim(session_id)
+        except SessionBusy:
+            raise HTTPException(429, "This session is still answering", headers={"Retry-After": "1"})
+        except KeyError:
+            raise HTTPException(404, f"Unknown or expired session {session_id}")
+
+    @app.post("/api/chat", response_model=ChatResponse)
+    async def chat(request: ChatRequest):
+        received = time.perf_counter()
+        session_id, turn = open_session(request)
+        if request.stream:
+            return await stream_chat(session_id, turn, request.message, received)
+
+        async with turn as agent:
+            async with limiter.slot(admission_timeout):
+                agent.human_step(request.message)
+                with token_ledger.attribute(session=session_id):
+                    reply = await agent._callinstructor({})
+        return ChatResponse(session_id=session_id, reply=reply.replace("<END_OF_TURN>", "").strip())
+
+    async def stream_chat(session_id: str, turn: Any, message: str, received: float) -> StreamingResponse:
+        # Admission happens before the response starts, so overload is still a plain 503
+        held = contextlib.AsyncExitStack()
+        try:
+            agent = await held.enter_async_context(turn)
+            await held.enter_async_context(limiter.slot(admission_timeout))
+            # Reported to the client, which cannot tell waiting for a slot from waiting for the model
+            queued = time.perf_counter() - received
+        except BaseException:
+            await held.aclose()
+            raise
+
+        async def events() -> AsyncIterator[str]:
+            async with held:
+                yield _sse("start", {"session_id": session_id, "queued_seconds": round(queued, 4)})
+                agent.human_step(message)
+                reply = ""
+                # Attributed here rather than in the handler: the stream runs in the response's own task
+                with token_ledger.attribute(session=session_id):
+                    async for chunk in agent.astream_instructor():
+                        reply += chunk
+                        yield _sse("delta", {"text": chunk})
+                yield _sse("done", {"session_id": session_id, "reply": reply.strip()})
+
+        # The background task frees the slot even if the client leaves before the stream starts
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(held.aclose),
+        )
+
+    @app.delete("/api/chat/{session_id}", status_code=204)
+    async def end_chat(session_id: str):
+        if not sessions.remove(session_id):
+            raise HTTPException(404, f"Unknown or expired session {session_id}")
+
+    @app.get("/api/chat/{session_id}/usage", response_model=SessionUsage)
+    async def chat_usage(session_id: str):
+        turns = sessions.usage(session_id)
+        if turns is None:
+            raise HTTPException(404, f"Unknown or expired session {session_id}")
+        return SessionUsage(
+            session_id=session_id,
+            input_tokens=sum(turn["input_tokens"] for turn in turns),
+            output_tokens=sum(turn["output_tokens"] for turn in turns),
+            turns=[TurnUsage(**turn) for turn in turns],
+        )
+
+    @app.get("/api/subjects", response_model=SubjectList)
+    async def subjects():
+        found = (store.get(key) for key in store.keys("subject:"))
+        return SubjectList(subjects=sorted(
+            (Subject(id=s["id"], topic=s["topic"], created=s["created"]) for s in found if s is not None),
+            key=lambda subject: subject.created,
+        ))
+
+    @app.post("/api/syllabus", response_model=JobStatus, status_code=202)
+    async def create_syllabus(request: SyllabusRequest, response: Response):
+        if not request.refresh:
+            cached = store.get(f"syllabus_topic:{_topic_key(request.topic)}")
+            subject = store.get(f"subject:{cached['subject_id']}") if cached else None
+            if subject is not None:
+                response.status_code = 200
+                return JobStatus(id=subject["id"], status=DONE, progress=1.0, stage="Done", result=subject["syllabus"])
+
+        task = f"Generate a course syllabus to teach the topic: {request.topic}"
+        job_id = syllabus_jobs.submit(
+            generate, request.topic, task, description=task, metadata={"topic": request.topic}
+        )
+        return JobStatus(**syllabus_jobs.get(job_id))
+
+    def syllabus_job(job_id: str) -> Dict[str, Any]:
+        # Jobs started by another worker are known from the snapshot it published
+        job = syllabus_jobs.get(job_id) or store.get(f"syllabus_job:{job_id}")
+        if job is None:
+            raise HTTPException(404, f"Unknown syllabus job {job_id}")
+        return job
+
+    @app.get("/api/syllabus/{job_id}", response_model=JobStatus)
+    async def get_syllabus(job_id: str):
+        return JobStatus(**syllabus_job(job_id))
+
+    @app.get("/api/syllabus/{job_id}/events")
+    async def syllabus_events(job_id: str):
+        syllabus_job(job_id)
+
+        async def events() -> AsyncIterator[str]:
+            last = None
+            while True:
+                job = syllabus_jobs.get(job_id) or store.get(f"syllabus_job:{job_id}")
+                if job is None:
+                    return
+                state = (job["status"], job["stage"], job.get("position"))
+                if state != last:
+                    yield _sse("progress", JobStatus(**job).model_dump(exclude={"result"}))
+                    last = state
+                if job["status"] in FINISHED_STATES:
+                    yield _sse(job["status"], JobStatus(**job).model_dump())
+                    return
+                await asyncio.sleep(SYLLABUS_EVENT_SECONDS)
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    @app.delete("/api/syllabus/{job_id}", response_model=JobStatus)
+    async def cancel_syllabus(job_id: str):
+        job = syllabus_job(job_id)
+        if job_id in syllabus_jobs.jobs:
+            syllabus_jobs.cancel(job_id)
+            return JobStatus(**syllabus_jobs.get(job_id))
+        if job["status"] not in FINISHED_STATES:
+            # The worker running it picks this up at its next progress update
+            store.set(f"syllabus_cancel:{job_id}", {"requested": True}, ttl=syllabus_jobs.result_ttl)
+            job["stage"] = "Cancelling"
+        return JobStatus(**job)
+
+    @app.post("/api/assessment", response_model=AssessmentResponse)
+    async def assessment(request: AssessmentRequest):
+        if request.session_id:
+            session = sessions.get_state(request.session_id)
+            if session is None:
+                raise HTTPException(404, f"Unknown or expired session {request.session_id}")
+            state = session["agent"]
+            if not state["syllabus"] and not state["conversation_history"]:
+                raise HTTPException(409, "Nothing has been taught in this session yet")
+            topic = state["conversation_topic"] or "the material covered so far"
+            history = [turn.replace("<END_OF_TURN>", "") for turn in state["conversation_history"]]
+            material = state["syllabus"] + "\n\nLesson so far:\n" + "\n".join(history[-ASSESSMENT_HISTORY_TURNS:])
+        elif request.subject_id:
+            subject = done_subject(request.subject_id)
+            topic, material = subject["topic"], subject["syllabus"]
+        else:
+            raise HTTPException(422, "Give a session_id or a subject_id to assess")
+
+        prompt = ASSESSMENT_PROMPT.format(
+            topic=topic,
+            num_questions=request.num_questions,
+            difficulty=request.difficulty,
+            question_types=", ".join(kind.replace("_", " ") for kind in request.question_types),
+            material=material,
+        )
+        async with limiter.slot(admission_timeout):
+            with token_ledger.attribute(session=request.session_id, stage="assessment"):
+                result = await llm_scheduler.acall(lambda: llm.ainvoke(prompt), estimate_tokens(prompt), INTERACTIVE)
+        return AssessmentResponse(topic=topic, difficulty=request.difficulty, assessment=_text(result))
+
+    @app.get("/api/health")
+    async def health():
+        return {
+            "status": "ok",
+            "admission": limiter.status(),
+            "sessions": sessions.count(),
+            "syllabus_jobs_pending": syllabus_jobs.pending,
+            "llm_quota": llm_scheduler.status(),
+            "mcp_tools": MCP_AVAILABLE,
+        }
+
+    return app
+
+
+app = create_app()
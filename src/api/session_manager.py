@@ -0,0 +1,98 @@
+import contextlib
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from state_store import StateStore
+from token_ledger import token_ledger
+
+# Sessions idle for longer than this are forgotten
+DEFAULT_SESSION_TTL = 3600.0
+# Longest a turn may hold its session before another worker may take it over
+DEFAULT_TURN_TTL = 300.0
+
+
+class SessionBusy(Exception):
+    """Raised when another request, on any worker, is still answering in the session"""
+
+
+class SessionManager:
+    """Chat sessions kept in a StateStore, so any app worker can serve any turn.
+
+    A turn claims its session with a store lock, rebuilds a TeachingGPT from
+    the saved state, and writes the state back when it is done, together with
+    the tokens each turn used according to the token ledger.
+    """
+
+    def __init__(
+        self,
+        agent_factory: Callable[[], Any],
+        store: StateStore,
+        session_ttl: float = DEFAULT_SESSION_TTL,
+        turn_ttl: float = DEFAULT_TURN_TTL,
+    ):
+        self.agent_factory = agent_factory
+        self.store = store
+        self.session_ttl = session_ttl
+        self.turn_ttl = turn_ttl
+
+    def create(self, syllabus: str = "", topic: str = "") -> str:
+        session_id = uuid.uuid4().hex
+        agent = self.agent_factory()
+        agent.seed_agent(syllabus, topic)
+        self._save(session_id, agent, time.time())
+        return session_id
+
+    def get_state(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(f"session:{session_id}")
+
+    def exists(self, session_id: str) -> bool:
+        return self.get_state(session_id) is not None
+
+    def remove(self, session_id: str) -> bool:
+        return self.store.delete(f"session:{session_id}")
+
+    def usage(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Tokens and model seconds per turn, oldest first; None for an unknown session"""
+        state = self.get_state(session_id)
+        return None if state is None else state.get("usage", [])
+
+    def count(self) -> int:
+        return len(self.store.keys("session:"))
+
+    def claim(self, session_id: str) -> "contextlib.AbstractAsyncContextManager":
+        """Lock a session for one turn and yield its agent; KeyError if unknown, SessionBusy if taken.
+
+        The lock is taken as soon as this is called, so a concurrent request sees it
+        before either of them awaits anything.
+        """
+        token = self.store.acquire_lock(f"session:{session_id}", self.turn_ttl)
+        if token is None:
+            raise SessionBusy(session_id)
+        state = self.get_state(session_id)
+        if state is None:
+            self.store.release_lock(f"session:{session_id}", token)
+            raise KeyError(session_id)
+        return self._turn(session_id, token, state)
+
+    @contextlib.asynccontextmanager
+    async def _turn(self, session_id: str, token: str, state: Dict[str, Any]):
+        started = time.time()
+        try:
+            agent = self.agent_factory()
+            agent.load_state(state["agent"])
+            yield agent
+            # The caller attributes its LLM calls to the session; the agent adds the turn number
+            usage = state.get("usage", [])
+            for turn, totals in token_ledger.totals(group_by="turn", since=started, session=session_id).items():
+                usage.append({"turn": turn, **totals})
+            self._save(session_id, agent, state["created"], usage)
+        finally:
+            self.store.release_lock(f"session:{session_id}", token)
+
+    def _save(self, session_id: str, agent: Any, created: float, usage: Optional[List[Dict[str, Any]]] = None):
+        self.store.set(
+            f"session:{session_id}",
+            {"agent": agent.export_state(), "created": created, "updated": time.time(), "usage": usage or []},
+            ttl=self.session_ttl,
+        )
@@ -0,0 +1,217 @@
+import collections
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_MAX_PENDING = 10
+# Finished jobs are kept this long so their results can still be fetched
+DEFAULT_RESULT_TTL = 3600.0
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class QueueFullError(RuntimeError):
+    """Raised by submit when too many jobs are already waiting or running"""
+
+
+class Job:
+    """One unit of background work and what is known about its progress"""
+
+    def __init__(self, job_id: str, description: str, metadata: Optional[Dict[str, Any]] = None):
+        self.id = job_id
+        self.description = description
+        self.metadata = metadata or {}
+        self.status = QUEUED
+        self.progress = 0.0
+        self.stage = "Waiting for a worker"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cancel_event = threading.Event()
+        self.future: Optional[Future] = None
+
+    def update(self, progress: float, stage: str):
+        self.progress = max(self.progress, min(progress, 1.0))
+        self.stage = stage
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "description": self.description,
+            "metadata": self.metadata,
+            "status": self.status,
+            "progress": self.progress,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    """Runs long jobs on a dedicated thread pool, away from the threads serving interactive requests.
+
+    Job functions are called as ``fn(*args, progress_callback=..., cancel_event=...)``
+    and are expected to report progress and to stop soon after the event is set.
+    An optional listener gets a snapshot of the job after every change, e.g. to
+    publish it where other app workers can read it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int = DEFAULT_JOB_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        result_ttl: float = DEFAULT_RESULT_TTL,
+        cancelled_exceptions: tuple = (),
+        listener: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        # Exceptions a job raises when it honours its cancel event
+        self.cancelled_exceptions = cancelled_exceptions
+        self.listener = listener
+        self.jobs: Dict[str, Job] = collections.OrderedDict()
+        self.logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-job")
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Jobs waiting for or holding a worker"""
+        return sum(1 for job in self.jobs.values() if job.status in (QUEUED, RUNNING))
+
+    def submit(
+        self, fn: Callable[..., Any], *args, description: str = "", metadata: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Queue a job and return its id; metadata is kept with the job for callers to look up"""
+        with self._lock:
+            self._prune()
+            if self.pending >= self.max_pending:
+                raise QueueFullError(f"{self.pending} {self.name} jobs are already queued or running")
+            job = Job(uuid.uuid4().hex[:12], description, metadata)
+            self.jobs[job.id] = job
+        self._notify(job)
+        job.future = self._executor.submit(self._run, job, fn, args)
+        return job.id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = job.snapshot()
+        if job.status == QUEUED:
+            snapshot["position"] = self._position(job)
+        return snapshot
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [self.get(job_id) for job_id in list(self.jobs)]
+
+    def result(self, job_id: str, timeout: Optional[float] = None) -> Any:
+        """Wait for a job and return its result, raising its error if it failed"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        try:
+            job.future.result(timeout)
+        except (CancelledError, FutureTimeoutError):
+            if job.status != CANCELLED:
+                raise TimeoutError(f"Job {job_id} still {job.status} after {timeout}s")
+        if job.status == FAILED:
+            raise RuntimeError(job.error)
+        if job.status == CANCELLED:
+            raise CancelledError(f"Job {job_id} was cancelled")
+        return job.result
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job outright, or ask a running one to stop; False if it already finished"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return False
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, CANCELLED, stage="Cancelled before it started")
+        else:
+            job.stage = "Cancelling"
+            self._notify(job)
+        return True
+
+    def shutdown(self, wait: bool = False):
+        """Cancel everything and stop the worker threads"""
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple):
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED, stage="Cancelled before it started")
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        job.stage = "Starting"
+        self._notify(job)
+
+        def progress(value: float, stage: str):
+            job.update(value, stage)
+            self._notify(job)
+
+        try:
+            result = fn(*args, progress_callback=progress, cancel_event=job.cancel_event)
+        except self.cancelled_exceptions as e:
+            self._finish(job, CANCELLED, stage=str(e) or "Cancelled")
+        except Exception as e:
+            self.logger.error(f"{self.name} job {job.id} failed: {e}")
+            self._finish(job, FAILED, error=str(e), stage="Failed")
+        else:
+            # A job that got all the way through keeps its result even if cancel came late
+            job.result = result
+            job.progress = 1.0
+            self._finish(job, DONE, stage="Done")
+
+    def _finish(self, job: Job, status: str, stage: str, error: Optional[str] = None):
+        job.status = status
+        job.stage = stage
+        job.error = error
+        job.finished = time.time()
+        self._notify(job)
+
+    def _notify(self, job: Job):
+        if self.listener is None:
+            return
+        try:
+            self.listener(job.snapshot())
+        except Exception as e:
+            # A broken listener must not take the job down with it
+            self.logger.warning(f"{self.name} job listener failed for {job.id}: {e}")
+
+    def _position(self, job: Job) -> int:
+        """How many queued jobs are ahead of this one"""
+        ahead = 0
+        for other in list(self.jobs.values()):
+            if other is job:
+                break
+            if other.status == QUEUED:
+                ahead += 1
+        return ahead
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id, job in list(self.jobs.items()):
+            if job.status in FINISHED_STATES and job.finished < cutoff:
+                del self.jobs[job_id]
@@ -0,0 +1,408 @@
+import asyncio
+import itertools
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from result_spool import DEFAULT_PREVIEW_CHARS, ResultSpool, SpillWriter, result_spool
+
+READ_CHUNK_BYTES = 64 * 1024
+# Messages larger than this are streamed to disk instead of being parsed in memory
+DEFAULT_MAX_MESSAGE_BYTES = 1024 * 1024
+# Error codes given to batch members that should be sent again as single requests:
+# the server rejected the batch, or its answers could not be separated
+BATCH_REJECTED = -32098
+BATCH_RETRY_INDIVIDUALLY = -32099
+# Given to requests whose oversized answer could not be matched to them by id
+MESSAGE_TOO_LARGE = -32097
+
+
+class JSONRPCError(Exception):
+    """Error object returned by the remote end of a JSON-RPC connection"""
+
+    def __init__(self, code: int, message: str, data: Any = None):
+        super().__init__(f"JSON-RPC error {code}: {message}")
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+class ConnectionRecycled(ConnectionError):
+    """The client dropped its connection after a response could not be matched to a request.
+
+    Requests still waiting on it got no answer, so they may be sent again over
+    another connection.
+    """
+
+
+class JSONRPCClient:
+    """JSON-RPC 2.0 client that multiplexes concurrent requests over one stream pair.
+
+    A single background task owns the reader and routes every response to the
+    future registered under its request id, so any number of callers can share
+    the same server process. Input is read in fixed-size chunks; a message that
+    grows past ``max_message_bytes`` is spilled to the result spool and its
+    request resolves to a ``SpilledResult`` reference instead of parsed JSON.
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        name: str = "jsonrpc",
+        default_timeout: float = 30.0,
+        max_message_bytes: int = DEFAULT_MAX_MESSAGE_BYTES,
+        preview_chars: int = DEFAULT_PREVIEW_CHARS,
+        spool: Optional[ResultSpool] = None,
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.name = name
+        self.default_timeout = default_timeout
+        self.max_message_bytes = max_message_bytes
+        self.preview_chars = preview_chars
+        self.spool = spool or result_spool
+        self.logger = logging.getLogger(__name__)
+
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        # request id -> ids of every request sent in the same batch
+        self._batch_members: Dict[int, List[int]] = {}
+        self._write_lock = asyncio.Lock()
+        self._notification_handlers: Dict[str, List[Callable[[Dict], Any]]] = {}
+        self._reader_task: Optional[asyncio.Task] = None
+        self._closed = False
+        # Set when responses can no longer be told apart; the reader then gives up the connection
+        self._recycle = False
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def start(self):
+        """Start the background reader task"""
+        if self._reader_task is None:
+            self._reader_task = asyncio.create_task(self._read_loop())
+
+    def on_notification(self, method: str, handler: Callable[[Dict], Any]):
+        """Register a callback for server-sent notifications of the given method"""
+        self._notification_handlers.setdefault(method, []).append(handler)
+
+    async def request(self, method: str, params: Optional[Dict] = None, timeout: Optional[float] = None) -> Any:
+        """Send a request and wait for its matching response"""
+        if self._closed:
+            raise ConnectionError(f"{self.name}: connection is closed")
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+
+        timeout = self.default_timeout if timeout is None else timeout
+        try:
+            await self._send(message)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._cancel_remote(request_id, "timeout")
+            raise TimeoutError(f"{self.name}: {method} timed out after {timeout}s")
+        except asyncio.CancelledError:
+            self._cancel_remote(request_id, "cancelled by client")
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def request_batch(
+        self, calls: List[Tuple[str, Optional[Dict]]], timeout: Optional[float] = None
+    ) -> List[Any]:
+        """Send several requests as one JSON-RPC batch.
+
+        Returns one entry per call in call order: the result, or the exception
+        that request failed with (``JSONRPCError``, ``TimeoutError`` or
+        ``ConnectionError``), so one bad call does not hide the others.
+        """
+        if not calls:
+            return []
+        if self._closed:
+            raise ConnectionError(f"{self.name}: connection is closed")
+
+        loop = asyncio.get_running_loop()
+        request_ids: List[int] = []
+        futures: List[asyncio.Future] = []
+        messages = []
+        for method, params in calls:
+            request_id = next(self._ids)
+            future = loop.create_future()
+            self._pending[request_id] = future
+            self._batch_members[request_id] = request_ids
+            request_ids.append(request_id)
+            futures.append(future)
+            message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+            if params is not None:
+                message["params"] = params
+            messages.append(message)
+
+        timeout = self.default_timeout if timeout is None else timeout
+        try:
+            await self._send(messages)
+            await asyncio.wait(futures, timeout=timeout)
+        except asyncio.CancelledError:
+            for request_id, future in zip(request_ids, futures):
+                if not future.done():
+                    self._cancel_remote(request_id, "cancelled by client")
+            raise
+        finally:
+            for request_id in request_ids:
+                self._pending.pop(request_id, None)
+                self._batch_members.pop(request_id, None)
+
+        results = []
+        for request_id, (method, _), future in zip(request_ids, calls, futures):
+            if not future.done():
+                future.cancel()
+                self._cancel_remote(request_id, "timeout")
+                results.append(TimeoutError(f"{self.name}: {method} timed out after {timeout}s"))
+            elif future.exception() is not None:
+                results.append(future.exception())
+            else:
+                results.append(future.result())
+        return results
+
+    async def notify(self, method: str, params: Optional[Dict] = None):
+        """Send a notification, which gets no response"""
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        await self._send(message)
+
+    async def close(self):
+        """Stop the reader and fail every request still waiting for a response"""
+        self._closed = True
+        if self._reader_task is not None and not self._reader_task.done():
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._fail_pending(ConnectionError(f"{self.name}: connection closed"))
+
+    async def _send(self, message: Any):
+        data = json.dumps(message).encode() + b"\n"
+        async with self._write_lock:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    def _cancel_remote(self, request_id: int, reason: str):
+        """Tell the server to stop working on a request we no longer wait for"""
+        if self._closed:
+            return
+        params = {"requestId": request_id, "reason": reason}
+        task = asyncio.ensure_future(self.notify("notifications/cancelled", params))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _read_loop(self):
+        buffer = bytearray()
+        spill: Optional[SpillWriter] = None
+        try:
+            while True:
+                chunk = await self.reader.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+
+                start = 0
+                while True:
+                    newline = chunk.find(b"\n", start)
+                    piece = chunk[start:] if newline < 0 else chunk[start:newline]
+
+                    if spill is not None:
+                        spill.feed(piece)
+                    else:
+                        buffer += piece
+                        if len(buffer) > self.max_message_bytes:
+                            spill = self.spool.new_writer(self.preview_chars)
+                            spill.feed(bytes(buffer))
+                            buffer = bytearray()
+
+                    if newline < 0:
+                        break
+                    start = newline + 1
+
+                    if spill is not None:
+                        self._finish_spill(spill)
+                        spill = None
+                        if self._recycle:
+                            return
+                    else:
+                        line, buffer = bytes(buffer), bytearray()
+                        await self._handle_line(line)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"{self.name}: reader failed: {e}")
+        finally:
+            if spill is not None:
+                spill.close()
+                self.spool.discard(spill)
+            self._closed = True
+            if self._recycle:
+                self._fail_pending(ConnectionRecycled(f"{self.name}: connection recycled after an unmatched response"))
+            else:
+                self._fail_pending(ConnectionError(f"{self.name}: connection closed by server"))
+
+    async def _handle_line(self, line: bytes):
+        line = line.strip()
+        if not line:
+            return
+
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            self.logger.debug(f"{self.name}: ignoring non JSON-RPC output: {line[:200]!r}")
+            return
+
+        messages = message if isinstance(message, list) else [message]
+        for item in messages:
+            if isinstance(item, dict):
+                await self._dispatch(item)
+
+    def _finish_spill(self, spill: SpillWriter):
+        """Resolve the request an oversized message answers with a reference to the spilled text"""
+        request_id = spill.close()
+        if request_id is None and not spill.is_notification:
+            self._fail_unmatched_spill(spill)
+            return
+        if spill.is_batch and request_id in self._batch_members:
+            # The spilled text mixes every answer in the batch, so have each request sent again on its own
+            self.logger.info(f"{self.name}: spilled {spill.raw_size} byte batch response, retrying its requests")
+            self.spool.discard(spill)
+            self._fail_batch(
+                request_id,
+                JSONRPCError(BATCH_RETRY_INDIVIDUALLY, "Batch response too large, retry the request on its own"),
+            )
+            return
+
+        future = self._pending.pop(request_id, None)
+        if future is None or future.done():
+            self.logger.warning(
+                f"{self.name}: dropped oversized message ({spill.raw_size} bytes) with no pending request"
+            )
+            self.spool.discard(spill)
+            return
+
+        self.logger.info(f"{self.name}: spilled {spill.raw_size} byte response for request {request_id}")
+        future.set_result(self.spool.register(spill))
+
+    async def _dispatch(self, message: Dict):
+        method = message.get("method")
+        message_id = message.get("id")
+
+        if method is None:
+            if message_id is None and "error" in message:
+                error = message["error"] or {}
+                batches, singles = self._outstanding()
+                if len(batches) == 1 and not singles:
+                    # Servers without batch support answer the whole array with one id-less error
+                    self._fail_batch(
+                        batches[0][0],
+                        JSONRPCError(BATCH_REJECTED, f"Batch rejected: {error.get('message', 'Invalid Request')}"),
+                    )
+                else:
+                    # Cannot tell which request it answers; their timeouts or retries take over
+                    self.logger.warning(
+                        f"{self.name}: ignoring error without id ({error.get('message', 'no message')}) "
+                        f"while {len(batches)} batch(es) and {len(singles)} request(s) wait"
+                    )
+                return
+            future = self._pending.pop(message_id, None)
+            if future is None or future.done():
+                self.logger.debug(f"{self.name}: response for unknown request id {message_id}")
+                return
+            if "error" in message:
+                error = message["error"] or {}
+                future.set_exception(
+                    JSONRPCError(error.get("code", -32603), error.get("message", "Unknown error"), error.get("data"))
+                )
+            else:
+                future.set_result(message.get("result"))
+            return
+
+        if message_id is None:
+            for handler in self._notification_handlers.get(method, []):
+                try:
+                    handler(message.get("params") or {})
+                except Exception as e:
+                    self.logger.error(f"{self.name}: notification handler for {method} failed: {e}")
+            return
+
+        # Requests initiated by the server: answer pings, reject everything else
+        if method == "ping":
+            reply = {"jsonrpc": "2.0", "id": message_id, "result": {}}
+        else:
+            reply = {
+                "jsonrpc": "2.0",
+                "id": message_id,
+                "error": {"code": -32601, "message": f"Method not found: {method}"},
+            }
+        try:
+            await self._send(reply)
+        except Exception as e:
+            self.logger.warning(f"{self.name}: failed to answer server request {method}: {e}")
+
+    def _fail_batch(self, request_id: int, error: Exception):
+        for member_id in self._batch_members.get(request_id, []):
+            future = self._pending.get(member_id)
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    def _fail_unmatched_spill(self, spill: SpillWriter):
+        """Handle an oversized response whose id could not be read, so no caller waits for its timeout"""
+        self.spool.discard(spill)
+        # A batch response can only answer a batch, and vice versa
+        batches, singles = self._outstanding()
+        owners = batches if spill.is_batch else singles
+
+        if not owners:
+            self.logger.warning(
+                f"{self.name}: dropped oversized message ({spill.raw_size} bytes) with no pending request"
+            )
+        elif len(owners) == 1 and spill.is_batch:
+            self._fail_batch(
+                owners[0][0],
+                JSONRPCError(BATCH_RETRY_INDIVIDUALLY, "Batch response too large, retry the request on its own"),
+            )
+        elif len(owners) == 1:
+            self._pending.pop(owners[0]).set_exception(JSONRPCError(
+                MESSAGE_TOO_LARGE,
+                f"Response of {spill.raw_size} bytes exceeded the {self.max_message_bytes} byte limit",
+            ))
+        else:
+            # Any of several requests may own it, and they belong to different callers; rather
+            # than fail them with someone else's error, give up the connection so they are resent
+            self.logger.warning(
+                f"{self.name}: oversized response ({spill.raw_size} bytes) without a readable id "
+                f"while {len(owners)} requests wait, recycling the connection"
+            )
+            self._recycle = True
+
+    def _outstanding(self) -> Tuple[List[List[int]], List[int]]:
+        """Batches (as their member ids) and single requests still waiting for an answer"""
+        waiting = {request_id for request_id, future in self._pending.items() if not future.done()}
+        # Members of one batch share a list
+        batches = [
+            members for members in {id(members): members for members in self._batch_members.values()}.values()
+            if waiting.intersection(members)
+        ]
+        batched = {member for members in batches for member in members}
+        return batches, [request_id for request_id in waiting if request_id not in batched]
+
+    def _fail_pending(self, error: Exception):
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
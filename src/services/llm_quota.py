@@ -0,0 +1,358 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from mcp_metrics import metrics
+from token_ledger import token_ledger
+from tracing import tracer
+
+# Priority classes; lower runs first
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# gemini-2.0-flash free tier
+DEFAULT_RPM = 15
+DEFAULT_TPM = 1_000_000
+# Share of both budgets that batch work leaves untouched for interactive calls
+DEFAULT_INTERACTIVE_RESERVE = 0.2
+# Charged up front for the reply, corrected once the real usage is known
+DEFAULT_OUTPUT_TOKENS = 1024
+DEFAULT_MAX_RETRIES = 5
+# Used when a 429 carries no retry delay
+DEFAULT_RETRY_AFTER = 30.0
+# Async waiters re-check at least this often, since a release cannot wake them directly
+ASYNC_POLL_SECONDS = 0.25
+
+WAIT_SECONDS = metrics.histogram(
+    "edugpt_llm_queue_wait_seconds", "Time LLM calls waited for rate limit budget", ("priority",)
+)
+LLM_CALLS = metrics.counter(
+    "edugpt_llm_calls_total", "LLM calls by priority and outcome (ok, rate_limited, error)", ("priority", "outcome")
+)
+LLM_TOKENS = metrics.counter("edugpt_llm_tokens_total", "Tokens used by LLM calls", ("priority",))
+
+
+def estimate_tokens(value: Any) -> int:
+    """Rough token count of a prompt: a string, a message, or a list of either (about 4 chars per token)"""
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_tokens(item) for item in value)
+    if isinstance(value, dict):
+        return sum(estimate_tokens(item) for item in value.values())
+    text = value if isinstance(value, str) else getattr(value, "content", str(value))
+    return len(text if isinstance(text, str) else str(text)) // 4 + 1
+
+
+def usage_tokens(result: Any) -> Optional[int]:
+    """Total tokens reported by the provider for a model result, if any"""
+    usage = getattr(result, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens")
+    return None
+
+
+def usage_breakdown(result: Any) -> Optional[tuple]:
+    """(input, output) tokens reported by the provider for a model result, if any"""
+    usage = getattr(result, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    return None
+
+
+def rate_limit_delay(error: Exception) -> Optional[float]:
+    """Seconds to wait if the error is a rate limit (HTTP 429 / RESOURCE_EXHAUSTED), else None"""
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    text = str(error)
+    if status != 429 and not re.search(r"\b429\b|RESOURCE_EXHAUSTED|ResourceExhausted", text):
+        return None
+
+    if getattr(error, "retry_after", None):
+        return float(error.retry_after)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("Retry-After"):
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+    # Gemini puts the delay in the message ("Please retry in 37.2s") or in retry_delay { seconds: 37 }
+    match = re.search(r"retry in ([\d.]+)\s*s", text, re.IGNORECASE) or re.search(
+        r"retry_delay\s*\{\s*seconds:\s*(\d+)", text
+    )
+    return float(match.group(1)) if match else DEFAULT_RETRY_AFTER
+
+
+class _Bucket:
+    """Token bucket refilled continuously up to one minute's budget"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, amount: float) -> float:
+        return max(0.0, (amount - self.level) / self.rate) if self.rate else float("inf")
+
+
+class Permit:
+    """Budget granted for one call; settle it with the real usage once known"""
+
+    def __init__(self, scheduler: "QuotaScheduler", priority: int, tokens: int, waited: float = 0.0):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.tokens = tokens
+        # Seconds the call queued for budget
+        self.waited = waited
+
+    def settle(self, actual_tokens: Optional[int]):
+        if actual_tokens is not None:
+            self.scheduler._adjust(actual_tokens - self.tokens)
+            self.tokens = actual_tokens
+        LLM_TOKENS.inc(self.tokens, priority=PRIORITY_NAMES.get(self.priority, str(self.priority)))
+
+
+class QuotaScheduler:
+    """Process-wide gate for LLM calls: requests/min and tokens/min budgets handed out by priority.
+
+    Waiting calls are served strictly in priority order, then arrival order, and
+    batch calls may not dig into the share reserved for interactive ones. A 429
+    from the provider pauses every call until its retry delay has passed. Works
+    from threads (``call``) and from coroutines (``acall``).
+    """
+
+    def __init__(
+        self,
+        rpm: float = DEFAULT_RPM,
+        tpm: float = DEFAULT_TPM,
+        interactive_reserve: float = DEFAULT_INTERACTIVE_RESERVE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.interactive_reserve = interactive_reserve
+        self.max_retries = max_retries
+        self.paused_until = 0.0
+        self.logger = logging.getLogger(__name__)
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls) -> "QuotaScheduler":
+        return cls(
+            rpm=float(os.environ.get("GEMINI_RPM", DEFAULT_RPM)),
+            tpm=float(os.environ.get("GEMINI_TPM", DEFAULT_TPM)),
+            interactive_reserve=float(os.environ.get("GEMINI_INTERACTIVE_RESERVE", DEFAULT_INTERACTIVE_RESERVE)),
+        )
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    def acquire(self, tokens: int, priority: int = BATCH) -> Permit:
+        """Block the calling thread until the call may go out"""
+        started = time.monotonic()
+        entry = self._enqueue(priority)
+        with self._condition:
+            while True:
+                delay = self._try_grant(entry, tokens)
+                if delay is None:
+                    break
+                self._condition.wait(delay)
+        waited = time.monotonic() - started
+        WAIT_SECONDS.observe(waited, priority=PRIORITY_NAMES.get(priority, str(priority)))
+        return Permit(self, priority, tokens, waited)
+
+    async def acquire_async(self, tokens: int, priority: int = INTERACTIVE) -> Permit:
+        """Wait without blocking the event loop until the call may go out"""
+        started = time.monotonic()
+        entry = self._enqueue(priority)
+        try:
+            while True:
+                with self._condition:
+                    delay = self._try_grant(entry, tokens)
+                if delay is None:
+                    break
+                await asyncio.sleep(min(delay, ASYNC_POLL_SECONDS))
+        except asyncio.CancelledError:
+            self._dequeue(entry)
+            raise
+        waited = time.monotonic() - started
+        WAIT_SECONDS.observe(waited, priority=PRIORITY_NAMES.get(priority, str(priority)))
+        return Permit(self, priority, tokens, waited)
+
+    def call(self, fn: Callable[[], Any], tokens: int, priority: int = BATCH) -> Any:
+        """Run a blocking LLM call under the budget, retrying it after rate limit errors"""
+        with self._span(tokens, priority) as span:
+            for attempt in range(self.max_retries + 1):
+                permit = self.acquire(tokens + DEFAULT_OUTPUT_TOKENS, priority)
+                started = time.monotonic()
+                try:
+                    result = fn()
+                except Exception as e:
+                    if not self._handle_error(e, permit, attempt, span):
+                        raise
+                    continue
+                self._record_success(permit, result, span, tokens, time.monotonic() - started)
+                return result
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], tokens: int, priority: int = INTERACTIVE) -> Any:
+        """Await an LLM call under the budget, retrying it after rate limit errors"""
+        with self._span(tokens, priority) as span:
+            for attempt in range(self.max_retries + 1):
+                permit = await self.acquire_async(tokens + DEFAULT_OUTPUT_TOKENS, priority)
+                started = time.monotonic()
+                try:
+                    result = await fn()
+                except Exception as e:
+                    if not self._handle_error(e, permit, attempt, span):
+                        raise
+                    continue
+                self._record_success(permit, result, span, tokens, time.monotonic() - started)
+                return result
+
+    async def astream(
+        self, start: Callable[[], AsyncIterator[Any]], tokens: int, priority: int = INTERACTIVE
+    ) -> AsyncIterator[Any]:
+        """Stream an LLM reply under the budget; a rate limit is retried only before the first chunk"""
+        with self._span(tokens, priority, streaming=True) as span:
+            for attempt in range(self.max_retries + 1):
+                permit = await self.acquire_async(tokens + DEFAULT_OUTPUT_TOKENS, priority)
+                span.set(wait_seconds=round(permit.waited, 4))
+                used = [0, 0]
+                text = ""
+                started = False
+                began = time.monotonic()
+                try:
+                    async for chunk in start():
+                        started = True
+                        reported = usage_breakdown(chunk)
+                        if reported:
+                            used = [used[0] + reported[0], used[1] + reported[1]]
+                        text += chunk if isinstance(chunk, str) else str(getattr(chunk, "content", ""))
+                        yield chunk
+                except Exception as e:
+                    if started or not self._handle_error(e, permit, attempt, span):
+                        if started:
+                            permit.settle(sum(used) or None)
+                        raise
+                    continue
+                permit.settle(sum(used) or None)
+                estimated = not any(used)
+                if estimated:
+                    used = [tokens, estimate_tokens(text)]
+                span.add_tokens(*used)
+                span.set(attempts=attempt + 1)
+                token_ledger.record(*used, time.monotonic() - began, estimated, priority=PRIORITY_NAMES.get(priority))
+                LLM_CALLS.inc(priority=PRIORITY_NAMES.get(priority, str(priority)), outcome="ok")
+                return
+
+    def pause(self, seconds: float):
+        """Hold back every call for a while, e.g. after the provider answered 429"""
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+    def status(self) -> dict:
+        with self._condition:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return {
+                "requests_available": round(self.requests.level, 2),
+                "tokens_available": round(self.tokens.level),
+                "waiting": len(self._waiting),
+                "paused_for": round(max(0.0, self.paused_until - now), 1),
+            }
+
+    def _span(self, tokens: int, priority: int, **attributes: Any):
+        return tracer.span(
+            "llm.call", priority=PRIORITY_NAMES.get(priority, str(priority)), estimated_input_tokens=tokens, **attributes
+        )
+
+    def _handle_error(self, error: Exception, permit: Permit, attempt: int, span: Any) -> bool:
+        """Pause and tell the caller to retry if the error is a rate limit it may still retry"""
+        priority = PRIORITY_NAMES.get(permit.priority, str(permit.priority))
+        span.set(attempts=attempt + 1)
+        delay = rate_limit_delay(error)
+        if delay is None:
+            LLM_CALLS.inc(priority=priority, outcome="error")
+            permit.settle(0)
+            return False
+        LLM_CALLS.inc(priority=priority, outcome="rate_limited")
+        permit.settle(0)
+        self.logger.warning(f"LLM rate limited ({priority}), pausing all calls for {delay:.1f}s")
+        self.pause(delay)
+        return attempt < self.max_retries
+
+    def _record_success(self, permit: Permit, result: Any, span: Any, estimated_input: int, seconds: float):
+        permit.settle(usage_tokens(result))
+        used = usage_breakdown(result)
+        estimated = used is None
+        if estimated:
+            # Without provider usage, fall back to the same estimate the budget used
+            text = result.get("text", "") if isinstance(result, dict) else getattr(result, "content", result)
+            used = (estimated_input, estimate_tokens(text))
+        span.add_tokens(*used)
+        span.set(wait_seconds=round(permit.waited, 4))
+        token_ledger.record(*used, seconds, estimated, priority=PRIORITY_NAMES.get(permit.priority))
+        LLM_CALLS.inc(priority=PRIORITY_NAMES.get(permit.priority, str(permit.priority)), outcome="ok")
+
+    def _enqueue(self, priority: int) -> list:
+        entry = [priority, next(self._sequence)]
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+        return entry
+
+    def _dequeue(self, entry: list):
+        with self._condition:
+            if entry in self._waiting:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+    def _try_grant(self, entry: list, tokens: int) -> Optional[float]:
+        """Take the budget if this caller is first in line; otherwise return how long to wait. Holds the lock"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self._waiting[0] is not entry:
+            # Someone ahead will notify when it is served
+            return ASYNC_POLL_SECONDS
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        # A single call larger than a minute's budget could never fit; let it through on a full bucket
+        tokens = min(tokens, self.tokens.capacity)
+        reserve = self.interactive_reserve if entry[0] != INTERACTIVE else 0.0
+        needed_requests = min(1 + reserve * self.requests.capacity, self.requests.capacity)
+        needed_tokens = min(tokens + reserve * self.tokens.capacity, self.tokens.capacity)
+        wait = max(self.requests.seconds_until(needed_requests), self.tokens.seconds_until(needed_tokens))
+        if wait > 0:
+            return wait
+        self.requests.level -= 1
+        self.tokens.level -= tokens
+        heapq.heappop(self._waiting)
+        self._condition.notify_all()
+        return None
+
+    def _adjust(self, tokens: int):
+        with self._condition:
+            self.tokens.level -= tokens
+            self._condition.notify_all()
+
+
+# Shared by every LLM call in the process: chat turns, syllabus generation and assessments
+llm_scheduler = QuotaScheduler.from_env()
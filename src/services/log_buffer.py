@@ -0,0 +1,44 @@
+import collections
+import time
+from typing import Any, Dict, List
+
+DEFAULT_LOG_LINES = 200
+DEFAULT_LOG_LINE_CHARS = 500
+
+
+class LogRingBuffer:
+    """The most recent log lines of a server, bounded in both line count and line length"""
+
+    def __init__(self, max_lines: int = DEFAULT_LOG_LINES, max_line_chars: int = DEFAULT_LOG_LINE_CHARS):
+        self.max_lines = max_lines
+        self.max_line_chars = max_line_chars
+        self.total_lines = 0
+        self._lines = collections.deque(maxlen=max_lines)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "LogRingBuffer":
+        return cls(
+            int(config.get("log_lines", DEFAULT_LOG_LINES)),
+            int(config.get("log_line_chars", DEFAULT_LOG_LINE_CHARS)),
+        )
+
+    @property
+    def dropped(self) -> int:
+        """Lines that were pushed out of the buffer by newer ones"""
+        return self.total_lines - len(self._lines)
+
+    def append(self, source: str, text: str, truncated: bool = False):
+        text = text.rstrip()
+        if len(text) > self.max_line_chars:
+            text, truncated = text[:self.max_line_chars], True
+        if truncated:
+            text += " ...[truncated]"
+        self._lines.append(f"{time.strftime('%H:%M:%S')} [{source}] {text}")
+        self.total_lines += 1
+
+    def lines(self, limit: int = None) -> List[str]:
+        lines = list(self._lines)
+        return lines[-limit:] if limit else lines
+
+    def clear(self):
+        self._lines.clear()
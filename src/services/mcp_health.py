@@ -0,0 +1,95 @@
+import time
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RESET_TIMEOUT = 30.0
+
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAX = 60.0
+
+
+class CircuitBreaker:
+    """Per-server circuit breaker so calls to a broken server fail immediately.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. It then lets a single trial
+    call through (half open) and closes again if that call succeeds. A trial
+    that never reports back (cancelled, or lost) frees its slot after another
+    ``reset_timeout``, so the server cannot stay locked out.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "CircuitBreaker":
+        breaker_config = config.get("circuit_breaker") or {}
+        return cls(
+            failure_threshold=int(breaker_config.get("failure_threshold", DEFAULT_FAILURE_THRESHOLD)),
+            reset_timeout=float(breaker_config.get("reset_timeout", DEFAULT_RESET_TIMEOUT)),
+        )
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may go through right now"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and (
+            not self._trial_in_flight or time.monotonic() - self._trial_started >= self.reset_timeout
+        ):
+            self._trial_in_flight = True
+            self._trial_started = time.monotonic()
+            return True
+        return False
+
+    def release_trial(self):
+        """Give back the half-open trial without a verdict, e.g. when the call was cancelled"""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def trip(self):
+        """Open the breaker immediately, e.g. when the server process died"""
+        self.failures = max(self.failures, self.failure_threshold)
+        self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def retry_in(self) -> float:
+        """Seconds until the breaker lets a trial call through"""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+def restart_backoff(attempt: int, config: Dict[str, Any]) -> float:
+    """Exponential delay before restart attempt number ``attempt`` (1-based)"""
+    restart_config = config.get("restart") or {}
+    base = float(restart_config.get("backoff_base", DEFAULT_BACKOFF_BASE))
+    cap = float(restart_config.get("backoff_max", DEFAULT_BACKOFF_MAX))
+    return min(cap, base * (2 ** max(0, attempt - 1)))
@@ -0,0 +1,423 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from jsonrpc_client import DEFAULT_MAX_MESSAGE_BYTES, ConnectionRecycled, JSONRPCClient
+from log_buffer import LogRingBuffer
+from mcp_transports import StreamableHTTPClient, connect_websocket
+from process_lifecycle import USE_PROCESS_GROUPS, process_registry
+from result_spool import DEFAULT_PREVIEW_CHARS
+
+DEFAULT_STARTUP_TIMEOUT = 60.0
+MCP_PROTOCOL_VERSION = "2024-11-05"
+CLIENT_INFO = {"name": "EduGPT", "version": "0.1"}
+
+DEFAULT_SCALE_UP_QUEUE_DEPTH = 2
+DEFAULT_SCALE_DOWN_IDLE_SECONDS = 60.0
+STDERR_CHUNK_BYTES = 16 * 1024
+
+
+class MCPWorker:
+    """One connection to an MCP server and the JSON-RPC client talking over it.
+
+    With the default ``transport: stdio`` the worker owns a server subprocess;
+    ``transport: websocket`` and ``transport: http`` connect to a running
+    server at ``url`` instead.
+    """
+
+    def __init__(
+        self,
+        server_id: str,
+        index: int,
+        config: Dict[str, Any],
+        default_timeout: float,
+        notification_handlers: Optional[Dict[str, List[Callable[[Dict], Any]]]] = None,
+        logs: Optional[LogRingBuffer] = None
+    ):
+        self.server_id = server_id
+        self.index = index
+        self.config = config
+        self.default_timeout = default_timeout
+        self.notification_handlers = notification_handlers or {}
+        self.logs = logs or LogRingBuffer.from_config(config)
+        self.logger = logging.getLogger(__name__)
+        self.name = f"{server_id}#{index}"
+        self.transport = config.get("transport", "stdio")
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.client: Optional[Union[JSONRPCClient, StreamableHTTPClient]] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        self.outstanding = 0
+        self.last_used = time.monotonic()
+        self.server_info: Dict[str, Any] = {}
+        self.capabilities: Dict[str, Any] = {}
+        self.protocol_version: Optional[str] = None
+
+    @property
+    def alive(self) -> bool:
+        if self.transport == "stdio" and (self.process is None or self.process.returncode is not None):
+            return False
+        return self.client is not None and not self.client.closed
+
+    async def start(self):
+        """Spawn or connect to the server and complete the MCP initialize handshake"""
+        startup_timeout = self.config.get("startup_timeout", DEFAULT_STARTUP_TIMEOUT)
+        try:
+            await asyncio.wait_for(self._spawn_and_initialize(startup_timeout), startup_timeout)
+        except BaseException as e:
+            await self.stop()
+            if isinstance(e, asyncio.TimeoutError):
+                raise TimeoutError(f"{self.name} not ready after {startup_timeout}s")
+            raise
+
+    async def _spawn_and_initialize(self, startup_timeout: float):
+        if self.transport == "websocket":
+            self.client = await connect_websocket(self.name, self.config, self.default_timeout)
+        elif self.transport == "http":
+            self.client = StreamableHTTPClient.from_config(self.name, self.config, self.default_timeout)
+        elif self.transport == "stdio":
+            self.client = await self._spawn()
+        else:
+            raise ValueError(f"Unknown transport '{self.transport}' for {self.server_id}")
+
+        for method, handlers in self.notification_handlers.items():
+            for handler in handlers:
+                self.client.on_notification(method, handler)
+        self.client.start()
+
+        result = await self.client.request(
+            "initialize",
+            {
+                "protocolVersion": MCP_PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": CLIENT_INFO,
+            },
+            timeout=startup_timeout,
+        ) or {}
+        self.protocol_version = result.get("protocolVersion")
+        self.capabilities = result.get("capabilities") or {}
+        self.server_info = result.get("serverInfo") or {}
+        await self.client.notify("notifications/initialized")
+
+    async def _spawn(self) -> JSONRPCClient:
+        command = [self.config["command"]] + self.config.get("args", [])
+        self.process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # The server's configured env wins over the inherited environment
+            env={**os.environ, **self.config.get("env", {})},
+            # Own process group, so stopping the server also stops the processes it started
+            start_new_session=USE_PROCESS_GROUPS
+        )
+        process_registry.track(self.process.pid, self.name, command)
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+        return JSONRPCClient(
+            self.process.stdout,
+            self.process.stdin,
+            name=self.name,
+            default_timeout=self.config.get("timeout", self.default_timeout),
+            max_message_bytes=self.config.get("max_result_bytes", DEFAULT_MAX_MESSAGE_BYTES),
+            preview_chars=self.config.get("result_preview_chars", DEFAULT_PREVIEW_CHARS)
+        )
+
+    async def _drain_stderr(self):
+        """Keep reading stderr so a chatty server never blocks on a full pipe; keep the tail as logs"""
+        partial = bytearray()
+        truncated = False
+        # Bytes beyond this per line are dropped before they are ever decoded
+        max_line_bytes = self.logs.max_line_chars * 4
+        try:
+            while True:
+                chunk = await self.process.stderr.read(STDERR_CHUNK_BYTES)
+                if not chunk:
+                    break
+                start = 0
+                while True:
+                    newline = chunk.find(b"\n", start)
+                    piece = chunk[start:] if newline < 0 else chunk[start:newline]
+                    room = max_line_bytes - len(partial)
+                    if len(piece) > room:
+                        truncated = True
+                    partial += piece[:max(room, 0)]
+                    if newline < 0:
+                        break
+                    start = newline + 1
+                    self.logs.append(self.name, partial.decode("utf-8", errors="replace"), truncated)
+                    partial, truncated = bytearray(), False
+            if partial:
+                self.logs.append(self.name, partial.decode("utf-8", errors="replace"), truncated)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.debug(f"Stopped reading stderr of {self.name}: {e}")
+
+    async def request(self, method: str, params: Optional[Dict] = None, timeout: Optional[float] = None) -> Any:
+        self.outstanding += 1
+        self.last_used = time.monotonic()
+        try:
+            return await self.client.request(method, params, timeout=timeout)
+        finally:
+            self.outstanding -= 1
+            self.last_used = time.monotonic()
+
+    async def ping(self, timeout: Optional[float] = None):
+        """Liveness probe; unlike request() it leaves last_used alone, so idle workers still scale down"""
+        await self.client.request("ping", timeout=timeout)
+
+    async def request_batch(self, calls: List[Tuple[str, Optional[Dict]]], timeout: Optional[float] = None) -> List[Any]:
+        self.outstanding += len(calls)
+        self.last_used = time.monotonic()
+        try:
+            return await self.client.request_batch(calls, timeout=timeout)
+        finally:
+            self.outstanding -= len(calls)
+            self.last_used = time.monotonic()
+
+    async def stop(self):
+        """Close the client and terminate the process"""
+        if self.client is not None:
+            await self.client.close()
+            if self.transport == "websocket":
+                # The reader stopped with the client; the socket itself is still open
+                await self.client.writer.close()
+        if self.process is not None:
+            await process_registry.terminate(
+                self.process, self.config.get("terminate_grace", process_registry.terminate_grace)
+            )
+        if self._stderr_task is not None:
+            # Give the drainer a moment to record the server's last words
+            try:
+                await asyncio.wait_for(self._stderr_task, 1.0)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+
+
+class ServerPool:
+    """Pool of identical workers for one MCP server with least-outstanding routing.
+
+    The pool grows by one worker whenever the average number of outstanding
+    requests per worker reaches ``scale_up_queue_depth`` and shrinks back
+    towards ``min_workers`` once extra workers have been idle for
+    ``scale_down_idle_seconds``.
+    """
+
+    def __init__(
+        self, server_id: str, config: Dict[str, Any], default_timeout: float, logs: Optional[LogRingBuffer] = None
+    ):
+        self.server_id = server_id
+        self.config = config
+        self.default_timeout = default_timeout
+        self.logger = logging.getLogger(__name__)
+        # Shared by all workers so the recent stderr of the whole server reads in order
+        self.logs = logs or LogRingBuffer.from_config(config)
+
+        pool_config = config.get("pool") or {}
+        self.min_workers = max(1, int(pool_config.get("min_workers", 1)))
+        max_workers = pool_config.get("max_workers", self.min_workers)
+        if max_workers == "auto":
+            max_workers = os.cpu_count() or 1
+        self.max_workers = max(self.min_workers, int(max_workers))
+        self.scale_up_queue_depth = max(1, int(pool_config.get("scale_up_queue_depth", DEFAULT_SCALE_UP_QUEUE_DEPTH)))
+        self.scale_down_idle_seconds = float(
+            pool_config.get("scale_down_idle_seconds", DEFAULT_SCALE_DOWN_IDLE_SECONDS)
+        )
+
+        self.workers: List[MCPWorker] = []
+        self.notification_handlers: Dict[str, List[Callable[[Dict], Any]]] = {}
+        self._next_index = 0
+        self._closed = False
+        self._scale_task: Optional[asyncio.Task] = None
+        self._scaler_task: Optional[asyncio.Task] = None
+        self._recycle_lock = asyncio.Lock()
+
+    @property
+    def outstanding(self) -> int:
+        return sum(worker.outstanding for worker in self.workers)
+
+    def on_notification(self, method: str, handler: Callable[[Dict], Any]):
+        """Register a notification callback on current and future workers"""
+        self.notification_handlers.setdefault(method, []).append(handler)
+        for worker in self.workers:
+            if worker.client is not None:
+                worker.client.on_notification(method, handler)
+
+    async def start(self):
+        """Start the minimum number of workers"""
+        results = await asyncio.gather(
+            *[self._add_worker() for _ in range(self.min_workers)],
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if not self.workers:
+            raise errors[0] if errors else RuntimeError(f"No workers started for {self.server_id}")
+        for error in errors:
+            self.logger.warning(f"Worker for {self.server_id} failed to start: {error}")
+
+        if self.max_workers > self.min_workers:
+            self._scaler_task = asyncio.create_task(self._scale_down_loop())
+
+    async def request(self, method: str, params: Optional[Dict] = None, timeout: Optional[float] = None) -> Any:
+        """Route a request to the worker with the fewest outstanding requests"""
+        worker = self._pick_worker()
+        if worker is None:
+            raise ConnectionError(f"No live workers for {self.server_id}")
+        self._maybe_scale_up()
+        try:
+            return await worker.request(method, params, timeout=timeout)
+        except ConnectionRecycled:
+            # Not answered by the old connection, so sent once more on a fresh one
+            replacement = await self._replace_recycled(worker)
+            if replacement is None:
+                raise
+            return await replacement.request(method, params, timeout=timeout)
+
+    async def request_batch(self, calls: List[Tuple[str, Optional[Dict]]], timeout: Optional[float] = None) -> List[Any]:
+        """Send a JSON-RPC batch to a single worker; see ``JSONRPCClient.request_batch``"""
+        worker = self._pick_worker()
+        if worker is None:
+            raise ConnectionError(f"No live workers for {self.server_id}")
+        self._maybe_scale_up()
+        results = await worker.request_batch(calls, timeout=timeout)
+        retry = [index for index, result in enumerate(results) if isinstance(result, ConnectionRecycled)]
+        if retry:
+            replacement = await self._replace_recycled(worker)
+            if replacement is not None:
+                retried = await replacement.request_batch([calls[index] for index in retry], timeout=timeout)
+                for index, result in zip(retry, retried):
+                    results[index] = result
+        return results
+
+    async def close(self):
+        """Stop all workers"""
+        self._closed = True
+        if self._scaler_task is not None:
+            self._scaler_task.cancel()
+            self._scaler_task = None
+        if self._scale_task is not None:
+            # A worker that is still starting would otherwise join the pool after it stopped
+            self._scale_task.cancel()
+            try:
+                await self._scale_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._scale_task = None
+        workers, self.workers = self.workers, []
+        await asyncio.gather(*[worker.stop() for worker in workers], return_exceptions=True)
+
+    @property
+    def live_workers(self) -> int:
+        return sum(1 for worker in self.workers if worker.alive)
+
+    async def check_health(self, ping_timeout: float) -> int:
+        """Drop dead or unresponsive workers and return how many were removed"""
+        async def probe(worker: MCPWorker) -> bool:
+            if not worker.alive:
+                return False
+            if worker.outstanding:
+                # Busy workers are answering requests; a ping could queue behind them
+                return True
+            try:
+                await worker.ping(ping_timeout)
+                return True
+            except Exception:
+                return False
+
+        workers = list(self.workers)
+        healthy = await asyncio.gather(*[probe(worker) for worker in workers])
+        removed = [worker for worker, ok in zip(workers, healthy) if not ok]
+        for worker in removed:
+            if worker in self.workers:
+                self.workers.remove(worker)
+            self.logger.warning(f"Removing unhealthy MCP worker {worker.name}")
+            await worker.stop()
+        return len(removed)
+
+    async def replenish(self):
+        """Start workers until the pool is back at its minimum size"""
+        missing = self.min_workers - self.live_workers
+        if missing <= 0:
+            return
+        results = await asyncio.gather(
+            *[self._add_worker() for _ in range(missing)],
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors and not self.live_workers:
+            raise errors[0]
+
+    @property
+    def server_info(self) -> Dict[str, Any]:
+        return self.workers[0].server_info if self.workers else {}
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self.workers),
+            "min_workers": self.min_workers,
+            "max_workers": self.max_workers,
+            "live_workers": self.live_workers,
+            "outstanding": self.outstanding,
+        }
+
+    def _maybe_scale_up(self):
+        if (
+            not self._closed
+            and (self._scale_task is None or self._scale_task.done())
+            and len(self.workers) < self.max_workers
+            and self.outstanding >= self.scale_up_queue_depth * len(self.workers)
+        ):
+            self._scale_task = asyncio.create_task(self._scale_up())
+
+    def _pick_worker(self) -> Optional[MCPWorker]:
+        live = [worker for worker in self.workers if worker.alive]
+        if not live:
+            return None
+        return min(live, key=lambda worker: worker.outstanding)
+
+    async def _add_worker(self) -> MCPWorker:
+        worker = MCPWorker(
+            self.server_id, self._next_index, self.config, self.default_timeout, self.notification_handlers, self.logs
+        )
+        self._next_index += 1
+        await worker.start()
+        if self._closed:
+            await worker.stop()
+            raise ConnectionError(f"Pool for {self.server_id} closed while {worker.name} was starting")
+        self.workers.append(worker)
+        return worker
+
+    async def _replace_recycled(self, worker: MCPWorker) -> Optional[MCPWorker]:
+        """Retire a worker whose client gave up its connection and return a live one to retry on"""
+        async with self._recycle_lock:
+            if worker in self.workers:
+                self.workers.remove(worker)
+                self.logger.warning(f"Recycling MCP worker {worker.name}")
+                await worker.stop()
+            if not self.live_workers:
+                try:
+                    await self.replenish()
+                except Exception as e:
+                    self.logger.error(f"Could not replace recycled worker of {self.server_id}: {e}")
+        return self._pick_worker()
+
+    async def _scale_up(self):
+        try:
+            worker = await self._add_worker()
+            self.logger.info(f"Scaled up {self.server_id} to {len(self.workers)} workers ({worker.name})")
+        except Exception as e:
+            self.logger.error(f"Failed to scale up {self.server_id}: {e}")
+
+    async def _scale_down_loop(self):
+        interval = max(1.0, self.scale_down_idle_seconds / 2)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for worker in list(self.workers):
+                if len(self.workers) <= self.min_workers:
+                    break
+                if worker.outstanding == 0 and now - worker.last_used >= self.scale_down_idle_seconds:
+                    self.workers.remove(worker)
+                    self.logger.info(f"Scaled down {self.server_id} to {len(self.workers)} workers ({worker.name})")
+                    await worker.stop()
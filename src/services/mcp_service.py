@@ -1,83 +1,512 @@
 import asyncio
+import hashlib
 import logging
-from typing import Dict, List, Any, Optional
-import subprocess
+from typing import Dict, List, Any, Optional, Set, Tuple
 import json
-import os
+import time
+
+from jsonrpc_client import BATCH_REJECTED, BATCH_RETRY_INDIVIDUALLY, JSONRPCError
+from log_buffer import LogRingBuffer
+from mcp_health import CircuitBreaker, restart_backoff
+from mcp_metrics import metrics
+from mcp_pool import ServerPool
+from process_lifecycle import process_registry
+from state_store import StateStore, state_store
+
+DEFAULT_REQUEST_TIMEOUT = 30.0
+# Servers that are not marked warm are stopped after this many idle seconds
+DEFAULT_IDLE_TIMEOUT = 600.0
+MAX_REAP_INTERVAL = 30.0
+DEFAULT_HEALTH_CHECK_INTERVAL = 10.0
+DEFAULT_PING_TIMEOUT = 5.0
+# Removed or changed servers get this long to finish in-flight calls before they are stopped
+DEFAULT_DRAIN_TIMEOUT = 30.0
+# How long other workers may reuse a tool list published to the shared state store
+SHARED_TOOL_CATALOG_TTL = 3600.0
+
+REQUEST_SECONDS = metrics.histogram(
+    "edugpt_mcp_request_seconds", "Round trip of requests to MCP servers", ("server", "method")
+)
+REQUESTS = metrics.counter(
+    "edugpt_mcp_requests_total",
+    "Requests to MCP servers by outcome (ok, error, timeout, unavailable)",
+    ("server", "method", "outcome")
+)
+SERVER_STARTS = metrics.counter("edugpt_mcp_server_starts_total", "MCP server start attempts", ("server", "outcome"))
+STARTUP_SECONDS = metrics.histogram("edugpt_mcp_startup_seconds", "Time until an MCP server was ready", ("server",))
+WORKERS = metrics.gauge("edugpt_mcp_workers", "Live worker connections per MCP server", ("server",))
+OUTSTANDING = metrics.gauge("edugpt_mcp_outstanding_requests", "Requests waiting for an MCP server", ("server",))
+BREAKER_OPEN = metrics.gauge("edugpt_mcp_circuit_open", "1 while a server's circuit breaker is not closed", ("server",))
 
 class MCPService:
-    def __init__(self):
+    def __init__(
+        self,
+        default_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+        default_idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT,
+        health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL,
+        store: Optional[StateStore] = None
+    ):
+        self.configs: Dict[str, Dict[str, Any]] = {}
         self.servers: Dict[str, Any] = {}
+        self.default_timeout = default_timeout
+        self.default_idle_timeout = default_idle_timeout
+        self.health_check_interval = health_check_interval
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # tools/list results per server, kept until the server restarts or reports a change
+        self.tool_catalogs: Dict[str, List[Dict[str, Any]]] = {}
+        # Tool lists are also shared with other app workers, so they need not start a server to list it
+        self.store = store or state_store
+        # Servers configured with `batch: true` that turned out to reject JSON-RPC batches
+        self.batch_unsupported: Set[str] = set()
+        # Recent stderr lines per server, kept across restarts so crashes can be diagnosed
+        self.logs: Dict[str, LogRingBuffer] = {}
         self.logger = logging.getLogger(__name__)
+        self.startup_reports: Dict[str, Dict[str, Any]] = {}
+        self._start_locks: Dict[str, asyncio.Lock] = {}
+        self._reaper_task: Optional[asyncio.Task] = None
+        self._monitor_task: Optional[asyncio.Task] = None
+        metrics.add_collector(self._collect_metrics)
+    
+    def register_server(self, server_id: str, config: Dict[str, Any]):
+        """Register a server so it can be started on its first tool call"""
+        self.configs[server_id] = config
+        self.breakers[server_id] = CircuitBreaker.from_config(config)
+        if server_id not in self.logs:
+            self.logs[server_id] = LogRingBuffer.from_config(config)
+    
+    def idle_timeout(self, server_id: str) -> Optional[float]:
+        """Idle seconds after which a server is stopped, or None to keep it running"""
+        config = self.configs.get(server_id, {})
+        if "idle_timeout" in config:
+            return config["idle_timeout"]
+        # Hot servers stay up unless they ask for an idle timeout explicitly
+        return None if config.get("warm") else self.default_idle_timeout
+    
+    async def ensure_server(self, server_id: str) -> bool:
+        """Start a registered server unless it is already running"""
+        if server_id in self.servers:
+            return True
+        if server_id not in self.configs:
+            return False
+        
+        lock = self._start_locks.setdefault(server_id, asyncio.Lock())
+        async with lock:
+            if server_id in self.servers:
+                return True
+            return await self.start_server(server_id, self.configs[server_id])
+    
+    async def warm_up(self, server_ids: Optional[List[str]] = None) -> Dict[str, bool]:
+        """Start the given servers, or every server marked warm, ahead of the first call"""
+        if server_ids is None:
+            server_ids = [sid for sid, config in self.configs.items() if config.get("warm")]
+        
+        # Started concurrently, so warm-up takes as long as the slowest server
+        started = await asyncio.gather(*[self.ensure_server(sid) for sid in server_ids])
+        return dict(zip(server_ids, started))
     
     async def start_server(self, server_id: str, config: Dict[str, Any]) -> bool:
-        """Start an MCP server"""
+        """Start an MCP server and its worker pool, returning once the server is ready"""
+        started_at = time.monotonic()
         try:
-            command = [config["command"]] + config.get("args", [])
-            
-            # Start the MCP server process
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                env={**config.get("env", {}), **dict(os.environ)}
+            if server_id not in self.configs:
+                self.register_server(server_id, config)
+            pool = ServerPool(server_id, config, self.default_timeout, self.logs.get(server_id))
+            pool.on_notification(
+                "notifications/tools/list_changed",
+                lambda params: self.invalidate_tool_catalog(server_id)
             )
+            await pool.start()
+            latency = time.monotonic() - started_at
+            SERVER_STARTS.inc(server=server_id, outcome="ok")
+            STARTUP_SECONDS.observe(latency, server=server_id)
             
+            self.startup_reports[server_id] = {
+                "ready": True,
+                "latency": latency,
+                "server_info": pool.server_info,
+                "error": None
+            }
             self.servers[server_id] = {
-                "process": process,
+                "pool": pool,
                 "config": config,
-                "status": "running"
+                "status": "running",
+                "last_used": time.monotonic(),
+                "restart_attempts": 0,
+                "next_restart_at": 0.0
             }
+            self._restart_reaper()
+            if self._monitor_task is None or self._monitor_task.done():
+                self._monitor_task = asyncio.create_task(self._monitor_health())
             
-            self.logger.info(f"MCP server {server_id} started successfully")
+            self.logger.info(
+                f"MCP server {server_id} ready in {latency:.2f}s "
+                f"({len(pool.workers)} of max {pool.max_workers} workers)"
+            )
             return True
             
         except Exception as e:
+            SERVER_STARTS.inc(server=server_id, outcome="error")
+            self.startup_reports[server_id] = {
+                "ready": False,
+                "latency": time.monotonic() - started_at,
+                "server_info": {},
+                "error": str(e)
+            }
             self.logger.error(f"Failed to start MCP server {server_id}: {e}")
             return False
     
-    async def call_tool(self, server_id: str, tool_name: str, arguments: Dict) -> Dict:
+    async def call_tool(self, server_id: str, tool_name: str, arguments: Dict, timeout: Optional[float] = None) -> Dict:
         """Call a tool on specific MCP server"""
-        if server_id not in self.servers:
+        if server_id not in self.servers and server_id not in self.configs:
             return {"error": f"Server {server_id} not found"}
         
-        try:
-            # Simple MCP protocol implementation
-            request = {
-                "jsonrpc": "2.0",
-                "method": "tools/call",
-                "params": {
-                    "name": tool_name,
-                    "arguments": arguments
-                },
-                "id": 1
+        # Fail fast instead of holding up the teaching turn on a broken server
+        breaker = self.breakers[server_id]
+        if not breaker.allow():
+            REQUESTS.inc(server=server_id, method="tools/call", outcome="unavailable")
+            return {
+                "error": f"Server {server_id} unavailable (circuit open, retry in {breaker.retry_in():.0f}s)"
             }
+        
+        if not await self.ensure_server(server_id):
+            breaker.record_failure()
+            REQUESTS.inc(server=server_id, method="tools/call", outcome="unavailable")
+            return {"error": f"Server {server_id} failed to start"}
+        
+        server = self.servers[server_id]
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            server["last_used"] = time.monotonic()
+            result = await server["pool"].request(
+                "tools/call",
+                {"name": tool_name, "arguments": arguments},
+                timeout=timeout
+            )
+            breaker.record_success()
+            outcome = "ok"
+            return result or {}
             
-            process = self.servers[server_id]["process"]
-            process.stdin.write(json.dumps(request).encode() + b"\n")
-            await process.stdin.drain()
-            
-            # Read response
-            line = await process.stdout.readline()
-            response = json.loads(line.decode())
-            
-            return response.get("result", {})
-            
+        except asyncio.CancelledError:
+            breaker.release_trial()
+            outcome = "cancelled"
+            raise
+        except (ConnectionError, TimeoutError) as e:
+            breaker.record_failure()
+            outcome = "timeout" if isinstance(e, TimeoutError) else "error"
+            self.logger.error(f"Tool call failed: {e}")
+            return {"error": str(e)}
         except Exception as e:
+            # The server answered, so it is healthy even if the tool call failed
+            breaker.record_success()
             self.logger.error(f"Tool call failed: {e}")
             return {"error": str(e)}
+        finally:
+            server["last_used"] = time.monotonic()
+            self._observe_request(server_id, "tools/call", outcome, time.perf_counter() - started)
+    
+    async def call_tools_batch(
+        self, server_id: str, calls: List[Tuple[str, Dict]], timeout: Optional[float] = None
+    ) -> List[Dict]:
+        """Call several tools on one server, as a single JSON-RPC batch if the server has `batch: true`"""
+        config = self.configs.get(server_id, {})
+        if len(calls) <= 1 or not config.get("batch") or server_id in self.batch_unsupported:
+            # Requests are multiplexed over the server's connections, so these still overlap
+            return list(await asyncio.gather(*[
+                self.call_tool(server_id, tool_name, arguments, timeout=timeout) for tool_name, arguments in calls
+            ]))
+        
+        breaker = self.breakers[server_id]
+        if not breaker.allow():
+            error = f"Server {server_id} unavailable (circuit open, retry in {breaker.retry_in():.0f}s)"
+            return [{"error": error} for _ in calls]
+        if not await self.ensure_server(server_id):
+            breaker.record_failure()
+            return [{"error": f"Server {server_id} failed to start"} for _ in calls]
+        
+        server = self.servers[server_id]
+        started = time.perf_counter()
+        try:
+            server["last_used"] = time.monotonic()
+            responses = await server["pool"].request_batch(
+                [("tools/call", {"name": tool_name, "arguments": arguments}) for tool_name, arguments in calls],
+                timeout=timeout
+            )
+        except asyncio.CancelledError:
+            breaker.release_trial()
+            raise
+        except (ConnectionError, TimeoutError) as e:
+            breaker.record_failure()
+            self.logger.error(f"Batch tool call failed: {e}")
+            outcome = "timeout" if isinstance(e, TimeoutError) else "error"
+            self._observe_request(server_id, "batch", outcome, time.perf_counter() - started)
+            return [{"error": str(e)} for _ in calls]
+        finally:
+            server["last_used"] = time.monotonic()
+        self._observe_request(server_id, "batch", "ok", time.perf_counter() - started)
+        
+        results: List[Optional[Dict]] = []
+        retry = []
+        transport_failed = False
+        for index, response in enumerate(responses):
+            if isinstance(response, JSONRPCError) and response.code in (BATCH_REJECTED, BATCH_RETRY_INDIVIDUALLY):
+                if response.code == BATCH_REJECTED and server_id not in self.batch_unsupported:
+                    self.logger.warning(f"{server_id} does not accept JSON-RPC batches, sending calls one by one")
+                    self.batch_unsupported.add(server_id)
+                retry.append(index)
+                results.append(None)
+            elif isinstance(response, Exception):
+                transport_failed = transport_failed or isinstance(response, (ConnectionError, TimeoutError))
+                self.logger.error(f"Tool call {calls[index][0]} failed: {response}")
+                outcome = "timeout" if isinstance(response, TimeoutError) else "error"
+                REQUESTS.inc(server=server_id, method="tools/call", outcome=outcome)
+                results.append({"error": str(response)})
+            else:
+                REQUESTS.inc(server=server_id, method="tools/call", outcome="ok")
+                results.append(response or {})
+        
+        if transport_failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        
+        if retry:
+            retried = await asyncio.gather(*[
+                self.call_tool(server_id, *calls[index], timeout=timeout) for index in retry
+            ])
+            for index, result in zip(retry, retried):
+                results[index] = result
+        return results
+    
+    def cached_tools(self, server_id: str) -> Optional[List[Dict[str, Any]]]:
+        """A server's tool definitions if known without asking it (own or shared cache), else None"""
+        if server_id in self.tool_catalogs:
+            return self.tool_catalogs[server_id]
+        if server_id not in self.configs:
+            return []
+        shared = self.store.get(self._catalog_key(server_id))
+        if shared is None:
+            return None
+        self.tool_catalogs[server_id] = shared["tools"]
+        return shared["tools"]
+    
+    def is_running(self, server_id: str) -> bool:
+        return server_id in self.servers
+    
+    async def list_tools(self, server_id: str, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Get a server's tool definitions from tools/list, cached per server"""
+        cached = self.cached_tools(server_id)
+        if cached is not None:
+            return cached
+        if not self.breakers[server_id].allow():
+            return []
+        if not await self.ensure_server(server_id):
+            self.breakers[server_id].record_failure()
+            return []
+        
+        tools = []
+        cursor = None
+        started = time.perf_counter()
+        try:
+            while True:
+                params = {"cursor": cursor} if cursor else {}
+                result = await self.servers[server_id]["pool"].request("tools/list", params, timeout=timeout) or {}
+                tools.extend(result.get("tools", []))
+                cursor = result.get("nextCursor")
+                if not cursor:
+                    break
+        except asyncio.CancelledError:
+            self.breakers[server_id].release_trial()
+            raise
+        except Exception as e:
+            if isinstance(e, (ConnectionError, TimeoutError)):
+                self.breakers[server_id].record_failure()
+            outcome = "timeout" if isinstance(e, TimeoutError) else "error"
+            self._observe_request(server_id, "tools/list", outcome, time.perf_counter() - started)
+            self.logger.error(f"tools/list failed for {server_id}: {e}")
+            return []
+        
+        self._observe_request(server_id, "tools/list", "ok", time.perf_counter() - started)
+        self.breakers[server_id].record_success()
+        self.tool_catalogs[server_id] = tools
+        self.store.set(self._catalog_key(server_id), {"tools": tools}, ttl=SHARED_TOOL_CATALOG_TTL)
+        return tools
+    
+    def invalidate_tool_catalog(self, server_id: str):
+        """Forget a server's cached tool list so the next lookup asks the server again"""
+        if server_id in self.configs:
+            self.store.delete(self._catalog_key(server_id))
+        if self.tool_catalogs.pop(server_id, None) is not None:
+            self.logger.info(f"Tool list of MCP server {server_id} changed")
+    
+    def _catalog_key(self, server_id: str) -> str:
+        # Keyed by the config too, so a changed command or env never reuses the old list
+        config = json.dumps(self.configs[server_id], sort_keys=True, default=str)
+        return f"mcp_tools:{server_id}:{hashlib.sha1(config.encode()).hexdigest()[:16]}"
     
     def get_available_servers(self) -> List[str]:
-        return list(self.servers.keys())
+        return list(dict.fromkeys([*self.configs, *self.servers]))
+    
+    def get_startup_report(self, server_id: str) -> Dict[str, Any]:
+        """Readiness, handshake latency and server info from the last start attempt"""
+        return self.startup_reports.get(server_id, {})
+    
+    def get_server_status(self, server_id: str) -> str:
+        if server_id in self.servers:
+            return self.servers[server_id]["status"]
+        return "stopped (starts on demand)" if server_id in self.configs else "unknown"
+    
+    def get_server_logs(self, server_id: str, limit: Optional[int] = None) -> List[str]:
+        """Most recent stderr lines of a server's processes"""
+        logs = self.logs.get(server_id)
+        return logs.lines(limit) if logs else []
+    
+    def get_breaker_state(self, server_id: str) -> str:
+        breaker = self.breakers.get(server_id)
+        return breaker.state if breaker else "unknown"
+    
+    def get_pool_status(self, server_id: str) -> Dict[str, Any]:
+        """Get worker counts and outstanding requests for a server's pool"""
+        if server_id not in self.servers:
+            return {}
+        return self.servers[server_id]["pool"].status()
     
     async def stop_server(self, server_id: str):
         """Stop an MCP server"""
         if server_id in self.servers:
-            process = self.servers[server_id]["process"]
-            process.terminate()
-            await process.wait()
-            del self.servers[server_id]
+            server = self.servers.pop(server_id)
+            await server["pool"].close()
+    
+    async def remove_server(self, server_id: str, drain_timeout: float = DEFAULT_DRAIN_TIMEOUT):
+        """Unregister a server and stop it once its in-flight calls have finished"""
+        self.configs.pop(server_id, None)
+        self.breakers.pop(server_id, None)
+        self.tool_catalogs.pop(server_id, None)
+        self.startup_reports.pop(server_id, None)
+        self.batch_unsupported.discard(server_id)
+        self.logs.pop(server_id, None)
+        for gauge in (WORKERS, OUTSTANDING, BREAKER_OPEN):
+            gauge.remove(server=server_id)
+        server = self.servers.pop(server_id, None)
+        if server is not None:
+            await self._drain(server_id, server, drain_timeout)
+    
+    async def replace_server(
+        self, server_id: str, config: Dict[str, Any], drain_timeout: float = DEFAULT_DRAIN_TIMEOUT
+    ) -> bool:
+        """Switch a server to a new configuration, restarting it only if it was running"""
+        server = self.servers.pop(server_id, None)
+        self.tool_catalogs.pop(server_id, None)
+        self.batch_unsupported.discard(server_id)
+        self.register_server(server_id, config)
+        if server is None:
+            return True
+        
+        # New calls go to the new server while the old one finishes what it has
+        results = await asyncio.gather(
+            self.ensure_server(server_id),
+            self._drain(server_id, server, drain_timeout)
+        )
+        return results[0]
+    
+    async def _drain(self, server_id: str, server: Dict[str, Any], drain_timeout: float):
+        server["status"] = "draining"
+        pool = server["pool"]
+        deadline = time.monotonic() + drain_timeout
+        while pool.outstanding and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if pool.outstanding:
+            self.logger.warning(f"Stopping MCP server {server_id} with {pool.outstanding} calls still in flight")
+        await pool.close()
+        self.logger.info(f"Drained and stopped MCP server {server_id}")
+    
+    async def stop_all(self):
+        """Stop every running server, the idle reaper and the health monitor"""
+        for task in (self._reaper_task, self._monitor_task):
+            if task is not None:
+                task.cancel()
+        self._reaper_task = self._monitor_task = None
+        for server_id in list(self.servers):
+            await self.stop_server(server_id)
+    
+    def _observe_request(self, server_id: str, method: str, outcome: str, seconds: float):
+        REQUESTS.inc(server=server_id, method=method, outcome=outcome)
+        REQUEST_SECONDS.observe(seconds, server=server_id, method=method)
+    
+    def _collect_metrics(self):
+        for server_id in self.configs:
+            server = self.servers.get(server_id)
+            WORKERS.set(server["pool"].live_workers if server else 0, server=server_id)
+            OUTSTANDING.set(server["pool"].outstanding if server else 0, server=server_id)
+            BREAKER_OPEN.set(0 if self.get_breaker_state(server_id) == "closed" else 1, server=server_id)
+    
+    def _restart_reaper(self):
+        # Restarted on every server start so the check interval fits the new set of timeouts
+        if self._reaper_task is not None and not self._reaper_task.done():
+            self._reaper_task.cancel()
+        self._reaper_task = asyncio.create_task(self._reap_idle_servers())
+    
+    async def _reap_idle_servers(self):
+        """Stop servers that have had no tool calls for their idle timeout"""
+        while self.servers:
+            timeouts = [t for t in map(self.idle_timeout, self.servers) if t is not None]
+            interval = min([MAX_REAP_INTERVAL] + [max(t / 4, 0.1) for t in timeouts])
+            await asyncio.sleep(interval)
+            
+            now = time.monotonic()
+            for server_id, server in list(self.servers.items()):
+                timeout = self.idle_timeout(server_id)
+                if timeout is None or server["pool"].outstanding:
+                    continue
+                if now - server["last_used"] >= timeout:
+                    self.logger.info(f"Stopping MCP server {server_id} after {timeout}s idle")
+                    await asyncio.shield(self.stop_server(server_id))
+    
+    async def check_server(self, server_id: str):
+        """Probe one server's workers and restart it with exponential backoff if it is down"""
+        server = self.servers.get(server_id)
+        if server is None:
+            return
+        pool = server["pool"]
+        breaker = self.breakers[server_id]
+        
+        removed = await pool.check_health(server["config"].get("ping_timeout", DEFAULT_PING_TIMEOUT))
+        if removed:
+            self.logger.warning(f"MCP server {server_id}: {removed} worker(s) died or stopped responding")
+        if pool.live_workers >= pool.min_workers:
+            return
+        
+        if not pool.live_workers and server["status"] == "running":
+            server["status"] = "crashed"
+            breaker.trip()
+        
+        now = time.monotonic()
+        if now < server["next_restart_at"]:
+            return
+        
+        server["restart_attempts"] += 1
+        try:
+            await pool.replenish()
+            self.logger.info(f"Restarted MCP server {server_id} (attempt {server['restart_attempts']})")
+            self.invalidate_tool_catalog(server_id)
+            server["status"] = "running"
+            server["restart_attempts"] = 0
+            server["next_restart_at"] = 0.0
+            breaker.record_success()
+        except Exception as e:
+            delay = restart_backoff(server["restart_attempts"], server["config"])
+            server["next_restart_at"] = time.monotonic() + delay
+            server["status"] = "restarting"
+            self.logger.error(f"Restart of MCP server {server_id} failed: {e}; next attempt in {delay:.0f}s")
+    
+    async def _monitor_health(self):
+        """Periodically check liveness of every running server"""
+        while self.servers:
+            await asyncio.sleep(self.health_check_interval)
+            server_ids = list(self.servers)
+            await asyncio.gather(*[self.check_server(server_id) for server_id in server_ids])
+            # Collect server processes that exited without going through stop()
+            process_registry.reap()
 
 # Global MCP service instance
 mcp_service = MCPService()
\ No newline at end of file
@@ -0,0 +1,489 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+
+from jsonrpc_client import (
+    BATCH_REJECTED,
+    BATCH_RETRY_INDIVIDUALLY,
+    DEFAULT_MAX_MESSAGE_BYTES,
+    JSONRPCClient,
+    JSONRPCError,
+)
+from result_spool import DEFAULT_PREVIEW_CHARS, ResultSpool, SpillWriter, result_spool
+
+NETWORK_TRANSPORTS = ("http", "websocket")
+
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+DEFAULT_WEBSOCKET_PING_INTERVAL = 20.0
+DEFAULT_MAX_FRAME_BYTES = 64 * 1024 * 1024
+LISTEN_RETRY_MAX = 30.0
+SESSION_HEADER = "Mcp-Session-Id"
+
+
+def transport_headers(config: Dict[str, Any]) -> Dict[str, str]:
+    """Configured HTTP headers, with $VARIABLES taken from the environment"""
+    return {key: os.path.expandvars(str(value)) for key, value in (config.get("headers") or {}).items()}
+
+
+class WebSocketStream:
+    """Reader/writer pair over a WebSocket, so ``JSONRPCClient`` can use it like a pipe.
+
+    Every frame carries one JSON-RPC message. Frames are newline-terminated on
+    the way in; newlines inside a frame can only be JSON whitespace, so they
+    are blanked out to keep the framing intact.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self._outgoing: List[bytes] = []
+
+    async def read(self, n: int = -1) -> bytes:
+        try:
+            frame = await self.websocket.recv()
+        except websockets.ConnectionClosed:
+            return b""
+        if isinstance(frame, str):
+            frame = frame.encode("utf-8")
+        return frame.replace(b"\r", b" ").replace(b"\n", b" ") + b"\n"
+
+    def write(self, data: bytes):
+        self._outgoing.append(data)
+
+    async def drain(self):
+        outgoing, self._outgoing = self._outgoing, []
+        for data in outgoing:
+            for line in data.splitlines():
+                if line.strip():
+                    await self.websocket.send(line.decode("utf-8"))
+
+    async def close(self):
+        await self.websocket.close()
+
+
+async def connect_websocket(name: str, config: Dict[str, Any], default_timeout: float) -> JSONRPCClient:
+    """Open one WebSocket connection to a server and wrap it in a JSON-RPC client"""
+    websocket = await websockets.connect(
+        config["url"],
+        additional_headers=transport_headers(config),
+        subprotocols=["mcp"],
+        open_timeout=config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+        # Protocol-level pings keep idle connections open through proxies
+        ping_interval=config.get("ping_interval", DEFAULT_WEBSOCKET_PING_INTERVAL),
+        max_size=config.get("max_frame_bytes", DEFAULT_MAX_FRAME_BYTES),
+    )
+    stream = WebSocketStream(websocket)
+    return JSONRPCClient(
+        stream,
+        stream,
+        name=name,
+        default_timeout=config.get("timeout", default_timeout),
+        max_message_bytes=config.get("max_result_bytes", DEFAULT_MAX_MESSAGE_BYTES),
+        preview_chars=config.get("result_preview_chars", DEFAULT_PREVIEW_CHARS),
+    )
+
+
+class _MessageBuffer:
+    """Collects the bytes of one message, moving them to the spool once it grows too large"""
+
+    def __init__(self, spool: ResultSpool, max_bytes: int, preview_chars: int):
+        self.spool = spool
+        self.max_bytes = max_bytes
+        self.preview_chars = preview_chars
+        self.data = bytearray()
+        self.spill: Optional[SpillWriter] = None
+
+    def feed(self, chunk: bytes):
+        if self.spill is not None:
+            self.spill.feed(chunk)
+            return
+        self.data += chunk
+        if len(self.data) > self.max_bytes:
+            self.spill = self.spool.new_writer(self.preview_chars)
+            self.spill.feed(bytes(self.data))
+            self.data = bytearray()
+
+    @property
+    def empty(self) -> bool:
+        return self.spill is None and not self.data.strip()
+
+
+class StreamableHTTPClient:
+    """JSON-RPC client for MCP's Streamable HTTP transport over a keep-alive connection pool.
+
+    Every message is POSTed to the server URL and answered with a JSON body or
+    an SSE stream, which may carry server notifications ahead of the response.
+    Concurrent requests share the pooled connections of one ``httpx.AsyncClient``;
+    a background GET stream receives notifications sent outside any request.
+    Offers the same interface as ``JSONRPCClient``.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        name: str = "http",
+        headers: Optional[Dict[str, str]] = None,
+        default_timeout: float = 30.0,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+        max_message_bytes: int = DEFAULT_MAX_MESSAGE_BYTES,
+        preview_chars: int = DEFAULT_PREVIEW_CHARS,
+        spool: Optional[ResultSpool] = None,
+    ):
+        self.url = url
+        self.name = name
+        self.default_timeout = default_timeout
+        self.max_message_bytes = max_message_bytes
+        self.preview_chars = preview_chars
+        self.spool = spool or result_spool
+        self.logger = logging.getLogger(__name__)
+        self.session_id: Optional[str] = None
+
+        self.http = httpx.AsyncClient(
+            headers={"Accept": "application/json, text/event-stream", **(headers or {})},
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(None, connect=connect_timeout),
+        )
+        self._ids = itertools.count(1)
+        self._notification_handlers: Dict[str, List[Callable[[Dict], Any]]] = {}
+        self._in_flight = 0
+        self._closed = False
+        self._initialized = asyncio.Event()
+        self._listener_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, name: str, config: Dict[str, Any], default_timeout: float) -> "StreamableHTTPClient":
+        return cls(
+            config["url"],
+            name=name,
+            headers=transport_headers(config),
+            default_timeout=config.get("timeout", default_timeout),
+            connect_timeout=config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+            max_connections=config.get("max_connections", DEFAULT_MAX_CONNECTIONS),
+            keepalive_expiry=config.get("keepalive_expiry", DEFAULT_KEEPALIVE_EXPIRY),
+            max_message_bytes=config.get("max_result_bytes", DEFAULT_MAX_MESSAGE_BYTES),
+            preview_chars=config.get("result_preview_chars", DEFAULT_PREVIEW_CHARS),
+        )
+
+    @property
+    def pending_count(self) -> int:
+        return self._in_flight
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def start(self):
+        """Start the notification listener; it connects once the session is initialized"""
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    def on_notification(self, method: str, handler: Callable[[Dict], Any]):
+        """Register a callback for server-sent notifications of the given method"""
+        self._notification_handlers.setdefault(method, []).append(handler)
+
+    async def request(self, method: str, params: Optional[Dict] = None, timeout: Optional[float] = None) -> Any:
+        """Send a request and wait for its response"""
+        message = self._message(method, params)
+        result = (await self._exchange(message, [message["id"]], method, timeout, batch=False))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def request_batch(
+        self, calls: List[Tuple[str, Optional[Dict]]], timeout: Optional[float] = None
+    ) -> List[Any]:
+        """Send several requests in one POST; see ``JSONRPCClient.request_batch``"""
+        if not calls:
+            return []
+        messages = [self._message(method, params) for method, params in calls]
+        try:
+            return await self._exchange(messages, [m["id"] for m in messages], "batch", timeout, batch=True)
+        except JSONRPCError as e:
+            # The whole POST was refused, typically by a server without batch support
+            rejected = JSONRPCError(BATCH_REJECTED, f"Batch rejected: {e.message}")
+            return [rejected for _ in messages]
+
+    async def notify(self, method: str, params: Optional[Dict] = None):
+        """Send a notification, which gets no response"""
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        await self._post_and_discard(message)
+        if method == "notifications/initialized":
+            self._initialized.set()
+
+    async def close(self):
+        """Stop listening, end the server session and release the pooled connections"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+        if self.session_id:
+            try:
+                await self.http.delete(self.url, headers=self._session_headers(), timeout=2.0)
+            except httpx.HTTPError:
+                pass
+        await self.http.aclose()
+
+    def _message(self, method: str, params: Optional[Dict]) -> Dict:
+        message = {"jsonrpc": "2.0", "id": next(self._ids), "method": method}
+        if params is not None:
+            message["params"] = params
+        return message
+
+    def _session_headers(self) -> Dict[str, str]:
+        return {SESSION_HEADER: self.session_id} if self.session_id else {}
+
+    async def _exchange(
+        self, body: Any, request_ids: List[int], label: str, timeout: Optional[float], batch: bool
+    ) -> List[Any]:
+        """POST a request or batch and return the results (or exceptions) for the given ids"""
+        if self._closed:
+            raise ConnectionError(f"{self.name}: connection is closed")
+
+        timeout = self.default_timeout if timeout is None else timeout
+        answers: Dict[int, Any] = {}
+        self._in_flight += len(request_ids)
+        try:
+            await asyncio.wait_for(self._post(body, set(request_ids), answers, batch), timeout)
+        except asyncio.TimeoutError:
+            for request_id in request_ids:
+                if request_id not in answers:
+                    self._cancel_remote(request_id, "timeout")
+                    answers[request_id] = TimeoutError(f"{self.name}: {label} timed out after {timeout}s")
+        except asyncio.CancelledError:
+            for request_id in request_ids:
+                if request_id not in answers:
+                    self._cancel_remote(request_id, "cancelled by client")
+            raise
+        finally:
+            self._in_flight -= len(request_ids)
+
+        missing = JSONRPCError(-32603, "No response from server")
+        return [answers.get(request_id, missing) for request_id in request_ids]
+
+    async def _post(self, body: Any, waiting: set, answers: Dict[int, Any], batch: bool):
+        try:
+            async with self.http.stream("POST", self.url, json=body, headers=self._session_headers()) as response:
+                if response.headers.get(SESSION_HEADER):
+                    self.session_id = response.headers[SESSION_HEADER]
+                await self._check_status(response)
+
+                messages = self._iter_messages(response)
+                try:
+                    async for message in messages:
+                        if isinstance(message, SpillWriter):
+                            self._finish_spill(message, waiting, answers)
+                        else:
+                            await self._handle_message(message, waiting, answers, batch)
+                        if waiting.issubset(answers):
+                            # Everything answered; leave the rest of the stream unread
+                            break
+                finally:
+                    await messages.aclose()
+        except httpx.TransportError as e:
+            raise ConnectionError(f"{self.name}: {e}") from e
+
+    async def _check_status(self, response: httpx.Response):
+        if response.status_code < 400:
+            return
+        if response.status_code == 404 and self.session_id:
+            # The server forgot our session; this client is done and its worker gets replaced
+            self._closed = True
+            raise ConnectionError(f"{self.name}: session expired")
+        if response.status_code >= 500:
+            raise ConnectionError(f"{self.name}: HTTP {response.status_code}")
+
+        text = (await response.aread()).decode("utf-8", errors="replace")
+        try:
+            error = json.loads(text).get("error") or {}
+        except (ValueError, AttributeError):
+            error = {}
+        raise JSONRPCError(
+            error.get("code", -32000),
+            error.get("message", f"HTTP {response.status_code}: {text[:200]}"),
+            error.get("data"),
+        )
+
+    async def _iter_messages(self, response: httpx.Response):
+        """Yield the messages of a JSON or SSE response body; oversized ones as a SpillWriter"""
+        content_type = response.headers.get("content-type", "")
+        if response.status_code == 202 or not (
+            content_type.startswith("application/json") or content_type.startswith("text/event-stream")
+        ):
+            return
+
+        if content_type.startswith("application/json"):
+            buffer = self._new_buffer()
+            async for chunk in response.aiter_bytes():
+                buffer.feed(chunk)
+            if not buffer.empty:
+                yield self._parse(buffer)
+            return
+
+        # SSE: the data lines of an event make up one message; blank lines end events
+        event = self._new_buffer()
+        line_head = bytearray()
+        line_kind: Optional[str] = None
+        async for chunk in response.aiter_bytes():
+            start = 0
+            while True:
+                newline = chunk.find(b"\n", start)
+                piece = chunk[start:] if newline < 0 else chunk[start:newline]
+
+                if line_kind is None:
+                    line_head += piece
+                    if len(line_head) >= 5 or newline >= 0:
+                        if line_head.startswith(b"data:"):
+                            line_kind = "data"
+                            if not event.empty:
+                                event.feed(b"\n")
+                            event.feed(bytes(line_head[5:]))
+                        elif line_head.strip():
+                            line_kind = "other"
+                elif line_kind == "data":
+                    event.feed(piece)
+
+                if newline < 0:
+                    break
+                start = newline + 1
+
+                if line_kind is None and not line_head.strip():
+                    if not event.empty:
+                        message = self._parse(event)
+                        if message is not None:
+                            yield message
+                    event = self._new_buffer()
+                line_head, line_kind = bytearray(), None
+
+        if not event.empty:
+            message = self._parse(event)
+            if message is not None:
+                yield message
+
+    def _new_buffer(self) -> _MessageBuffer:
+        return _MessageBuffer(self.spool, self.max_message_bytes, self.preview_chars)
+
+    def _parse(self, buffer: _MessageBuffer) -> Any:
+        if buffer.spill is not None:
+            return buffer.spill
+        try:
+            return json.loads(bytes(buffer.data))
+        except ValueError:
+            self.logger.debug(f"{self.name}: ignoring non JSON-RPC data: {bytes(buffer.data[:200])!r}")
+            return None
+
+    def _finish_spill(self, spill: SpillWriter, waiting: set, answers: Dict[int, Any]):
+        request_id = spill.close()
+        if spill.is_batch or request_id not in waiting:
+            # A spilled batch mixes every answer, so those requests must be retried one by one
+            self.spool.discard(spill)
+            for member_id in waiting.difference(answers) if spill.is_batch else []:
+                answers[member_id] = JSONRPCError(
+                    BATCH_RETRY_INDIVIDUALLY, "Batch response too large, retry the request on its own"
+                )
+            return
+        self.logger.info(f"{self.name}: spilled {spill.raw_size} byte response for request {request_id}")
+        answers[request_id] = self.spool.register(spill)
+
+    async def _handle_message(self, message: Any, waiting: set, answers: Dict[int, Any], batch: bool = False):
+        for item in message if isinstance(message, list) else [message]:
+            if not isinstance(item, dict):
+                continue
+            method = item.get("method")
+            message_id = item.get("id")
+            if method is None:
+                if message_id is None and batch and "error" in item:
+                    # Servers without batch support answer the whole array with one id-less error
+                    error = item["error"] or {}
+                    rejected = JSONRPCError(BATCH_REJECTED, f"Batch rejected: {error.get('message', 'Invalid Request')}")
+                    for member_id in waiting.difference(answers):
+                        answers[member_id] = rejected
+                elif message_id in waiting:
+                    if "error" in item:
+                        error = item["error"] or {}
+                        answers[message_id] = JSONRPCError(
+                            error.get("code", -32603), error.get("message", "Unknown error"), error.get("data")
+                        )
+                    else:
+                        answers[message_id] = item.get("result")
+                continue
+            if message_id is None:
+                for handler in self._notification_handlers.get(method, []):
+                    try:
+                        handler(item.get("params") or {})
+                    except Exception as e:
+                        self.logger.error(f"{self.name}: notification handler for {method} failed: {e}")
+                continue
+
+            # Requests initiated by the server: answer pings, reject everything else
+            if method == "ping":
+                reply = {"jsonrpc": "2.0", "id": message_id, "result": {}}
+            else:
+                reply = {
+                    "jsonrpc": "2.0",
+                    "id": message_id,
+                    "error": {"code": -32601, "message": f"Method not found: {method}"},
+                }
+            task = asyncio.ensure_future(self._post_and_discard(reply))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _post_and_discard(self, body: Dict):
+        if self._closed:
+            raise ConnectionError(f"{self.name}: connection is closed")
+        try:
+            response = await self.http.post(
+                self.url, json=body, headers=self._session_headers(), timeout=self.default_timeout
+            )
+        except httpx.TransportError as e:
+            raise ConnectionError(f"{self.name}: {e}") from e
+        if response.status_code >= 400:
+            self.logger.warning(f"{self.name}: {body.get('method', 'reply')} rejected with HTTP {response.status_code}")
+
+    def _cancel_remote(self, request_id: int, reason: str):
+        """Tell the server to stop working on a request we no longer wait for"""
+        if self._closed:
+            return
+        params = {"requestId": request_id, "reason": reason}
+        task = asyncio.ensure_future(self.notify("notifications/cancelled", params))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _listen(self):
+        """Receive server notifications sent outside a request over a long-lived GET stream"""
+        await self._initialized.wait()
+        delay = 1.0
+        while not self._closed:
+            try:
+                async with self.http.stream("GET", self.url, headers=self._session_headers()) as response:
+                    if response.status_code == 405:
+                        # The server does not offer a notification stream
+                        return
+                    if response.status_code >= 400:
+                        raise ConnectionError(f"HTTP {response.status_code}")
+                    delay = 1.0
+                    async for message in self._iter_messages(response):
+                        if isinstance(message, SpillWriter):
+                            message.close()
+                            self.spool.discard(message)
+                        else:
+                            await self._handle_message(message, set(), {})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.debug(f"{self.name}: notification stream interrupted: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LISTEN_RETRY_MAX)
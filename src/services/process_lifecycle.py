@@ -0,0 +1,307 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import signal
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+DEFAULT_TERMINATE_GRACE = 5.0
+DEFAULT_KILL_WAIT = 2.0
+PIDFILE_DIR = os.path.join(tempfile.gettempdir(), "edugpt-mcp-processes")
+
+SIGKILL = getattr(signal, "SIGKILL", signal.SIGTERM)
+# On POSIX every server gets its own process group, so npx and the node process it starts go together
+USE_PROCESS_GROUPS = hasattr(os, "killpg")
+
+
+def _proc_start_time(pid: int) -> Optional[str]:
+    """Kernel start time of a process on Linux, used to tell it apart from a later one with the same pid"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces, so count fields from the closing parenthesis
+    return stat.rsplit(")", 1)[1].split()[19]
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return not _is_zombie(pid)
+
+
+def _is_zombie(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] == "Z"
+    except OSError:
+        return False
+
+
+def _group_members(pgid: int) -> List[int]:
+    """Live processes in a process group (Linux only; elsewhere just the leader if alive)"""
+    if not USE_PROCESS_GROUPS:
+        # os.kill(pid, 0) would terminate the process on Windows, so liveness is not probed there
+        return []
+    if not os.path.isdir("/proc"):
+        return [pgid] if _is_alive(pgid) else []
+    members = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[2]) == pgid and fields[0] != "Z":
+            members.append(int(entry))
+    return members
+
+
+def _signal(pid: int, sig: int):
+    try:
+        if USE_PROCESS_GROUPS:
+            os.killpg(pid, sig)
+        else:
+            os.kill(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ProcessRegistry:
+    """Tracks every MCP server process this app spawned and makes sure none outlive it.
+
+    Each app instance records its children in its own pidfile. Processes are
+    stopped with SIGTERM to their whole process group, escalating to SIGKILL
+    after a grace period. On shutdown, on SIGTERM/SIGHUP and at interpreter exit
+    everything still tracked is stopped, and on startup the processes left
+    behind by instances that died (or by an earlier reload of this one) are
+    cleaned up.
+    """
+
+    def __init__(self, pidfile_dir: str = PIDFILE_DIR, terminate_grace: float = DEFAULT_TERMINATE_GRACE):
+        self.pidfile_dir = pidfile_dir
+        self.terminate_grace = terminate_grace
+        self.generation = uuid.uuid4().hex[:8]
+        self.pidfile = os.path.join(pidfile_dir, f"{os.getpid()}-{self.generation}.json")
+        self.processes: Dict[int, Dict[str, Any]] = {}
+        self.stale_killed = 0
+        self.logger = logging.getLogger(__name__)
+        self._installed = False
+        self._previous_handlers: Dict[int, Any] = {}
+
+    def track(self, pid: int, name: str, command: List[str]):
+        self.processes[pid] = {
+            "name": name,
+            "command": command,
+            "started": time.time(),
+            "start_time": _proc_start_time(pid),
+        }
+        self._write_pidfile()
+
+    def untrack(self, pid: int):
+        if self.processes.pop(pid, None) is not None:
+            self._write_pidfile()
+
+    async def terminate(self, process: asyncio.subprocess.Process, grace: Optional[float] = None):
+        """Stop a server process and everything in its process group, SIGTERM first then SIGKILL"""
+        grace = self.terminate_grace if grace is None else grace
+        pid = process.pid
+        try:
+            # Also signalled when the server already exited, for the children it left behind
+            if process.returncode is None or _group_members(pid):
+                _signal(pid, signal.SIGTERM)
+            if process.returncode is None:
+                try:
+                    await asyncio.wait_for(process.wait(), grace)
+                except asyncio.TimeoutError:
+                    self.logger.warning(f"Process {pid} ignored SIGTERM for {grace}s, sending SIGKILL")
+                    _signal(pid, SIGKILL)
+                    await asyncio.wait_for(process.wait(), DEFAULT_KILL_WAIT)
+            # Children the server started may outlive it, or still be handling the SIGTERM
+            if not await self._wait_for_group(pid, grace):
+                _signal(pid, SIGKILL)
+                await self._wait_for_group(pid, DEFAULT_KILL_WAIT)
+        except asyncio.TimeoutError:
+            self.logger.error(f"Process {pid} did not exit after SIGKILL")
+        finally:
+            if _group_members(pid):
+                self.logger.error(f"Process group {pid} still has running processes after SIGKILL")
+            else:
+                self.untrack(pid)
+
+    def shutdown(self, grace: Optional[float] = None) -> List[int]:
+        """Synchronously stop every tracked process; safe to call from signal handlers and atexit.
+
+        Returns the pids that could not be stopped.
+        """
+        grace = self.terminate_grace if grace is None else grace
+        pids = list(self.processes)
+        if not pids:
+            return []
+        for pid in pids:
+            _signal(pid, signal.SIGTERM)
+        survivors = self._wait_for_exit(pids, grace)
+        for pid in survivors:
+            self.logger.warning(f"Process {pid} ({self.processes[pid]['name']}) ignored SIGTERM, sending SIGKILL")
+            _signal(pid, SIGKILL)
+        leaked = self._wait_for_exit(survivors, DEFAULT_KILL_WAIT)
+        for pid in pids:
+            if pid not in leaked:
+                self.processes.pop(pid, None)
+        self._write_pidfile()
+        return leaked
+
+    def reap(self) -> int:
+        """Forget processes whose whole group is gone.
+
+        Only group liveness is checked: exit statuses belong to asyncio's child
+        watcher, and zombies do not count as live members.
+        """
+        gone = 0
+        for pid in list(self.processes):
+            if not _group_members(pid):
+                self.processes.pop(pid, None)
+                gone += 1
+        if gone:
+            self._write_pidfile()
+        return gone
+
+    def leaked(self) -> List[Dict[str, Any]]:
+        """Tracked process groups that still have live members although their server exited"""
+        report = []
+        for pid, info in self.processes.items():
+            members = _group_members(pid)
+            if members and not _is_alive(pid):
+                report.append({"pid": pid, "name": info["name"], "members": members})
+        return report
+
+    def report(self) -> Dict[str, Any]:
+        self.reap()
+        return {
+            "tracked": len(self.processes),
+            "leaked": self.leaked(),
+            "stale_killed": self.stale_killed,
+        }
+
+    def install(self):
+        """Stop tracked processes on exit and signals, and clean up after previous instances"""
+        if self._installed:
+            return
+        self._installed = True
+        if USE_PROCESS_GROUPS:
+            self.stale_killed = self.kill_stale()
+        atexit.register(self._at_exit)
+
+        hangup = getattr(signal, "SIGHUP", None)
+        for sig in [signal.SIGTERM] + ([hangup] if hangup else []):
+            try:
+                self._previous_handlers[sig] = signal.signal(sig, self._on_signal)
+            except ValueError:
+                # Only the main thread may install signal handlers
+                self.logger.debug("Not in the main thread, relying on atexit for cleanup")
+                break
+
+    def kill_stale(self) -> int:
+        """Kill processes recorded by app instances that are gone, or by an earlier reload of this one"""
+        if not os.path.isdir(self.pidfile_dir):
+            return 0
+        killed = 0
+        for filename in os.listdir(self.pidfile_dir):
+            path = os.path.join(self.pidfile_dir, filename)
+            if path == self.pidfile or not filename.endswith(".json"):
+                continue
+            try:
+                owner = int(filename.split("-", 1)[0])
+                with open(path, "r") as f:
+                    entries = json.load(f)
+            except (ValueError, OSError):
+                continue
+            if owner != os.getpid() and _is_alive(owner):
+                continue
+
+            for pid_text, info in entries.items():
+                pid = int(pid_text)
+                if self._same_process(pid, info) and _group_members(pid):
+                    self.logger.warning(f"Killing stale MCP server {info.get('name')} (pid {pid}) left by a previous run")
+                    _signal(pid, SIGKILL)
+                    killed += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return killed
+
+    def _same_process(self, pid: int, info: Dict[str, Any]) -> bool:
+        if not _is_alive(pid):
+            # A group id is never reused while the group has members, so these are the server's orphans
+            return bool(_group_members(pid))
+        # Guard against the pid having been reused by an unrelated process
+        start_time = _proc_start_time(pid)
+        if start_time is not None or info.get("start_time") is not None:
+            return start_time == info.get("start_time")
+        try:
+            return os.getpgid(pid) == pid
+        except (OSError, AttributeError):
+            return False
+
+    async def _wait_for_group(self, pgid: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while _group_members(pgid):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def _wait_for_exit(self, pids: List[int], timeout: float) -> List[int]:
+        deadline = time.monotonic() + timeout
+        remaining = list(pids)
+        while remaining:
+            remaining = [pid for pid in remaining if _group_members(pid)]
+            if not remaining or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        return remaining
+
+    def _write_pidfile(self):
+        try:
+            if not self.processes:
+                if os.path.exists(self.pidfile):
+                    os.remove(self.pidfile)
+                return
+            os.makedirs(self.pidfile_dir, exist_ok=True)
+            tmp_path = f"{self.pidfile}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({str(pid): info for pid, info in self.processes.items()}, f)
+            os.replace(tmp_path, self.pidfile)
+        except OSError as e:
+            self.logger.debug(f"Could not update pidfile {self.pidfile}: {e}")
+
+    def _at_exit(self):
+        leaked = self.shutdown()
+        if leaked:
+            print(f"⚠️  {len(leaked)} MCP server process(es) could not be stopped: {leaked}")
+
+    def _on_signal(self, signum, frame):
+        previous = self._previous_handlers.get(signum)
+        if previous == signal.SIG_IGN:
+            return
+        self.shutdown()
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            raise SystemExit(128 + signum)
+
+
+# Global registry of the MCP server processes spawned by this app
+process_registry = ProcessRegistry()
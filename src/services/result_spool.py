@@ -0,0 +1,253 @@
+import collections
+import logging
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from typing import Dict, Optional
+
+DEFAULT_PREVIEW_CHARS = 800
+# Spilled results beyond this total size are deleted oldest first
+DEFAULT_MAX_SPOOL_BYTES = 512 * 1024 * 1024
+ID_SCAN_BYTES = 4096
+
+_TEXT_KEY = re.compile(rb'"text"\s*:\s*"')
+_STRING_SPECIAL = re.compile(rb'["\\]')
+_HEAD_ID = re.compile(rb'"id"\s*:\s*(\d+)')
+_TAIL_ID = re.compile(rb'"id"\s*:\s*(\d+)\s*\}\s*$')
+_SIMPLE_ESCAPES = {
+    ord('"'): b'"', ord('\\'): b'\\', ord('/'): b'/',
+    ord('b'): b'\b', ord('f'): b'\f', ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t',
+}
+
+
+def _parse_hex(digits: bytes) -> Optional[int]:
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+class SpilledResult:
+    """Reference to a tool result too large to keep in memory"""
+
+    def __init__(self, ref: str, path: str, size: int, preview: str):
+        self.ref = ref
+        self.path = path
+        self.size = size
+        self.preview = preview
+
+    def __repr__(self):
+        return f"SpilledResult(ref={self.ref!r}, size={self.size})"
+
+
+class SpillWriter:
+    """Streams one oversized JSON-RPC message to disk without holding it in memory.
+
+    Only the text of the ``"text"`` fields (the content of MCP tool results)
+    is decoded and written out; the head and tail of the raw message are kept
+    so the request id can still be recovered. Until the first text field shows
+    up the raw bytes are kept in a side file, which becomes the result when
+    the message has no text fields at all.
+    """
+
+    def __init__(self, path: str, preview_chars: int = DEFAULT_PREVIEW_CHARS):
+        self.path = path
+        self.preview_chars = preview_chars
+        self.raw_size = 0
+        self.size = 0
+        self._file = open(path, "wb")
+        self._raw_path = f"{path}.raw"
+        self._raw = open(self._raw_path, "wb")
+        self._head = b""
+        self._tail = b""
+        self._preview = bytearray()
+        self._buffer = b""
+        self._in_text = False
+        self._texts = 0
+
+    def feed(self, chunk: bytes):
+        self.raw_size += len(chunk)
+        if len(self._head) < ID_SCAN_BYTES:
+            self._head += chunk[:ID_SCAN_BYTES - len(self._head)]
+        self._tail = (self._tail + chunk)[-ID_SCAN_BYTES:]
+        if self._raw:
+            self._raw.write(chunk)
+        self._buffer += chunk
+        self._scan()
+
+    def close(self) -> Optional[int]:
+        """Finish the file and return the request id of the message, if found"""
+        self._file.close()
+        if self._raw:
+            # No text field in the whole message: keep the raw JSON instead of an empty result
+            self._raw.close()
+            self._raw = None
+            os.replace(self._raw_path, self.path)
+            self.size = self.raw_size
+            self._preview = bytearray(self._head[:self.preview_chars * 4])
+        head = self._head.split(b'"result"', 1)[0].split(b'"error"', 1)[0]
+        match = _HEAD_ID.search(head) or _TAIL_ID.search(self._tail)
+        return int(match.group(1)) if match else None
+
+    @property
+    def is_notification(self) -> bool:
+        """Whether the message is a request or notification from the server rather than a response"""
+        return b'"method"' in self._head.split(b'"params"', 1)[0]
+
+    @property
+    def is_batch(self) -> bool:
+        """Whether the message is a JSON-RPC batch (an array of responses)"""
+        return self._head.lstrip().startswith(b"[")
+
+    @property
+    def preview(self) -> str:
+        return bytes(self._preview).decode("utf-8", errors="ignore")[:self.preview_chars]
+
+    def _write(self, data: bytes):
+        if not data:
+            return
+        self._file.write(data)
+        self.size += len(data)
+        # Four bytes per character is the UTF-8 worst case
+        room = self.preview_chars * 4 - len(self._preview)
+        if room > 0:
+            self._preview += data[:room]
+
+    def _scan(self):
+        buffer = self._buffer
+        pos = 0
+        while True:
+            if not self._in_text:
+                match = _TEXT_KEY.search(buffer, pos)
+                if match is None:
+                    # Keep enough bytes to catch a key split across chunks
+                    self._buffer = buffer[-32:]
+                    return
+                if self._raw:
+                    self._raw.close()
+                    self._raw = None
+                    os.remove(self._raw_path)
+                if self._texts:
+                    self._write(b"\n")
+                self._texts += 1
+                self._in_text = True
+                pos = match.end()
+                continue
+
+            match = _STRING_SPECIAL.search(buffer, pos)
+            if match is None:
+                self._write(buffer[pos:])
+                self._buffer = b""
+                return
+            self._write(buffer[pos:match.start()])
+            pos = match.start()
+
+            if buffer[pos] == ord('"'):
+                self._in_text = False
+                pos += 1
+                continue
+
+            consumed = self._decode_escape(buffer, pos)
+            if consumed is None:
+                # Escape sequence split across chunks, wait for more data
+                self._buffer = buffer[pos:]
+                return
+            pos += consumed
+
+    def _decode_escape(self, buffer: bytes, pos: int) -> Optional[int]:
+        if pos + 1 >= len(buffer):
+            return None
+        kind = buffer[pos + 1]
+        if kind != ord('u'):
+            self._write(_SIMPLE_ESCAPES.get(kind, bytes([kind])))
+            return 2
+
+        if pos + 6 > len(buffer):
+            return None
+        code = _parse_hex(buffer[pos + 2:pos + 6])
+        if code is None:
+            # Malformed escape, keep the bytes as they are
+            self._write(buffer[pos:pos + 2])
+            return 2
+        consumed = 6
+        if 0xD800 <= code < 0xDC00:
+            if pos + 12 > len(buffer):
+                return None
+            if buffer[pos + 6:pos + 8] == b"\\u":
+                low = _parse_hex(buffer[pos + 8:pos + 12])
+                if low is not None and 0xDC00 <= low < 0xE000:
+                    code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                    consumed = 12
+        self._write(chr(code).encode("utf-8", errors="replace"))
+        return consumed
+
+
+class ResultSpool:
+    """Temporary directory of spilled tool results, addressed by reference"""
+
+    def __init__(self, directory: Optional[str] = None, max_total_bytes: int = DEFAULT_MAX_SPOOL_BYTES):
+        self.directory = directory
+        self.max_total_bytes = max_total_bytes
+        self.logger = logging.getLogger(__name__)
+        self._results: "collections.OrderedDict[str, SpilledResult]" = collections.OrderedDict()
+
+    def new_writer(self, preview_chars: int = DEFAULT_PREVIEW_CHARS) -> SpillWriter:
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="edugpt-results-")
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}.txt")
+        return SpillWriter(path, preview_chars)
+
+    def register(self, writer: SpillWriter) -> SpilledResult:
+        ref = f"result://{os.path.splitext(os.path.basename(writer.path))[0]}"
+        result = SpilledResult(ref, writer.path, writer.size, writer.preview)
+        self._results[ref] = result
+        self._evict()
+        return result
+
+    def discard(self, writer: SpillWriter):
+        for path in (writer.path, f"{writer.path}.raw"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, ref: str) -> Optional[SpilledResult]:
+        return self._results.get(ref)
+
+    def read(self, ref: str, offset: int = 0, length: int = 64 * 1024) -> str:
+        """Read a slice of a spilled result's text"""
+        result = self._results.get(ref)
+        if result is None:
+            raise KeyError(f"Unknown or expired result reference: {ref}")
+        with open(result.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode("utf-8", errors="ignore")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "results": len(self._results),
+            "bytes": sum(result.size for result in self._results.values()),
+        }
+
+    def clear(self):
+        self._results.clear()
+        if self.directory and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _evict(self):
+        total = sum(result.size for result in self._results.values())
+        while total > self.max_total_bytes and len(self._results) > 1:
+            ref, result = self._results.popitem(last=False)
+            total -= result.size
+            try:
+                os.remove(result.path)
+            except OSError:
+                pass
+            self.logger.info(f"Evicted spilled result {ref} ({result.size} bytes)")
+
+
+# Global spool shared by all MCP connections
+result_spool = ResultSpool()
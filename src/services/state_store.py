@@ -0,0 +1,232 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+DEFAULT_STATE_URL = "memory://"
+DEFAULT_LOCK_TTL = 300.0
+
+
+class StateStore:
+    """Shared key-value store for state that any app worker may need: sessions, syllabi, tool lists.
+
+    Values are JSON-serialisable dicts. Keys may expire, and short-lived locks
+    let one worker at a time own a key (e.g. a session while it answers).
+    """
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def keys(self, prefix: str) -> List[str]:
+        raise NotImplementedError
+
+    def acquire_lock(self, name: str, ttl: float = DEFAULT_LOCK_TTL) -> Optional[str]:
+        """Take a lock unless someone holds it; returns the token needed to release it"""
+        raise NotImplementedError
+
+    def release_lock(self, name: str, token: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """Process-local store; the default, for a single app worker"""
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[1] is not None and item[1] <= time.time():
+                del self._data[key]
+                return None
+            # Callers get a copy, as they would from a real store
+            return json.loads(item[0])
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (json.dumps(value), time.time() + ttl if ttl else None)
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def keys(self, prefix: str) -> List[str]:
+        with self._lock:
+            now = time.time()
+            return [
+                key for key, (_, expires) in self._data.items()
+                if key.startswith(prefix) and (expires is None or expires > now)
+            ]
+
+    def acquire_lock(self, name: str, ttl: float = DEFAULT_LOCK_TTL) -> Optional[str]:
+        key = f"lock:{name}"
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > time.time():
+                return None
+            token = uuid.uuid4().hex
+            self._data[key] = (json.dumps(token), time.time() + ttl)
+            return token
+
+    def release_lock(self, name: str, token: str):
+        key = f"lock:{name}"
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and json.loads(item[0]) == token:
+                del self._data[key]
+
+
+class SQLiteStateStore(StateStore):
+    """Store in a SQLite file, shared by the workers of one machine"""
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers and the writer work at the same time
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT value FROM state WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO state (key, value, expires) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + ttl if ttl else None),
+        )
+
+    def delete(self, key: str) -> bool:
+        return self._connection().execute("DELETE FROM state WHERE key = ?", (key,)).rowcount > 0
+
+    def keys(self, prefix: str) -> List[str]:
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = self._connection().execute(
+            "SELECT key FROM state WHERE key LIKE ? ESCAPE '\\' AND (expires IS NULL OR expires > ?)",
+            (escaped + "%", time.time()),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def acquire_lock(self, name: str, ttl: float = DEFAULT_LOCK_TTL) -> Optional[str]:
+        key = f"lock:{name}"
+        token = uuid.uuid4().hex
+        now = time.time()
+        db = self._connection()
+        # The write transaction makes check-and-take atomic across processes
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM state WHERE key = ? AND expires <= ?", (key, now))
+            taken = db.execute(
+                "INSERT OR IGNORE INTO state (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(token), now + ttl),
+            ).rowcount
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return token if taken else None
+
+    def release_lock(self, name: str, token: str):
+        self._connection().execute("DELETE FROM state WHERE key = ? AND value = ?", (f"lock:{name}", json.dumps(token)))
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+class RedisStateStore(StateStore):
+    """Store in Redis (or anything speaking its protocol), shared across machines.
+
+    Takes any client with the redis-py methods used here, so a local stand-in
+    can take the place of a server.
+    """
+
+    # Deletes the lock only if it still holds our token
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, client: Any, namespace: str = "edugpt:"):
+        self.client = client
+        self.namespace = namespace
+
+    @classmethod
+    def from_url(cls, url: str, namespace: str = "edugpt:") -> "RedisStateStore":
+        if redis is None:
+            raise ImportError("The redis package is needed for a redis:// state store: pip install redis")
+        return cls(redis.Redis.from_url(url), namespace)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.client.get(self.namespace + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        self.client.set(self.namespace + key, json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key: str) -> bool:
+        return bool(self.client.delete(self.namespace + key))
+
+    def keys(self, prefix: str) -> List[str]:
+        start = len(self.namespace)
+        keys = self.client.scan_iter(match=self.namespace + prefix + "*", count=500)
+        return [(key.decode() if isinstance(key, bytes) else key)[start:] for key in keys]
+
+    def acquire_lock(self, name: str, ttl: float = DEFAULT_LOCK_TTL) -> Optional[str]:
+        token = uuid.uuid4().hex
+        taken = self.client.set(f"{self.namespace}lock:{name}", token, nx=True, px=int(ttl * 1000))
+        return token if taken else None
+
+    def release_lock(self, name: str, token: str):
+        self.client.eval(self.RELEASE_SCRIPT, 1, f"{self.namespace}lock:{name}", token)
+
+    def close(self):
+        self.client.close()
+
+
+def create_state_store(url: str = DEFAULT_STATE_URL) -> StateStore:
+    """memory://, sqlite:///path/to/state.db or redis://host:6379/0"""
+    if url.startswith("memory://"):
+        return MemoryStateStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteStateStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateStore.from_url(url)
+    raise ValueError(f"Unsupported state store URL: {url}")
+
+
+# Where this process keeps shared state; set EDUGPT_STATE_URL to share it between workers
+state_store = create_state_store(os.environ.get("EDUGPT_STATE_URL", DEFAULT_STATE_URL))
@@ -0,0 +1,138 @@
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from mcp_metrics import metrics
+
+# Calls kept in memory for per-session and per-stage queries
+DEFAULT_MAX_ENTRIES = 10000
+TOKEN_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144, 1048576)
+
+PROMPT_TOKENS = metrics.histogram(
+    "edugpt_llm_prompt_tokens", "Input tokens per LLM call, by pipeline stage", ("stage",), buckets=TOKEN_BUCKETS
+)
+STAGE_TOKENS = metrics.counter(
+    "edugpt_llm_stage_tokens_total", "Tokens used per pipeline stage and direction (input, output)", ("stage", "direction")
+)
+
+LedgerListener = Callable[[Dict[str, Any]], None]
+
+_attribution: contextvars.ContextVar = contextvars.ContextVar("edugpt_token_attribution", default={})
+
+
+class TokenLedger:
+    """Input and output tokens of every LLM call, attributed to a session, a stage and a turn.
+
+    Code that knows the context wraps its calls in ``attribute(...)``; nested
+    attributions add to the outer ones. The scheduler records each finished
+    call with the provider's usage, or an estimate flagged as such.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, listeners: Optional[List[LedgerListener]] = None):
+        self.entries: collections.deque = collections.deque(maxlen=max_entries)
+        self.listeners: List[LedgerListener] = list(listeners or [])
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TokenLedger":
+        """EDUGPT_TOKEN_LEDGER_FILE=usage.jsonl also appends every call to a file"""
+        ledger = cls(int(os.environ.get("EDUGPT_TOKEN_LEDGER_ENTRIES", DEFAULT_MAX_ENTRIES)))
+        path = os.environ.get("EDUGPT_TOKEN_LEDGER_FILE")
+        if path:
+            ledger.add_listener(_JSONLWriter(path))
+        return ledger
+
+    @contextlib.contextmanager
+    def attribute(self, **fields: Any) -> Iterator[Dict[str, Any]]:
+        """Attribute the LLM calls made inside the block, e.g. session=..., stage=..., turn=..."""
+        token = _attribution.set({**_attribution.get(), **fields})
+        try:
+            yield _attribution.get()
+        finally:
+            try:
+                _attribution.reset(token)
+            except ValueError:
+                # Left from another context (an abandoned async generator); nothing to restore there
+                pass
+
+    def record(
+        self, input_tokens: int, output_tokens: int, seconds: float, estimated: bool, **fields: Any
+    ) -> Dict[str, Any]:
+        entry = {
+            "time": time.time(),
+            "session": None,
+            "stage": None,
+            "turn": None,
+            **_attribution.get(),
+            **fields,
+            "input_tokens": int(input_tokens),
+            "output_tokens": int(output_tokens),
+            "seconds": round(seconds, 4),
+            "estimated": estimated,
+        }
+        stage = entry["stage"] or "unattributed"
+        PROMPT_TOKENS.observe(entry["input_tokens"], stage=stage)
+        STAGE_TOKENS.inc(entry["input_tokens"], stage=stage, direction="input")
+        STAGE_TOKENS.inc(entry["output_tokens"], stage=stage, direction="output")
+        with self._lock:
+            self.entries.append(entry)
+        for listener in list(self.listeners):
+            try:
+                listener(entry)
+            except Exception as e:
+                self.logger.warning(f"Token ledger listener failed: {e}")
+        return entry
+
+    def add_listener(self, listener: LedgerListener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: LedgerListener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def query(self, since: float = 0.0, **fields: Any) -> List[Dict[str, Any]]:
+        """Recorded calls at or after ``since`` whose attribution matches every given field"""
+        with self._lock:
+            entries = list(self.entries)
+        return [
+            entry for entry in entries
+            if entry["time"] >= since and all(entry.get(key) == value for key, value in fields.items())
+        ]
+
+    def totals(self, group_by: str = "stage", **fields: Any) -> Dict[Any, Dict[str, Any]]:
+        """Calls, input and output tokens and model seconds per value of ``group_by``"""
+        groups: Dict[Any, Dict[str, Any]] = {}
+        for entry in self.query(**fields):
+            group = groups.setdefault(
+                entry.get(group_by), {"calls": 0, "input_tokens": 0, "output_tokens": 0, "seconds": 0.0, "estimated": 0}
+            )
+            group["calls"] += 1
+            group["input_tokens"] += entry["input_tokens"]
+            group["output_tokens"] += entry["output_tokens"]
+            group["seconds"] += entry["seconds"]
+            group["estimated"] += entry["estimated"]
+        return groups
+
+
+class _JSONLWriter:
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+
+    def __call__(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# Every LLM call in the process is recorded here by llm_scheduler
+token_ledger = TokenLedger.from_env()
@@ -0,0 +1,243 @@
+import contextlib
+import contextvars
+import csv
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+SpanExporter = Callable[[Dict[str, Any]], None]
+
+
+class Span:
+    """One timed stage; attributes and token counts may be added while it runs"""
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = dict(attributes)
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def add_tokens(self, input_tokens: int = 0, output_tokens: int = 0):
+        """Count tokens against this span and every stage that contains it"""
+        span = self
+        while span is not None:
+            span.input_tokens += input_tokens
+            span.output_tokens += output_tokens
+            span = span.parent
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.seconds * 1000, 3) if self.seconds is not None else None,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Stands in for a span while tracing is off, so instrumented code need not check"""
+
+    def set(self, **attributes: Any):
+        pass
+
+    def add_tokens(self, input_tokens: int = 0, output_tokens: int = 0):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current: contextvars.ContextVar = contextvars.ContextVar("edugpt_span", default=None)
+
+
+class JSONLExporter:
+    """Appends each finished span to a file as one JSON line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+
+    def __call__(self, span: Dict[str, Any]):
+        line = json.dumps(span, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class SpanCollector:
+    """Keeps finished spans in memory and summarises them per stage, for benchmarks"""
+
+    def __init__(self):
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, span: Dict[str, Any]):
+        with self._lock:
+            self.spans.append(span)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Count, p50/p95/max milliseconds and mean tokens per span name, in order of first appearance"""
+        by_name: Dict[str, List[Dict[str, Any]]] = {}
+        for span in list(self.spans):
+            by_name.setdefault(span["name"], []).append(span)
+        rows = []
+        for name, spans in by_name.items():
+            durations = [span["duration_ms"] for span in spans]
+            rows.append({
+                "stage": name,
+                "count": len(spans),
+                "p50_ms": percentile(durations, 0.50),
+                "p95_ms": percentile(durations, 0.95),
+                "max_ms": max(durations),
+                "mean_input_tokens": sum(span["input_tokens"] for span in spans) / len(spans),
+                "mean_output_tokens": sum(span["output_tokens"] for span in spans) / len(spans),
+                "errors": sum(1 for span in spans if span["error"]),
+            })
+        return rows
+
+    def render(self) -> str:
+        """The summary as a fixed-width table"""
+        lines = [f"{'Stage':<32}{'n':>6}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}{'in tok':>9}{'out tok':>9}{'err':>5}"]
+        for row in self.summary():
+            lines.append(
+                f"{row['stage']:<32}{row['count']:>6}{row['p50_ms']:>11.1f}{row['p95_ms']:>11.1f}{row['max_ms']:>11.1f}"
+                f"{row['mean_input_tokens']:>9.0f}{row['mean_output_tokens']:>9.0f}{row['errors']:>5}"
+            )
+        return "\n".join(lines)
+
+    def write_csv(self, path: str):
+        rows = self.summary()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["stage"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile; 0.0 for no values"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Tracer:
+    """Lightweight spans around pipeline stages, exported to JSONL, OpenTelemetry or in-memory collectors.
+
+    Spans nest through a context variable, so they follow both threads and
+    asyncio tasks. With no exporter configured ``span`` costs next to nothing.
+    """
+
+    def __init__(self, exporters: Optional[List[SpanExporter]] = None, use_opentelemetry: bool = False):
+        self.exporters: List[SpanExporter] = list(exporters or [])
+        self.logger = logging.getLogger(__name__)
+        self._otel = None
+        if use_opentelemetry:
+            if otel_trace is None:
+                self.logger.warning("OpenTelemetry tracing requested but opentelemetry-api is not installed")
+            else:
+                self._otel = otel_trace.get_tracer("edugpt")
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """EDUGPT_TRACE_FILE=spans.jsonl writes JSONL; EDUGPT_TRACE_OTEL=1 also reports to OpenTelemetry"""
+        path = os.environ.get("EDUGPT_TRACE_FILE")
+        return cls(
+            exporters=[JSONLExporter(path)] if path else [],
+            use_opentelemetry=os.environ.get("EDUGPT_TRACE_OTEL", "").lower() in ("1", "true", "yes"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters) or self._otel is not None
+
+    def add_exporter(self, exporter: SpanExporter):
+        self.exporters.append(exporter)
+
+    def remove_exporter(self, exporter: SpanExporter):
+        if exporter in self.exporters:
+            self.exporters.remove(exporter)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Any]:
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+
+        span = Span(name, _current.get(), attributes)
+        token = _current.set(span)
+        otel_context = self._otel.start_as_current_span(name) if self._otel else contextlib.nullcontext()
+        with otel_context as otel_span:
+            try:
+                yield span
+            except GeneratorExit:
+                # A consumer that stopped reading a stream early is not a failure
+                raise
+            except BaseException as e:
+                span.error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                span.seconds = time.perf_counter() - span.started
+                try:
+                    _current.reset(token)
+                except ValueError:
+                    # Closed from another context, e.g. an abandoned async generator finalised by the loop
+                    _current.set(span.parent)
+                if otel_span is not None:
+                    self._finish_otel(otel_span, span)
+                self._export(span)
+
+    def current_span(self) -> Any:
+        """The innermost open span, or a no-op one outside any span"""
+        return _current.get() or _NOOP_SPAN
+
+    def _finish_otel(self, otel_span: Any, span: Span):
+        for key, value in span.attributes.items():
+            otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+        otel_span.set_attribute("llm.input_tokens", span.input_tokens)
+        otel_span.set_attribute("llm.output_tokens", span.output_tokens)
+        if span.error:
+            otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, span.error))
+
+    def _export(self, span: Span):
+        record = span.to_dict()
+        for exporter in list(self.exporters):
+            try:
+                exporter(record)
+            except Exception as e:
+                # Tracing must never break the request it observes
+                self.logger.warning(f"Span exporter failed: {e}")
+
+
+# Shared by the syllabus and teaching pipelines and the LLM scheduler
+tracer = Tracer.from_env()
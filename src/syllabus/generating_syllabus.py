@@ -1,7 +1,10 @@
+import contextlib
 import os
-from typing import List
+import threading
+from typing import Callable, List, Optional
 
 from langchain_google_genai import ChatGoogleGenerativeAI  # Changed to Gemini
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import (
     HumanMessagePromptTemplate,
     SystemMessagePromptTemplate,
@@ -13,6 +16,10 @@ from langchain_core.messages import (
     SystemMessage,
 )
 
+from llm_quota import BATCH, estimate_tokens, llm_scheduler
+from token_ledger import token_ledger
+from tracing import tracer
+
 # Load Google Gemini API key
 try:
     with open(".env", "r") as f:
@@ -36,9 +43,15 @@ class DiscussAgent:
         self,
         system_message: SystemMessage,
         model: ChatGoogleGenerativeAI,  # Changed to Gemini
+        priority: int = BATCH,
+        role: str = "",
     ) -> None:
         self.system_message = system_message
         self.model = model
+        # Shown on this agent's trace spans
+        self.role = role
+        # Scheduling class of this agent's calls in the shared Gemini quota
+        self.priority = priority
         self.init_messages()
 
     def reset(self) -> None:
@@ -58,11 +71,21 @@ class DiscussAgent:
     ) -> AIMessage:
         messages = self.update_messages(input_message)
 
-        output_message = self.model.invoke(messages)
+        with tracer.span("syllabus.agent_step", role=self.role, messages=len(messages)):
+            output_message = llm_scheduler.call(
+                lambda: self.model.invoke(messages), estimate_tokens(messages), self.priority
+            )
         self.update_messages(output_message)
 
         return output_message
 
+class SyllabusCancelled(Exception):
+    """Raised inside generate_syllabus when its cancel event is set"""
+
+
+# Progress callbacks receive the completed fraction (0-1) and a short stage description
+ProgressCallback = Callable[[float, str], None]
+
 # Set up roles
 assistant_role_name = "Instructor"
 user_role_name = "Teaching Assistant"
@@ -145,7 +168,9 @@ try:
     gemini_llm = ChatGoogleGenerativeAI(
         model="gemini-2.0-flash", 
         temperature=1.0,
-        google_api_key=os.environ.get("GOOGLE_API_KEY", "")
+        google_api_key=os.environ.get("GOOGLE_API_KEY", ""),
+        # Rate limits are retried by llm_scheduler, which knows about every other call
+        max_retries=1,
     )
 except Exception as e:
     print(f"❌ Failed to initialize Gemini: {e}")
@@ -161,14 +186,43 @@ Please reply with the specified task in {word_limit} words or less. Do not add a
 task_specifier_template = HumanMessagePromptTemplate.from_template(
     template=task_specifier_prompt
 )
-task_specify_agent = DiscussAgent(
-    task_specifier_sys_msg, gemini_llm
-)
 
 
 # Function to generating the syllabus
-def generate_syllabus(topic, task):
+def generate_syllabus(
+    topic,
+    task,
+    progress_callback: Optional[ProgressCallback] = None,
+    cancel_event: Optional[threading.Event] = None,
+    llm: Optional[BaseChatModel] = None,
+):
+    """Role-play a syllabus for the topic; llm, if given, replaces Gemini in every stage (e.g. a fake for benchmarks)"""
+    # Each checkpoint ends the previous stage's span and opens the next one
+    with tracer.span("syllabus.generate", topic=topic), token_ledger.attribute(topic=topic), \
+            contextlib.ExitStack() as stage_span:
+        def checkpoint(progress: float, stage: str, span_name: str, **attributes):
+            stage_span.close()
+            # Cancellation takes effect between LLM calls
+            if cancel_event is not None and cancel_event.is_set():
+                raise SyllabusCancelled(f"Cancelled while {stage.lower()}")
+            if progress_callback is not None:
+                progress_callback(progress, stage)
+            stage_span.enter_context(tracer.span(span_name, **attributes))
+            stage_span.enter_context(token_ledger.attribute(stage=span_name, turn=attributes.get("turn")))
+
+        syllabus = _discuss_syllabus(topic, task, checkpoint, llm)
+        stage_span.close()
+    if progress_callback is not None:
+        progress_callback(1.0, "Done")
+    return syllabus
+
+
+def _discuss_syllabus(topic, task, checkpoint: Callable[..., None], llm: Optional[BaseChatModel]) -> str:
+    # A fresh agent per call, so concurrent generations do not share message history
+    task_specify_agent = DiscussAgent(task_specifier_sys_msg, llm or gemini_llm, role="task_specifier")
+
     # Get the specified task
+    checkpoint(0.0, "Specifying the task", "syllabus.specify_task")
     task_specifier_msg = task_specifier_template.format_messages(
         assistant_role_name=assistant_role_name,
         user_role_name=user_role_name,
@@ -182,14 +236,15 @@ def generate_syllabus(topic, task):
     )
 
     # Use lower temperature for more consistent responses
-    discussion_llm = ChatGoogleGenerativeAI(
+    discussion_llm = llm or ChatGoogleGenerativeAI(
         model="gemini-2.0-flash",  # Updated model name
         temperature=0.2,
-        google_api_key=os.environ.get("GOOGLE_API_KEY", "")
+        google_api_key=os.environ.get("GOOGLE_API_KEY", ""),
+        max_retries=1,
     )
     
-    assistant_agent = DiscussAgent(assistant_sys_msg, discussion_llm)
-    user_agent = DiscussAgent(user_sys_msg, discussion_llm)
+    assistant_agent = DiscussAgent(assistant_sys_msg, discussion_llm, role=assistant_role_name)
+    user_agent = DiscussAgent(user_sys_msg, discussion_llm, role=user_role_name)
 
     # Reset agents
     assistant_agent.reset()
@@ -205,6 +260,7 @@ def generate_syllabus(topic, task):
     )
 
     user_msg = HumanMessage(content=f"{assistant_sys_msg.content}")
+    checkpoint(0.1, "Starting the discussion", "syllabus.discussion_start")
     user_msg = assistant_agent.step(user_msg)
 
     print(f"Specified task prompt:\n{specified_task}\n")
@@ -213,6 +269,12 @@ def generate_syllabus(topic, task):
     # Start role-playing session to solve the task!
     chat_turn_limit, n = 5, 0
     while n < chat_turn_limit:
+        checkpoint(
+            0.2 + 0.6 * n / chat_turn_limit,
+            f"Discussing the syllabus (turn {n + 1} of up to {chat_turn_limit})",
+            "syllabus.discussion_turn",
+            turn=n + 1,
+        )
         n += 1
         user_ai_msg = user_agent.step(assistant_msg)
         user_msg = HumanMessage(content=user_ai_msg.content)
@@ -239,18 +301,20 @@ def generate_syllabus(topic, task):
     )
     
     # Use higher temperature for creative summarization
-    summarizer_llm = ChatGoogleGenerativeAI(
+    summarizer_llm = llm or ChatGoogleGenerativeAI(
         model="gemini-2.0-flash",  
         temperature=0.8,
-        google_api_key=os.environ.get("GOOGLE_API_KEY", "")
+        google_api_key=os.environ.get("GOOGLE_API_KEY", ""),
+        max_retries=1,
     )
     
-    summarizer_agent = DiscussAgent(summarizer_sys_msg, summarizer_llm)
+    summarizer_agent = DiscussAgent(summarizer_sys_msg, summarizer_llm, role="summarizer")
     summarizer_msg = summarizer_template.format_messages(
         assistant_role_name=assistant_role_name,
         user_role_name=user_role_name,
         conversation_history=conversation_history,
         topic=topic
     )[0]
+    checkpoint(0.8, "Summarizing into a syllabus", "syllabus.summarize")
     summarizered_msg = summarizer_agent.step(summarizer_msg)
     return summarizered_msg.content
\ No newline at end of file
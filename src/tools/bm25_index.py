@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+CACHE_VERSION = 1
+DEFAULT_PASSAGE_WORDS = 120
+ARTICLE_EXTENSIONS = (".txt", ".md")
+DUMP_EXTENSIONS = (".jsonl", ".json")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were which with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def iter_articles(path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (title, text) from a folder of .txt/.md articles and/or JSONL dumps with title/text fields"""
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = []
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+            files.extend(os.path.join(dirpath, name) for name in sorted(filenames))
+
+    for file_path in files:
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in DUMP_EXTENSIONS:
+            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict) and record.get("text"):
+                        yield record.get("title", ""), record["text"]
+        elif extension in ARTICLE_EXTENSIONS:
+            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            title = os.path.splitext(os.path.basename(file_path))[0].replace("_", " ")
+            first_line = text.lstrip().split("\n", 1)[0]
+            if first_line.startswith("#"):
+                title = first_line.lstrip("#").strip() or title
+            yield title, text
+
+
+def split_passages(text: str, passage_words: int) -> List[str]:
+    """Group paragraphs into passages of roughly ``passage_words`` words"""
+    passages, current, count = [], [], 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = paragraph.split()
+        if not words:
+            continue
+        # Very long paragraphs are cut into windows of their own
+        while len(words) > passage_words:
+            if current:
+                passages.append(" ".join(current))
+                current, count = [], 0
+            passages.append(" ".join(words[:passage_words]))
+            words = words[passage_words:]
+        if count + len(words) > passage_words and current:
+            passages.append(" ".join(current))
+            current, count = [], 0
+        current.extend(words)
+        count += len(words)
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+class BM25Index:
+    """Okapi BM25 over article passages, stored as term-major NumPy arrays.
+
+    Each term's postings are a contiguous slice of ``doc_ids``/``weights``, and
+    the weights already include IDF and length normalisation, so scoring a
+    query is one ``np.bincount`` over the concatenated slices.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self.titles: List[str] = []
+        self.passages: List[str] = []
+        self.passage_titles = np.zeros(0, dtype=np.int32)
+        self.term_offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float32)
+
+    @property
+    def size(self) -> int:
+        return len(self.passages)
+
+    def build(self, articles: Iterator[Tuple[str, str]], passage_words: int = DEFAULT_PASSAGE_WORDS):
+        term_ids, doc_ids, counts, lengths, passage_titles = [], [], [], [], []
+        vocabulary: Dict[str, int] = {}
+
+        for title, text in articles:
+            title_id = len(self.titles)
+            self.titles.append(title)
+            for passage in split_passages(text, passage_words):
+                doc_id = len(self.passages)
+                self.passages.append(passage)
+                passage_titles.append(title_id)
+                # Title words count towards every passage of the article
+                tokens = tokenize(f"{title} {passage}")
+                lengths.append(len(tokens))
+                passage_counts: Dict[int, int] = {}
+                for token in tokens:
+                    term_id = vocabulary.setdefault(token, len(vocabulary))
+                    passage_counts[term_id] = passage_counts.get(term_id, 0) + 1
+                term_ids.extend(passage_counts.keys())
+                counts.extend(passage_counts.values())
+                doc_ids.extend([doc_id] * len(passage_counts))
+
+        self.vocabulary = vocabulary
+        self.passage_titles = np.asarray(passage_titles, dtype=np.int32)
+        if not self.passages:
+            return
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        tf = np.asarray(counts, dtype=np.float32)
+        lengths = np.asarray(lengths, dtype=np.float32)
+
+        n_docs = len(self.passages)
+        df = np.bincount(term_ids, minlength=len(vocabulary)).astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * lengths[doc_ids] / max(lengths.mean(), 1.0))
+        weights = idf[term_ids] * tf * (self.k1 + 1) / (tf + norm)
+
+        order = np.argsort(term_ids, kind="stable")
+        self.doc_ids = doc_ids[order]
+        self.weights = weights[order].astype(np.float32)
+        self.term_offsets = np.concatenate(([0], np.cumsum(df.astype(np.int64))))
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        """Return (passage id, score) of the best matching passages"""
+        term_ids = [self.vocabulary[token] for token in set(tokenize(query)) if token in self.vocabulary]
+        if not term_ids or not self.passages:
+            return []
+
+        slices = [slice(self.term_offsets[t], self.term_offsets[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        scores = np.bincount(docs, weights=weights, minlength=len(self.passages))
+
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(doc), float(scores[doc])) for doc in best if scores[doc] > 0]
+
+    def title_of(self, passage_id: int) -> str:
+        return self.titles[self.passage_titles[passage_id]]
+
+    def save(self, cache_path: str, signature: str):
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        meta = {
+            "version": CACHE_VERSION,
+            "signature": signature,
+            "k1": self.k1,
+            "b": self.b,
+            "vocabulary": self.vocabulary,
+            "titles": self.titles,
+            "passages": self.passages,
+        }
+        tmp_path = f"{cache_path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+            passage_titles=self.passage_titles,
+            term_offsets=self.term_offsets,
+            doc_ids=self.doc_ids,
+            weights=self.weights,
+        )
+        os.replace(tmp_path, cache_path)
+
+    @classmethod
+    def load(cls, cache_path: str, signature: str) -> Optional["BM25Index"]:
+        """Load a cached index, or None if it is missing or was built from other sources"""
+        try:
+            with np.load(cache_path) as data:
+                meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+                if meta.get("version") != CACHE_VERSION or meta.get("signature") != signature:
+                    return None
+                index = cls(meta["k1"], meta["b"])
+                index.vocabulary = meta["vocabulary"]
+                index.titles = meta["titles"]
+                index.passages = meta["passages"]
+                index.passage_titles = data["passage_titles"]
+                index.term_offsets = data["term_offsets"]
+                index.doc_ids = data["doc_ids"]
+                index.weights = data["weights"]
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            logging.getLogger(__name__).info(f"Rebuilding knowledge index, cache unusable: {e}")
+            return None
+
+
+def source_signature(path: str, passage_words: int) -> str:
+    """Hash of the source files' names, sizes and mtimes, used to validate the cache"""
+    digest = hashlib.sha1(f"{os.path.realpath(path)}:{passage_words}".encode())
+    paths = [path] if os.path.isfile(path) else [
+        os.path.join(dirpath, name) for dirpath, _, filenames in os.walk(path) for name in filenames
+    ]
+    for file_path in sorted(paths):
+        if os.path.splitext(file_path)[1].lower() in ARTICLE_EXTENSIONS + DUMP_EXTENSIONS:
+            stat = os.stat(file_path)
+            digest.update(f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
@@ -0,0 +1,189 @@
+import asyncio
+import fnmatch
+import mmap
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from providers import ToolProvider, register_provider_type
+from search_index import InvertedIndex
+
+DEFAULT_MAX_READ_BYTES = 1024 * 1024
+# Files at least this large are memory-mapped and read off the event loop
+DEFAULT_MMAP_THRESHOLD = 64 * 1024
+DEFAULT_MAX_SEARCH_RESULTS = 200
+DEFAULT_INDEX_REFRESH_SECONDS = 30.0
+DEFAULT_CONTENT_RESULTS = 10
+
+
+@register_provider_type("native-filesystem")
+class FilesystemProvider(ToolProvider):
+    """In-process filesystem tools sandboxed to a root directory"""
+
+    def __init__(self, server_id: str, config: Dict[str, Any]):
+        super().__init__(server_id, config)
+        self.root = Path(config.get("root", ".")).resolve()
+        self.max_read_bytes = int(config.get("max_read_bytes", DEFAULT_MAX_READ_BYTES))
+        self.mmap_threshold = int(config.get("mmap_threshold", DEFAULT_MMAP_THRESHOLD))
+        self.max_search_results = int(config.get("max_search_results", DEFAULT_MAX_SEARCH_RESULTS))
+
+        # Optional persistent index over the course materials, see `index:` in mcp_config.yaml
+        self.index: Optional[InvertedIndex] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        index_config = config.get("index")
+        if index_config:
+            index_config = index_config if isinstance(index_config, dict) else {}
+            index_root = self.resolve(index_config.get("root", "."))
+            self.index = InvertedIndex(
+                str(index_root),
+                index_path=index_config.get("path", str(index_root / ".edugpt" / "search_index.json")),
+                extensions=index_config.get("extensions"),
+            )
+            self.index_refresh_seconds = float(index_config.get("refresh_seconds", DEFAULT_INDEX_REFRESH_SECONDS))
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        path_property = {"path": {"type": "string", "description": "Path relative to the course root"}}
+        return [
+            {
+                "name": "read_file",
+                "description": "Read the contents of a text file",
+                "inputSchema": {"type": "object", "properties": path_property, "required": ["path"]},
+            },
+            {
+                "name": "list_files",
+                "description": "List the files and directories in a directory",
+                "inputSchema": {"type": "object", "properties": path_property},
+            },
+            {
+                "name": "search_files",
+                "description": (
+                    "Find files by name or by the words they contain" if self.index else
+                    "Recursively find files and directories whose name matches a pattern"
+                ),
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        **path_property,
+                        "pattern": {"type": "string", "description": "Substring or glob, case-insensitive"},
+                    },
+                    "required": ["pattern"],
+                },
+            },
+        ]
+
+    async def call_tool(self, tool_name: str, arguments: Dict) -> Dict[str, Any]:
+        handlers = {
+            "read_file": self.read_file,
+            "list_files": self.list_files,
+            # Name used by @modelcontextprotocol/server-filesystem
+            "list_directory": self.list_files,
+            "search_files": self.search_files,
+        }
+        if tool_name not in handlers:
+            return self.text_result(f"Unknown tool: {tool_name}", is_error=True)
+
+        try:
+            return self.text_result(await handlers[tool_name](**arguments))
+        except TypeError as e:
+            return self.text_result(f"Invalid arguments for {tool_name}: {e}", is_error=True)
+        except (OSError, ValueError) as e:
+            return self.text_result(str(e), is_error=True)
+
+    def resolve(self, path: str) -> Path:
+        """Resolve a path inside the root, rejecting anything that escapes it"""
+        candidate = (self.root / path).resolve()
+        if candidate != self.root and self.root not in candidate.parents:
+            raise PermissionError(f"Access denied: {path} is outside {self.root}")
+        return candidate
+
+    async def read_file(self, path: str) -> str:
+        target = self.resolve(path)
+        size = target.stat().st_size
+        if size >= self.mmap_threshold:
+            data = await asyncio.to_thread(self._read_mapped, target, size)
+        else:
+            with open(target, "rb") as f:
+                data = f.read(self.max_read_bytes)
+
+        text = data.decode("utf-8", errors="replace")
+        if size > self.max_read_bytes:
+            text += f"\n... [truncated: showing {self.max_read_bytes} of {size} bytes]"
+        return text
+
+    async def list_files(self, path: str = ".") -> str:
+        target = self.resolve(path)
+        with os.scandir(target) as entries:
+            lines = sorted(
+                f"[DIR] {entry.name}" if entry.is_dir() else f"[FILE] {entry.name}"
+                for entry in entries
+            )
+        return "\n".join(lines) if lines else "(empty directory)"
+
+    async def search_files(self, pattern: str, path: str = ".") -> str:
+        target = self.resolve(path)
+        if self.index is not None:
+            return await self._search_index(pattern, target)
+        matches = await asyncio.to_thread(self._find, target, pattern)
+        if not matches:
+            return f"No files matching '{pattern}'"
+        return "\n".join(matches)
+
+    async def refresh_index(self) -> Dict[str, int]:
+        """Bring the search index up to date with the files on disk"""
+        return await asyncio.to_thread(self.index.refresh)
+
+    async def close(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+
+    async def _search_index(self, pattern: str, target: Path) -> str:
+        if self.index.last_refresh is None:
+            await self.refresh_index()
+        elif time.monotonic() - self.index.last_refresh >= self.index_refresh_seconds:
+            # Answer from the current index and catch up in the background
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self.refresh_index())
+
+        index_root = Path(self.index.root)
+        if target != index_root and index_root not in target.parents and target not in index_root.parents:
+            return f"No files matching '{pattern}' (the search index covers {index_root.relative_to(self.root)})"
+
+        def under_target(relative: str) -> bool:
+            full_path = index_root / relative
+            return target == full_path or target in full_path.parents
+
+        def display(relative: str) -> str:
+            return os.path.relpath(index_root / relative, self.root)
+
+        names = [display(p) for p in self.index.match_names(pattern, self.max_search_results) if under_target(p)]
+        hits = [(p, score) for p, score in self.index.search(pattern, self.max_search_results) if under_target(p)]
+
+        lines = []
+        if names:
+            lines.append(f"Files whose name matches '{pattern}':")
+            lines.extend(f"- {name}" for name in names)
+        if hits:
+            lines.append(f"Files mentioning '{pattern}':")
+            for relative, score in hits[:DEFAULT_CONTENT_RESULTS]:
+                snippet = self.index.snippet(relative, pattern)
+                lines.append(f"- {display(relative)} (score {score:.2f}): {snippet}")
+        return "\n".join(lines) if lines else f"No files matching '{pattern}'"
+
+    def _read_mapped(self, target: Path, size: int) -> bytes:
+        with open(target, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[:min(size, self.max_read_bytes)]
+
+    def _find(self, target: Path, pattern: str) -> List[str]:
+        pattern = pattern.lower()
+        is_glob = any(char in pattern for char in "*?[")
+        matches = []
+        for dirpath, dirnames, filenames in os.walk(target):
+            dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+            for name in dirnames + filenames:
+                lowered = name.lower()
+                if fnmatch.fnmatch(lowered, pattern) if is_glob else pattern in lowered:
+                    matches.append(os.path.relpath(os.path.join(dirpath, name), self.root))
+                    if len(matches) >= self.max_search_results:
+                        return matches
+        return sorted(matches)
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from bm25_index import DEFAULT_PASSAGE_WORDS, BM25Index, iter_articles, source_signature
+from providers import ToolProvider, register_provider_type
+
+DEFAULT_TOP_K = 3
+MAX_TOP_K = 10
+
+
+@register_provider_type("offline-knowledge")
+class KnowledgeProvider(ToolProvider):
+    """Offline article search over a local Wikipedia-style dump or folder of articles"""
+
+    def __init__(self, server_id: str, config: Dict[str, Any]):
+        super().__init__(server_id, config)
+        self.path = config.get("path", "data/knowledge")
+        self.cache_path = config.get("cache_path", os.path.join(self.path, ".edugpt", "bm25_index.npz"))
+        if os.path.isfile(self.path):
+            self.cache_path = config.get("cache_path", f"{self.path}.bm25.npz")
+        self.passage_words = int(config.get("passage_words", DEFAULT_PASSAGE_WORDS))
+        self.default_top_k = int(config.get("top_k", DEFAULT_TOP_K))
+        self.index: Optional[BM25Index] = None
+        self._build_lock = asyncio.Lock()
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": "search",
+                "description": "Search the offline encyclopedia and return the most relevant passages",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "What to look up"},
+                        "top_k": {"type": "integer", "description": f"Number of passages (max {MAX_TOP_K})"},
+                    },
+                    "required": ["query"],
+                },
+            },
+        ]
+
+    async def warm_up(self):
+        if not os.path.exists(self.path):
+            # Nothing to index yet; searches report the missing articles when they are made
+            print(f"💤 Skipping warm-up of {self.server_id}: no articles at {self.path}")
+            return
+        await self._ensure_index()
+
+    async def call_tool(self, tool_name: str, arguments: Dict) -> Dict[str, Any]:
+        if tool_name != "search":
+            return self.text_result(f"Unknown tool: {tool_name}", is_error=True)
+        query = arguments.get("query", "")
+        if not query.strip():
+            return self.text_result("Missing 'query' argument", is_error=True)
+        try:
+            top_k = max(1, min(int(arguments.get("top_k", self.default_top_k)), MAX_TOP_K))
+        except (TypeError, ValueError):
+            return self.text_result(f"'top_k' must be an integer, got {arguments['top_k']!r}", is_error=True)
+
+        try:
+            index = await self._ensure_index()
+        except OSError as e:
+            return self.text_result(f"Knowledge base unavailable: {e}", is_error=True)
+
+        results = index.search(query, top_k)
+        if not results:
+            return self.text_result(f"No passages found for '{query}'")
+
+        lines = []
+        for rank, (passage_id, score) in enumerate(results, start=1):
+            lines.append(f"[{rank}] {index.title_of(passage_id)} (score {score:.2f})\n{index.passages[passage_id]}")
+        return self.text_result("\n\n".join(lines))
+
+    async def _ensure_index(self) -> BM25Index:
+        if self.index is not None:
+            return self.index
+        async with self._build_lock:
+            if self.index is None:
+                self.index = await asyncio.to_thread(self._load_or_build)
+        return self.index
+
+    def _load_or_build(self) -> BM25Index:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"No articles found at {self.path}")
+
+        signature = source_signature(self.path, self.passage_words)
+        index = BM25Index.load(self.cache_path, signature)
+        if index is not None:
+            return index
+
+        started = time.monotonic()
+        index = BM25Index()
+        index.build(iter_articles(self.path), self.passage_words)
+        index.save(self.cache_path, signature)
+        print(
+            f"📚 Indexed {len(index.titles)} articles into {index.size} passages "
+            f"in {time.monotonic() - started:.1f}s ({self.server_id})"
+        )
+        return index
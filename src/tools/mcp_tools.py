@@ -1,48 +1,483 @@
 import asyncio
+import json
 import logging
-from typing import Dict, List, Any
+import os
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+import yaml
+
+from mcp_metrics import DEFAULT_SIZE_BUCKETS, metrics
+from mcp_service import MCPService
+from providers import ToolProvider, create_provider
+from result_spool import SpilledResult, result_spool
+# Imported for their provider type registration
+import filesystem_provider  # noqa: F401
+from results_provider import RESULTS_SERVER_ID, ResultSpoolProvider
+try:
+    import knowledge_provider  # noqa: F401
+except ImportError as e:
+    print(f"⚠️  Offline knowledge provider not available: {e}")
+
+# Tool descriptions are cut to this length in the prompt manifest
+MANIFEST_DESCRIPTION_CHARS = 80
+DEFAULT_CONFIG_POLL_SECONDS = 2.0
+
+TOOL_CALL_SECONDS = metrics.histogram(
+    "edugpt_tool_call_seconds", "End-to-end latency of tool calls, including in-process tools", ("server", "tool")
+)
+TOOL_CALLS = metrics.counter("edugpt_tool_calls_total", "Tool calls by outcome", ("server", "tool", "outcome"))
+TOOL_IN_FLIGHT = metrics.gauge("edugpt_tool_calls_in_flight", "Tool calls currently running", ("server",))
+TOOL_ARGUMENT_BYTES = metrics.histogram(
+    "edugpt_tool_argument_bytes", "Size of tool call arguments as JSON", ("server", "tool"), DEFAULT_SIZE_BUCKETS
+)
+TOOL_RESULT_BYTES = metrics.histogram(
+    "edugpt_tool_result_bytes", "Size of tool result text", ("server", "tool"), DEFAULT_SIZE_BUCKETS
+)
+
+
+def load_server_configs(path: str) -> List[Dict]:
+    """Read the server entries of an mcp_config.yaml file"""
+    with open(path, "r") as f:
+        config = yaml.safe_load(f) or {}
+    servers = config.get("servers") or []
+    for server in servers:
+        if not isinstance(server, dict) or "id" not in server:
+            raise ValueError(f"Invalid server entry in {path}: {server!r}")
+    return servers
+
+
+def config_fingerprint(config: Dict) -> str:
+    return json.dumps(config, sort_keys=True, default=str)
 
 class MCPToolManager:
-    def __init__(self):
+    def __init__(self, use_mock: bool = None):
         self.mcp_service = None
+        # Set MCP_USE_MOCK=1 to demo the tools without Node.js / npx installed
+        if use_mock is None:
+            use_mock = os.environ.get("MCP_USE_MOCK", "") == "1"
+        self.use_mock = use_mock
+        # In-process tool providers, consulted before the MCP service
+        self.providers: Dict[str, ToolProvider] = {
+            RESULTS_SERVER_ID: ResultSpoolProvider(RESULTS_SERVER_ID, {"name": "Spilled tool results"}),
+        }
+        # Configuration each registered server is currently running with
+        self.server_configs: Dict[str, Dict] = {}
         self.logger = logging.getLogger(__name__)
+        self._watch_task: Optional[asyncio.Task] = None
+        # Background tools/list of servers that were not running when a manifest was built
+        self.discovering: Dict[str, asyncio.Task] = {}
+    
+    def register_provider(self, server_id: str, provider: ToolProvider):
+        """Serve a server's tools in-process instead of through an MCP subprocess"""
+        self.providers[server_id] = provider
+    
+    def register_servers(self, server_configs: List[Dict]):
+        """Register MCP servers from configuration; they start on their first tool call"""
+        if self.mcp_service is None:
+            self.mcp_service = MockMCPService() if self.use_mock else MCPService()
+        
+        for config in server_configs:
+            if config.get('provider'):
+                self.register_provider(config['id'], create_provider(config['id'], config))
+            else:
+                self.mcp_service.register_server(config['id'], config)
+            self.server_configs[config['id']] = config
+    
+    async def reconcile(self, server_configs: List[Dict]) -> Dict[str, List[str]]:
+        """Bring the registered servers in line with the desired configuration.
+        
+        Added servers are registered (and started if warm), changed servers are
+        restarted with their new settings, removed servers are drained and
+        stopped; servers whose configuration is unchanged are left alone.
+        """
+        if self.mcp_service is None:
+            self.mcp_service = MockMCPService() if self.use_mock else MCPService()
+        
+        desired = {config['id']: config for config in server_configs}
+        changes = {"added": [], "changed": [], "removed": [], "unchanged": []}
+        for server_id in self.server_configs:
+            if server_id not in desired:
+                changes["removed"].append(server_id)
+        for server_id, config in desired.items():
+            current = self.server_configs.get(server_id)
+            if current is None:
+                changes["added"].append(server_id)
+            elif config_fingerprint(current) != config_fingerprint(config):
+                changes["changed"].append(server_id)
+            else:
+                changes["unchanged"].append(server_id)
+        
+        server_ids = changes["removed"] + changes["changed"] + changes["added"]
+        results = await asyncio.gather(
+            *[self._remove_server(server_id) for server_id in changes["removed"]],
+            *[self._replace_server(desired[server_id]) for server_id in changes["changed"]],
+            *[self._add_server(desired[server_id]) for server_id in changes["added"]],
+            return_exceptions=True
+        )
+        for server_id, result in zip(server_ids, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"Applying config of MCP server {server_id} failed: {result}")
+        for kind in ("added", "changed", "removed"):
+            if changes[kind]:
+                print(f"🔁 MCP servers {kind}: {', '.join(changes[kind])}")
+        return changes
     
-    async def initialize_servers(self, server_configs: List[Dict]):
-        """Initialize MCP servers from configuration"""
-        # Mock implementation - replace with actual MCP service
-        self.mcp_service = MockMCPService()
+    def watch_config(self, path: str, interval: float = DEFAULT_CONFIG_POLL_SECONDS):
+        """Reconcile the servers whenever the config file changes; call from the app's event loop"""
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch_config(path, interval))
+    
+    async def _watch_config(self, path: str, interval: float):
+        last_seen = None
+        try:
+            stat = os.stat(path)
+            last_seen = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            pass
+        
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if (stat.st_mtime_ns, stat.st_size) == last_seen:
+                continue
+            last_seen = (stat.st_mtime_ns, stat.st_size)
+            try:
+                await self.reconcile(load_server_configs(path))
+            except Exception as e:
+                # Often a half-saved file; the next save triggers another attempt
+                self.logger.warning(f"Ignoring unusable MCP config {path}: {e}")
+    
+    async def _add_server(self, config: Dict):
+        self.register_servers([config])
+        if config.get('warm'):
+            if config['id'] in self.providers:
+                await self.providers[config['id']].warm_up()
+            else:
+                await self.mcp_service.ensure_server(config['id'])
+    
+    async def _remove_server(self, server_id: str):
+        self.server_configs.pop(server_id, None)
+        provider = self.providers.pop(server_id, None)
+        if provider is not None:
+            await provider.close()
+        else:
+            await self.mcp_service.remove_server(server_id)
+    
+    async def _replace_server(self, config: Dict):
+        server_id = config['id']
+        was_provider = server_id in self.providers
+        if was_provider or config.get('provider'):
+            # Provider settings are applied by building a new provider
+            await self._remove_server(server_id)
+            await self._add_server(config)
+            return
+        self.server_configs[server_id] = config
+        await self.mcp_service.replace_server(server_id, config)
+    
+    async def initialize_servers(self, server_configs: List[Dict], start_all: bool = False) -> Dict[str, Dict]:
+        """Initialize MCP servers from configuration and report readiness per server"""
         print(f"🔄 Initializing {len(server_configs)} MCP servers...")
+        self.register_servers(server_configs)
         
+        # Servers start concurrently; unless start_all is set only the warm ones start now
+        server_ids = [
+            config['id'] for config in server_configs if config['id'] not in self.providers
+        ] if start_all else None
+        results = await self.mcp_service.warm_up(server_ids)
+        
+        report = {}
         for config in server_configs:
-            success = await self.mcp_service.start_server(config['id'], config)
-            if success:
-                print(f"✅ Started MCP server: {config['name']}")
+            server_id = config['id']
+            if server_id in self.providers:
+                report[server_id] = {"ready": True, "started": True, "latency": 0.0, "in_process": True}
+                print(f"⚡ In-process tool provider: {config['name']}")
+                continue
+            if server_id not in results:
+                report[server_id] = {"ready": False, "started": False}
+                print(f"💤 Registered MCP server (starts on demand): {config['name']}")
+                continue
+            
+            startup = self.mcp_service.get_startup_report(server_id)
+            report[server_id] = {"started": True, **startup}
+            if results[server_id]:
+                print(f"✅ Started MCP server: {config['name']} (ready in {startup.get('latency', 0):.2f}s)")
             else:
-                print(f"❌ Failed to start MCP server: {config['name']}")
+                print(f"❌ Failed to start MCP server: {config['name']} ({startup.get('error')})")
+        return report
+    
+    async def warm_up(self) -> Dict[str, bool]:
+        """Start the servers marked warm in the configuration"""
+        results = {}
+        warm_providers = [
+            (server_id, provider) for server_id, provider in self.providers.items()
+            if provider.config.get('warm')
+        ]
+        for server_id, provider in warm_providers:
+            try:
+                await provider.warm_up()
+                results[server_id] = True
+            except Exception as e:
+                self.logger.error(f"Warm-up of provider {server_id} failed: {e}")
+                results[server_id] = False
+        if self.mcp_service:
+            results.update(await self.mcp_service.warm_up())
+        return results
     
     async def execute_tool(self, server_id: str, tool_name: str, arguments: Dict) -> str:
         """Execute an MCP tool and return formatted result"""
+        text, _ = await self._execute_tool(server_id, tool_name, arguments)
+        return text
+    
+    async def _execute_tool(self, server_id: str, tool_name: str, arguments: Dict) -> Tuple[str, bool]:
+        self._call_started(server_id, tool_name, arguments)
+        started = time.perf_counter()
+        result = None
+        try:
+            if server_id in self.providers:
+                result = await self.providers[server_id].call_tool(tool_name, arguments)
+            elif not self.mcp_service:
+                result = {"error": "MCP service not initialized"}
+                return "MCP service not initialized", True
+            else:
+                result = await self.mcp_service.call_tool(server_id, tool_name, arguments)
+            return self._format_result(result), self._is_error(result)
+        except Exception as e:
+            result = e
+            return f"Tool execution error: {str(e)}", True
+        finally:
+            self._call_finished(server_id, tool_name, result, time.perf_counter() - started)
+    
+    async def execute_tools(self, calls: List[Tuple[str, str, Dict]]) -> List[Tuple[str, bool]]:
+        """Execute (server_id, tool_name, arguments) calls and return (formatted result, is_error) in call order.
+        
+        Calls are grouped per server and the groups run concurrently; each MCP
+        server receives its group as one JSON-RPC batch when it supports them.
+        """
+        groups: Dict[str, List[int]] = {}
+        for index, (server_id, _, _) in enumerate(calls):
+            groups.setdefault(server_id, []).append(index)
+        
+        async def run_group(server_id: str, indexes: List[int]) -> List[Tuple[str, bool]]:
+            if server_id in self.providers or not self.mcp_service:
+                return await asyncio.gather(*[self._execute_tool(*calls[index]) for index in indexes])
+            for index in indexes:
+                self._call_started(*calls[index])
+            started = time.perf_counter()
+            results = [None] * len(indexes)
+            try:
+                results = await self.mcp_service.call_tools_batch(
+                    server_id, [(calls[index][1], calls[index][2]) for index in indexes]
+                )
+                return [(self._format_result(result), self._is_error(result)) for result in results]
+            except Exception as e:
+                results = [e] * len(indexes)
+                return [(f"Tool execution error: {str(e)}", True)] * len(indexes)
+            finally:
+                # Every call of a batch waited as long as the whole batch
+                elapsed = time.perf_counter() - started
+                for index, result in zip(indexes, results):
+                    self._call_finished(server_id, calls[index][1], result, elapsed)
+        
+        group_results = await asyncio.gather(*[run_group(sid, indexes) for sid, indexes in groups.items()])
+        results: List[Tuple[str, bool]] = [("", False)] * len(calls)
+        for indexes, formatted in zip(groups.values(), group_results):
+            for index, result in zip(indexes, formatted):
+                results[index] = result
+        return results
+    
+    def get_metrics_summary(self) -> List[Dict[str, Any]]:
+        """Calls, errors, latency percentiles and result sizes per server and tool"""
+        rows = []
+        for labels in TOOL_CALL_SECONDS.label_sets():
+            calls = TOOL_CALL_SECONDS.count(**labels)
+            rows.append({
+                "server": labels["server"],
+                "tool": labels["tool"],
+                "calls": calls,
+                "errors": int(TOOL_CALLS.get(outcome="error", **labels)),
+                "p50": TOOL_CALL_SECONDS.quantile(0.5, **labels),
+                "p95": TOOL_CALL_SECONDS.quantile(0.95, **labels),
+                "p99": TOOL_CALL_SECONDS.quantile(0.99, **labels),
+                "mean_result_bytes": TOOL_RESULT_BYTES.mean(**labels),
+            })
+        return sorted(rows, key=lambda row: -(row["p99"] or 0))
+    
+    @staticmethod
+    def _call_started(server_id: str, tool_name: str, arguments: Dict):
+        TOOL_IN_FLIGHT.inc(server=server_id)
+        TOOL_ARGUMENT_BYTES.observe(len(json.dumps(arguments, default=str)), server=server_id, tool=tool_name)
+    
+    @staticmethod
+    def _call_finished(server_id: str, tool_name: str, result: Any, seconds: float):
+        TOOL_IN_FLIGHT.dec(server=server_id)
+        if result is None:
+            outcome = "cancelled"
+        elif MCPToolManager._is_error(result):
+            outcome = "error"
+        else:
+            outcome = "ok"
+        TOOL_CALLS.inc(server=server_id, tool=tool_name, outcome=outcome)
+        TOOL_CALL_SECONDS.observe(seconds, server=server_id, tool=tool_name)
+        
+        if isinstance(result, SpilledResult):
+            size = result.size
+        elif isinstance(result, dict):
+            size = sum(len(item.get("text", "").encode("utf-8")) for item in result.get("content", []))
+        elif isinstance(result, str):
+            size = len(result.encode("utf-8"))
+        else:
+            size = 0
+        TOOL_RESULT_BYTES.observe(size, server=server_id, tool=tool_name)
+    
+    def get_available_servers(self) -> List[str]:
+        """Get the ids of all configured MCP servers"""
+        servers = list(self.providers)
+        if self.mcp_service:
+            servers += self.mcp_service.get_available_servers()
+        return servers
+    
+    async def list_tools(self, server_id: str) -> List[Dict]:
+        """Get the tool definitions (name, description, input schema) of a server"""
+        if server_id in self.providers:
+            return await self.providers[server_id].list_tools()
         if not self.mcp_service:
-            return "MCP service not initialized"
+            return []
+        return await self.mcp_service.list_tools(server_id)
+    
+    async def _known_tools(self, server_id: str) -> List[Dict]:
+        """Tools of a server that can be listed without starting it; others are discovered in the background"""
+        if server_id in self.providers or not self.mcp_service:
+            return await self.list_tools(server_id)
+        if self.mcp_service.is_running(server_id):
+            return await self.mcp_service.list_tools(server_id)
+        cached = self.mcp_service.cached_tools(server_id)
+        if cached is not None:
+            return cached
+        if server_id not in self.discovering:
+            task = asyncio.create_task(self.mcp_service.list_tools(server_id))
+            task.add_done_callback(lambda _: self.discovering.pop(server_id, None))
+            self.discovering[server_id] = task
+        return []
+    
+    async def get_tool_manifest(self) -> str:
+        """Build a compact description of the tools available for the instructor prompt.
         
-        try:
-            result = await self.mcp_service.call_tool(server_id, tool_name, arguments)
+        Starting a server just to list its tools could hold up a turn for its whole
+        startup, so servers that are neither running nor cached are left out until
+        their background discovery finishes (see ``discovering``).
+        """
+        servers = self.get_available_servers()
+        catalogs = await asyncio.gather(*[self._known_tools(server_id) for server_id in servers])
+        
+        lines = []
+        for server_id, tools in zip(servers, catalogs):
+            for tool in tools:
+                arguments = ", ".join(tool.get("inputSchema", {}).get("properties", {}))
+                description = " ".join(tool.get("description", "").split())
+                if len(description) > MANIFEST_DESCRIPTION_CHARS:
+                    description = description[:MANIFEST_DESCRIPTION_CHARS - 3] + "..."
+                line = f"- {server_id} {tool.get('name', 'unknown')}({arguments})"
+                lines.append(f"{line}: {description}" if description else line)
+        
+        if not lines:
+            return ""
+        return (
+            "You can use these tools. To call one, write on its own line:\n"
+            "TOOL: <server_id> <tool_name> {\"argument\": \"value\"}\n"
+            + "\n".join(lines)
+        )
+    
+    def get_server_logs(self, server_id: str, limit: Optional[int] = None) -> List[str]:
+        """Recent stderr output of an MCP server, for diagnosing failing tools"""
+        if server_id in self.providers or not self.mcp_service:
+            return []
+        return self.mcp_service.get_server_logs(server_id, limit)
+    
+    def read_result(self, ref: str, offset: int = 0, length: int = 64 * 1024) -> str:
+        """Read part of a large tool result that was spilled to disk"""
+        return result_spool.read(ref, offset, length)
+    
+    async def shutdown(self):
+        """Stop every running MCP server and delete spilled results"""
+        for provider in self.providers.values():
+            await provider.close()
+        if self.mcp_service:
+            await self.mcp_service.stop_all()
+        result_spool.clear()
+    
+    @staticmethod
+    def _is_error(result) -> bool:
+        return isinstance(result, Exception) or (
+            isinstance(result, dict) and ("error" in result or bool(result.get("isError")))
+        )
+    
+    @staticmethod
+    def _format_result(result) -> str:
+        """Flatten an MCP tools/call result into text for the instructor"""
+        if isinstance(result, SpilledResult):
+            return (
+                f"{result.preview}\n... [result too large: {result.size} bytes, "
+                f"full text stored as {result.ref}, read more with {RESULTS_SERVER_ID} read_result]"
+            )
+        if not isinstance(result, dict):
             return result
-        except Exception as e:
-            return f"Tool execution error: {str(e)}"
+        if "error" in result:
+            return f"Tool execution error: {result['error']}"
+        
+        parts = []
+        for item in result.get("content", []):
+            if item.get("type") == "text":
+                parts.append(item.get("text", ""))
+            else:
+                parts.append(f"[{item.get('type', 'unknown')} content]")
+        text = "\n".join(parts)
+        return f"Tool reported an error: {text}" if result.get("isError") else text
 
 class MockMCPService:
     """Mock MCP service for demonstration"""
     def __init__(self):
+        self.configs = {}
         self.servers = {}
     
-    async def start_server(self, server_id: str, config: Dict) -> bool:
+    def register_server(self, server_id: str, config: Dict):
+        self.configs[server_id] = config
         self.servers[server_id] = {
             'config': config,
             'status': 'running'
         }
+    
+    async def start_server(self, server_id: str, config: Dict) -> bool:
+        self.register_server(server_id, config)
         return True
     
+    async def warm_up(self, server_ids: List[str] = None) -> Dict[str, bool]:
+        return {server_id: True for server_id in server_ids or []}
+    
+    def get_startup_report(self, server_id: str) -> Dict:
+        return {"ready": server_id in self.servers, "latency": 0.0, "error": None}
+    
+    def is_running(self, server_id: str) -> bool:
+        return server_id in self.servers
+    
+    def cached_tools(self, server_id: str) -> List[Dict]:
+        return self.get_server_tools(server_id)
+    
+    def get_server_status(self, server_id: str) -> str:
+        return self.servers.get(server_id, {}).get('status', 'unknown')
+    
+    def get_breaker_state(self, server_id: str) -> str:
+        return "closed"
+    
+    def get_server_logs(self, server_id: str, limit: int = None) -> list:
+        return []
+    
+    async def stop_all(self):
+        self.servers = {}
+    
     async def call_tool(self, server_id: str, tool_name: str, arguments: Dict) -> str:
         # Mock tool implementations
         if server_id == "filesystem":
@@ -60,9 +495,26 @@ class MockMCPService:
         
         return f"Mock result for {server_id}.{tool_name} with args {arguments}"
     
+    async def remove_server(self, server_id: str, drain_timeout: float = None):
+        self.configs.pop(server_id, None)
+        self.servers.pop(server_id, None)
+    
+    async def replace_server(self, server_id: str, config: Dict, drain_timeout: float = None) -> bool:
+        self.register_server(server_id, config)
+        return True
+    
+    async def ensure_server(self, server_id: str) -> bool:
+        return server_id in self.servers
+    
+    async def call_tools_batch(self, server_id: str, calls: List[Tuple[str, Dict]]) -> List[str]:
+        return [await self.call_tool(server_id, tool_name, arguments) for tool_name, arguments in calls]
+    
     def get_available_servers(self):
         return list(self.servers.keys())
     
+    async def list_tools(self, server_id: str):
+        return self.get_server_tools(server_id)
+    
     def get_server_tools(self, server_id: str):
         if server_id == "filesystem":
             return [{"name": "read_file"}, {"name": "list_files"}, {"name": "search_files"}]
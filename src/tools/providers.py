@@ -0,0 +1,50 @@
+from typing import Any, Callable, Dict, List
+
+
+class ToolProvider:
+    """Serves the tools of one configured server in-process instead of over MCP.
+
+    Providers return results in the same shape as an MCP ``tools/call``
+    response, so ``MCPToolManager`` formats them exactly like remote results.
+    """
+
+    def __init__(self, server_id: str, config: Dict[str, Any]):
+        self.server_id = server_id
+        self.config = config
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        """Tool definitions in MCP tools/list format"""
+        raise NotImplementedError
+
+    async def call_tool(self, tool_name: str, arguments: Dict) -> Dict[str, Any]:
+        """Run a tool and return an MCP tools/call result"""
+        raise NotImplementedError
+
+    async def warm_up(self):
+        """Prepare expensive state ahead of the first call (servers marked warm)"""
+
+    async def close(self):
+        """Release any resources held by the provider"""
+
+    @staticmethod
+    def text_result(text: str, is_error: bool = False) -> Dict[str, Any]:
+        return {"content": [{"type": "text", "text": text}], "isError": is_error}
+
+
+# Provider types selectable with `provider:` in mcp_config.yaml
+PROVIDER_TYPES: Dict[str, Callable[[str, Dict[str, Any]], ToolProvider]] = {}
+
+
+def register_provider_type(name: str):
+    """Class decorator making a provider available under the given config name"""
+    def decorator(cls):
+        PROVIDER_TYPES[name] = cls
+        return cls
+    return decorator
+
+
+def create_provider(server_id: str, config: Dict[str, Any]) -> ToolProvider:
+    provider_type = config["provider"]
+    if provider_type not in PROVIDER_TYPES:
+        raise ValueError(f"Unknown tool provider '{provider_type}' for server {server_id}")
+    return PROVIDER_TYPES[provider_type](server_id, config)
@@ -0,0 +1,55 @@
+from typing import Any, Dict, List
+
+from providers import ToolProvider, register_provider_type
+from result_spool import result_spool
+
+# Server id the spilled-results tool is always registered under
+RESULTS_SERVER_ID = "results"
+DEFAULT_READ_BYTES = 16 * 1024
+MAX_READ_BYTES = 64 * 1024
+
+
+@register_provider_type("result-spool")
+class ResultSpoolProvider(ToolProvider):
+    """Reads slices of tool results that were too large to return inline"""
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        # Only offered once something was spilled, so it costs no prompt space before then
+        if not result_spool.stats()["results"]:
+            return []
+        return [
+            {
+                "name": "read_result",
+                "description": "Read part of a large tool result stored as result://...",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "ref": {"type": "string", "description": "Reference of the stored result"},
+                        "offset": {"type": "integer", "description": "Byte offset to start reading at"},
+                        "length": {"type": "integer", "description": f"Bytes to read (max {MAX_READ_BYTES})"},
+                    },
+                    "required": ["ref"],
+                },
+            },
+        ]
+
+    async def call_tool(self, tool_name: str, arguments: Dict) -> Dict[str, Any]:
+        if tool_name != "read_result":
+            return self.text_result(f"Unknown tool: {tool_name}", is_error=True)
+        ref = arguments.get("ref", "")
+        if not isinstance(ref, str) or not ref.strip():
+            return self.text_result("Missing 'ref' argument", is_error=True)
+        try:
+            offset = max(0, int(arguments.get("offset", 0)))
+            length = min(max(1, int(arguments.get("length", DEFAULT_READ_BYTES))), MAX_READ_BYTES)
+        except (TypeError, ValueError):
+            return self.text_result("'offset' and 'length' must be integers", is_error=True)
+
+        result = result_spool.get(ref)
+        if result is None:
+            return self.text_result(f"Unknown or expired result reference: {ref}", is_error=True)
+        text = result_spool.read(ref, offset, length)
+        end = min(offset + length, result.size)
+        if end < result.size:
+            text += f"\n... [bytes {offset}-{end} of {result.size}, continue with offset {end}]"
+        return self.text_result(text)
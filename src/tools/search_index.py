@@ -0,0 +1,208 @@
+import fnmatch
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+INDEX_VERSION = 1
+DEFAULT_EXTENSIONS = [
+    ".txt", ".md", ".rst", ".py", ".ipynb", ".tex", ".html", ".csv", ".json", ".yaml", ".yml",
+    ".js", ".ts", ".java", ".c", ".cpp", ".h", ".r", ".sql", ".sh",
+]
+DEFAULT_MAX_FILE_BYTES = 2 * 1024 * 1024
+
+_TOKEN = re.compile(r"[a-z0-9_]{2,}")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class InvertedIndex:
+    """Persistent word index over a directory tree, refreshed incrementally.
+
+    Only files whose mtime or size changed since the last refresh are read
+    again, so keeping the index current costs a directory walk plus one
+    ``stat`` per file. Every file is listed for name lookups; the content of
+    files with a text extension is indexed for word search.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        index_path: Optional[str] = None,
+        extensions: Optional[List[str]] = None,
+        max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+    ):
+        self.root = os.path.realpath(root)
+        self.index_path = index_path
+        self.extensions = {ext.lower() for ext in (extensions or DEFAULT_EXTENSIONS)}
+        self.max_file_bytes = max_file_bytes
+        self.logger = logging.getLogger(__name__)
+
+        # relative path -> {"mtime", "size", "terms": {term: count}}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        # term -> {relative path: count}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.last_refresh: Optional[float] = None
+        self._lock = threading.Lock()
+
+        if index_path and os.path.exists(index_path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable search index {self.index_path}: {e}")
+            return
+        if data.get("version") != INDEX_VERSION or data.get("root") != self.root:
+            return
+
+        with self._lock:
+            self.files = data.get("files", {})
+            self.postings = {}
+            for path, entry in self.files.items():
+                self._add_postings(path, entry["terms"])
+
+    def save(self):
+        if not self.index_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            data = {"version": INDEX_VERSION, "root": self.root, "files": self.files}
+            # Write then rename so a crash never leaves a half-written index
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self) -> Dict[str, int]:
+        """Re-index new and changed files, drop deleted ones, and save if anything changed"""
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        seen = set()
+        index_file = os.path.realpath(self.index_path) if self.index_path else None
+
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+            for name in filenames:
+                full_path = os.path.join(dirpath, name)
+                if full_path == index_file or not self._inside_root(full_path):
+                    continue
+                try:
+                    stat = os.stat(full_path)
+                except OSError:
+                    continue
+
+                path = os.path.relpath(full_path, self.root)
+                seen.add(path)
+                entry = self.files.get(path)
+                if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    stats["unchanged"] += 1
+                    continue
+
+                terms = self._read_terms(full_path, stat.st_size)
+                with self._lock:
+                    if entry:
+                        self._remove_postings(path, entry["terms"])
+                    self.files[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "terms": terms}
+                    self._add_postings(path, terms)
+                stats["updated" if entry else "added"] += 1
+
+        for path in [path for path in self.files if path not in seen]:
+            with self._lock:
+                self._remove_postings(path, self.files.pop(path)["terms"])
+            stats["removed"] += 1
+
+        self.last_refresh = time.monotonic()
+        if stats["added"] or stats["updated"] or stats["removed"]:
+            self.save()
+        return stats
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, float]]:
+        """Rank files containing the query words by TF-IDF; all words must match when possible"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            postings = [self.postings.get(term, {}) for term in terms]
+            total_files = max(1, len(self.files))
+            candidates = set.intersection(*[set(p) for p in postings]) if all(postings) else set()
+            if not candidates:
+                candidates = set().union(*[set(p) for p in postings])
+
+            scores = {}
+            for term_postings in postings:
+                if not term_postings:
+                    continue
+                idf = math.log(1 + total_files / len(term_postings))
+                for path in candidates.intersection(term_postings):
+                    scores[path] = scores.get(path, 0.0) + (1 + math.log(term_postings[path])) * idf
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+    def match_names(self, pattern: str, limit: int = 200) -> List[str]:
+        """Find indexed paths whose file name matches a substring or glob"""
+        pattern = pattern.lower()
+        is_glob = any(char in pattern for char in "*?[")
+        with self._lock:
+            paths = sorted(self.files)
+        matches = []
+        for path in paths:
+            name = os.path.basename(path).lower()
+            if fnmatch.fnmatch(name, pattern) if is_glob else pattern in name:
+                matches.append(path)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def snippet(self, path: str, query: str, width: int = 160) -> str:
+        """First line of a file that contains one of the query words"""
+        terms = set(tokenize(query))
+        try:
+            with open(os.path.join(self.root, path), "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    if terms.intersection(tokenize(line)):
+                        return " ".join(line.split())[:width]
+        except OSError:
+            pass
+        return ""
+
+    def _inside_root(self, full_path: str) -> bool:
+        # Symlinks pointing outside the root are neither listed nor read
+        real_path = os.path.realpath(full_path)
+        return real_path.startswith(self.root + os.sep)
+
+    def _read_terms(self, full_path: str, size: int) -> Dict[str, int]:
+        if os.path.splitext(full_path)[1].lower() not in self.extensions or size > self.max_file_bytes:
+            return {}
+        try:
+            with open(full_path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError:
+            return {}
+        counts: Dict[str, int] = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+        return counts
+
+    def _add_postings(self, path: str, terms: Dict[str, int]):
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[path] = count
+
+    def _remove_postings(self, path: str, terms: Dict[str, int]):
+        for term in terms:
+            term_postings = self.postings.get(term)
+            if term_postings is not None:
+                term_postings.pop(path, None)
+                if not term_postings:
+                    del self.postings[term]
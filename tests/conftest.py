@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app's modules import each other by name, as when run with these directories on PYTHONPATH
+for directory in ("services", "tools", "agents", "syllabus", "api"):
+    sys.path.insert(0, os.path.join(ROOT, "src", directory))
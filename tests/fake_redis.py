@@ -0,0 +1,66 @@
+import fnmatch
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from state_store import RedisStateStore
+
+
+class FakeRedis:
+    """In-memory stand-in for the part of the redis-py client that RedisStateStore uses.
+
+    Values come back as bytes and expired keys disappear, as with a real
+    server; ``eval`` only knows the lock release script.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return item[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: Any, px: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return None
+            data = value if isinstance(value, bytes) else str(value).encode()
+            self._data[key] = (data, time.monotonic() + px / 1000 if px else None)
+            return True
+
+    def delete(self, *keys: str) -> int:
+        removed = 0
+        with self._lock:
+            for key in keys:
+                if self._live(key) is not None:
+                    del self._data[key]
+                    removed += 1
+        return removed
+
+    def scan_iter(self, match: str = "*", count: Optional[int] = None) -> Iterator[bytes]:
+        with self._lock:
+            keys = [key for key in list(self._data) if self._live(key) is not None and fnmatch.fnmatchcase(key, match)]
+        return iter(key.encode() for key in keys)
+
+    def eval(self, script: str, numkeys: int, *args: Any) -> int:
+        if script != RedisStateStore.RELEASE_SCRIPT:
+            raise NotImplementedError("FakeRedis only runs the lock release script")
+        key, token = args[0], args[numkeys]
+        with self._lock:
+            if self._live(key) == str(token).encode():
+                del self._data[key]
+                return 1
+            return 0
+
+    def close(self):
+        pass
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT
+from mcp_service import MCPService
+
+STANDIN_SCRIPT = os.path.join(ROOT, "scripts", "mcp_standin_server.py")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.1).close()
+            return
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+class StandinServer:
+    """scripts/mcp_standin_server.py running in a subprocess"""
+
+    def __init__(self, sse: bool = False):
+        self.sse = sse
+        self.http_port = free_port()
+        self.ws_port = free_port()
+        self.process = None
+
+    def start(self):
+        command = [sys.executable, STANDIN_SCRIPT, "--http-port", str(self.http_port), "--ws-port", str(self.ws_port)]
+        if self.sse:
+            command.append("--sse")
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        wait_for_port(self.http_port)
+        wait_for_port(self.ws_port)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(10)
+            self.process = None
+
+    def config(self, transport: str) -> dict:
+        url = f"ws://127.0.0.1:{self.ws_port}" if transport == "websocket" else f"http://127.0.0.1:{self.http_port}/mcp"
+        return {"id": "standin", "name": "Stand-in", "transport": transport, "url": url, "batch": True}
+
+
+def text_of(result: dict) -> str:
+    assert "error" not in result, result
+    return result["content"][0]["text"]
+
+
+@pytest.mark.parametrize(
+    "transport, sse", [("http", False), ("http", True), ("websocket", False)], ids=["http-json", "http-sse", "websocket"]
+)
+def test_standin_server_round_trip(transport, sse):
+    server = StandinServer(sse=sse)
+    server.start()
+
+    async def main():
+        service = MCPService()
+        service.register_server("standin", server.config(transport))
+        try:
+            assert await service.ensure_server("standin")
+            assert service.get_startup_report("standin")["server_info"]["name"] == "edugpt-standin"
+
+            tools = await service.list_tools("standin")
+            assert [tool["name"] for tool in tools] == ["echo", "add", "sleep"]
+
+            assert text_of(await service.call_tool("standin", "add", {"a": 2, "b": 3})) == "5"
+
+            results = await service.call_tools_batch("standin", [
+                ("echo", {"text": "first"}),
+                ("add", {"a": 1, "b": 1}),
+                ("missing", {}),
+            ])
+            assert [text_of(result) for result in results[:2]] == ["first", "2"]
+            assert "Unknown tool" in results[2]["error"]
+            assert "standin" not in service.batch_unsupported
+        finally:
+            await service.stop_all()
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.stop()
+
+
+def test_websocket_reconnects_after_server_restart():
+    server = StandinServer()
+    server.start()
+
+    async def main():
+        service = MCPService(health_check_interval=0.1)
+        service.register_server("standin", server.config("websocket"))
+        try:
+            assert text_of(await service.call_tool("standin", "echo", {"text": "before"})) == "before"
+
+            server.stop()
+            server.start()
+
+            # The health monitor notices the dropped connection and reconnects
+            deadline = time.monotonic() + 10
+            result = await service.call_tool("standin", "echo", {"text": "after"})
+            while "error" in result and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+                result = await service.call_tool("standin", "echo", {"text": "after"})
+            assert text_of(result) == "after"
+        finally:
+            await service.stop_all()
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.stop()
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from fake_redis import FakeRedis
+from state_store import MemoryStateStore, RedisStateStore, SQLiteStateStore
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryStateStore()
+    elif request.param == "sqlite":
+        store = SQLiteStateStore(str(tmp_path / "state.db"))
+    else:
+        store = RedisStateStore(FakeRedis())
+    yield store
+    store.close()
+
+
+def test_get_set_delete(store):
+    assert store.get("session:a") is None
+    store.set("session:a", {"history": ["hi"], "turns": 1})
+    assert store.get("session:a") == {"history": ["hi"], "turns": 1}
+
+    store.set("session:a", {"turns": 2})
+    assert store.get("session:a") == {"turns": 2}
+
+    assert store.delete("session:a")
+    assert not store.delete("session:a")
+    assert store.get("session:a") is None
+
+
+def test_keys_by_prefix(store):
+    store.set("session:a", {})
+    store.set("session:b", {})
+    store.set("syllabus:a", {})
+    # Wildcard characters of the backends are matched literally
+    store.set("tool_list:x", {})
+    store.set("toolXlist:y", {})
+
+    assert sorted(store.keys("session:")) == ["session:a", "session:b"]
+    assert store.keys("tool_list:") == ["tool_list:x"]
+    assert store.keys("missing:") == []
+
+
+def test_ttl_expires_keys(store):
+    store.set("session:short", {"v": 1}, ttl=0.2)
+    store.set("session:long", {"v": 2})
+    assert store.get("session:short") == {"v": 1}
+
+    time.sleep(0.3)
+    assert store.get("session:short") is None
+    assert store.get("session:long") == {"v": 2}
+    assert store.keys("session:") == ["session:long"]
+
+
+def test_lock_is_exclusive_until_released(store):
+    token = store.acquire_lock("session:a")
+    assert token
+    assert store.acquire_lock("session:a") is None
+    # Other names are independent
+    assert store.acquire_lock("session:b")
+
+    store.release_lock("session:a", "someone-else")
+    assert store.acquire_lock("session:a") is None
+
+    store.release_lock("session:a", token)
+    assert store.acquire_lock("session:a")
+
+
+def test_lock_expires_after_ttl(store):
+    assert store.acquire_lock("session:a", ttl=0.2)
+    assert store.acquire_lock("session:a", ttl=0.2) is None
+    time.sleep(0.3)
+    assert store.acquire_lock("session:a", ttl=0.2)
+
+
+def test_lock_has_one_winner_across_threads(store):
+    winners = []
+    start = threading.Barrier(8)
+
+    def contend():
+        start.wait()
+        token = store.acquire_lock("session:a")
+        if token:
+            winners.append(token)
+
+    threads = [threading.Thread(target=contend) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(winners) == 1
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = SQLiteStateStore(path), SQLiteStateStore(path)
+    try:
+        first.set("session:a", {"turns": 1})
+        assert second.get("session:a") == {"turns": 1}
+
+        token = first.acquire_lock("session:a")
+        assert token and second.acquire_lock("session:a") is None
+        first.release_lock("session:a", token)
+        assert second.acquire_lock("session:a")
+    finally:
+        first.close()
+        second.close()